@@ -58,4 +58,7 @@ const arbolSchema = new mongoose.Schema({
   timestamps: true
 });
 
+// Índice para el feed de cambios (exportación con ?desde=)
+arbolSchema.index({ updatedAt: 1 });
+
 module.exports = mongoose.model('Arbol', arbolSchema);
\ No newline at end of file
@@ -56,4 +56,7 @@ const muestraSchema = new mongoose.Schema({
   timestamps: true
 });
 
+// Índice para el feed de cambios (exportación con ?desde=)
+muestraSchema.index({ updatedAt: 1 });
+
 module.exports = mongoose.model('Muestra', muestraSchema);
\ No newline at end of file
@@ -0,0 +1,133 @@
+const express = require('express');
+const router = express.Router();
+const auth = require('../middleware/auth');
+const Arbol = require('../models/Arbol');
+const Muestra = require('../models/Muestra');
+const Conglomerado = require('../models/Conglomerado');
+
+// Clases diamétricas (cm): límite inferior incluido, superior excluido
+const LIMITES_DAP = [-Infinity, 15, 30, 60, Infinity];
+const CLASES_DAP = {
+  '-Infinity': 'pequeño (<15cm)',
+  15: 'mediano (15-30cm)',
+  30: 'grande (30-60cm)',
+  60: 'muy_grande (>=60cm)'
+};
+
+// $group por un campo, de mayor a menor cantidad
+const contarPor = (campo) => [
+  { $match: { [campo]: { $ne: null } } },
+  { $group: { _id: `$${campo}`, cantidad: { $sum: 1 } } },
+  { $sort: { cantidad: -1, _id: 1 } }
+];
+
+// Estadísticas de un campo numérico ($median requiere MongoDB 7.0+)
+const estadisticasDe = (campo) => ({
+  [`${campo}Promedio`]: { $avg: `$${campo}` },
+  [`${campo}Mediana`]: { $median: { input: `$${campo}`, method: 'approximate' } },
+  [`${campo}Minimo`]: { $min: `$${campo}` },
+  [`${campo}Maximo`]: { $max: `$${campo}` },
+  [`${campo}Desviacion`]: { $stdDevSamp: `$${campo}` }
+});
+
+// [{ _id, cantidad }] -> { valor: cantidad }
+const aObjeto = (grupos, etiquetas = {}) => grupos.reduce((objeto, grupo) => {
+  objeto[etiquetas[grupo._id] || grupo._id] = grupo.cantidad;
+  return objeto;
+}, {});
+
+const resumenNumerico = (estadisticas, campo) => ({
+  promedio: estadisticas[`${campo}Promedio`],
+  mediana: estadisticas[`${campo}Mediana`],
+  minimo: estadisticas[`${campo}Minimo`],
+  maximo: estadisticas[`${campo}Maximo`],
+  desviacion_std: estadisticas[`${campo}Desviacion`]
+});
+
+// GET /api/agregados/arboles - Conteos y estadísticas de árboles calculados en MongoDB
+router.get('/arboles', auth, async (req, res) => {
+  try {
+    const [resultado] = await Arbol.aggregate([
+      {
+        $facet: {
+          porEspecie: contarPor('especie'),
+          porCondicion: contarPor('condicion'),
+          porSanitario: contarPor('sanitario'),
+          clasesDap: [
+            { $match: { dap: { $type: 'number' } } },
+            { $bucket: { groupBy: '$dap', boundaries: LIMITES_DAP, output: { cantidad: { $sum: 1 } } } }
+          ],
+          estadisticas: [
+            { $group: { _id: null, total: { $sum: 1 }, ...estadisticasDe('dap'), ...estadisticasDe('altura') } }
+          ]
+        }
+      }
+    ]);
+
+    const estadisticas = resultado.estadisticas[0] || { total: 0 };
+    const clasesDap = Object.values(CLASES_DAP).reduce((objeto, clase) => ({ ...objeto, [clase]: 0 }), {});
+
+    res.json({
+      total: estadisticas.total,
+      porEspecie: aObjeto(resultado.porEspecie),
+      porCondicion: aObjeto(resultado.porCondicion),
+      porSanitario: aObjeto(resultado.porSanitario),
+      clasesDap: { ...clasesDap, ...aObjeto(resultado.clasesDap, CLASES_DAP) },
+      dap: resumenNumerico(estadisticas, 'dap'),
+      altura: resumenNumerico(estadisticas, 'altura')
+    });
+  } catch (error) {
+    console.error(error);
+    res.status(500).json({ message: 'Error del servidor' });
+  }
+});
+
+// GET /api/agregados/muestras - Conteos de muestras por tipo, estado y condición
+router.get('/muestras', auth, async (req, res) => {
+  try {
+    const [resultado] = await Muestra.aggregate([
+      {
+        $facet: {
+          total: [{ $count: 'cantidad' }],
+          porTipo: contarPor('tipo'),
+          porEstado: contarPor('estado'),
+          porCondicion: contarPor('condicion')
+        }
+      }
+    ]);
+
+    res.json({
+      total: resultado.total.length ? resultado.total[0].cantidad : 0,
+      porTipo: aObjeto(resultado.porTipo),
+      porEstado: aObjeto(resultado.porEstado),
+      porCondicion: aObjeto(resultado.porCondicion)
+    });
+  } catch (error) {
+    console.error(error);
+    res.status(500).json({ message: 'Error del servidor' });
+  }
+});
+
+// GET /api/agregados/conglomerados - Conteo de conglomerados por departamento
+router.get('/conglomerados', auth, async (req, res) => {
+  try {
+    const [resultado] = await Conglomerado.aggregate([
+      {
+        $facet: {
+          total: [{ $count: 'cantidad' }],
+          porDepartamento: contarPor('departamento')
+        }
+      }
+    ]);
+
+    res.json({
+      total: resultado.total.length ? resultado.total[0].cantidad : 0,
+      porDepartamento: aObjeto(resultado.porDepartamento)
+    });
+  } catch (error) {
+    console.error(error);
+    res.status(500).json({ message: 'Error del servidor' });
+  }
+});
+
+module.exports = router;
@@ -1,6 +1,7 @@
 const express = require('express');
 const router = express.Router();
 const auth = require('../middleware/auth');
+const exportarNdjson = require('../utils/exportarNdjson');
 const Arbol = require('../models/Arbol');
 const Subparcela = require('../models/Subparcela');
 
@@ -18,6 +19,15 @@ router.get('/', auth, async (req, res) => {
   }
 });
 
+// Campos que se pueden exportar (sin populate)
+const CAMPOS_EXPORTABLES = [
+  'codigoSubparcela', 'codigoArbol', 'numIndividuo', 'especie', 'dap', 'altura',
+  'alturaCom', 'condicion', 'sanitario', 'subparcela', 'createdAt', 'updatedAt'
+];
+
+// GET /api/arboles/export - Exportar árboles como NDJSON (ver utils/exportarNdjson.js)
+router.get('/export', auth, exportarNdjson(Arbol, CAMPOS_EXPORTABLES));
+
 // GET /api/arboles/subparcela/:codigoSub - Obtener árboles por subparcela
 router.get('/subparcela/:codigoSub', auth, async (req, res) => {
   try {
@@ -1,6 +1,7 @@
 const express = require('express');
 const router = express.Router();
 const auth = require('../middleware/auth');
+const exportarNdjson = require('../utils/exportarNdjson');
 const Muestra = require('../models/Muestra');
 const Arbol = require('../models/Arbol');
 
@@ -18,6 +19,15 @@ router.get('/', auth, async (req, res) => {
   }
 });
 
+// Campos que se pueden exportar (sin populate ni imagen)
+const CAMPOS_EXPORTABLES = [
+  'codigo', 'codigoArbol', 'fecha', 'tipo', 'cantidad', 'condicion',
+  'estado', 'arbol', 'createdAt', 'updatedAt'
+];
+
+// GET /api/muestras/export - Exportar muestras como NDJSON (ver utils/exportarNdjson.js)
+router.get('/export', auth, exportarNdjson(Muestra, CAMPOS_EXPORTABLES));
+
 // GET /api/muestras/arbol/:codigoArbol - Obtener muestras por árbol
 router.get('/arbol/:codigoArbol', auth, async (req, res) => {
   try {
@@ -1,6 +1,7 @@
 const express = require('express');
 const router = express.Router();
 const auth = require('../middleware/auth');
+const exportarNdjson = require('../utils/exportarNdjson');
 const Subparcela = require('../models/Subparcela');
 const Conglomerado = require('../models/Conglomerado');
 
@@ -18,6 +19,14 @@ router.get('/', auth, async (req, res) => {
   }
 });
 
+// Campos que se pueden exportar (sin populate)
+const CAMPOS_EXPORTABLES = [
+  'codigoCong', 'numeroSub', 'latitud', 'longitud', 'conglomerado', 'createdAt', 'updatedAt'
+];
+
+// GET /api/subparcelas/export - Exportar subparcelas como NDJSON (ver utils/exportarNdjson.js)
+router.get('/export', auth, exportarNdjson(Subparcela, CAMPOS_EXPORTABLES));
+
 // GET /api/subparcelas/conglomerado/:codigoCong - Obtener subparcelas por conglomerado
 router.get('/conglomerado/:codigoCong', auth, async (req, res) => {
   try {
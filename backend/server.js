@@ -25,6 +25,7 @@ app.use('/api/subparcelas', require('./routes/subparcelas'));
 app.use('/api/arboles', require('./routes/arboles'));
 app.use('/api/muestras', require('./routes/muestras'));
 app.use('/api/usuarios', require('./routes/usuarios'));
+app.use('/api/agregados', require('./routes/agregados'));
 
 // Ruta de prueba
 app.get('/', (req, res) => {
@@ -0,0 +1,64 @@
+const mongoose = require('mongoose');
+const { Transform } = require('stream');
+const { pipeline } = require('stream/promises');
+
+// Crea un handler que exporta una colección como NDJSON (un documento por línea)
+// Query:
+//   campos=a,b,...  proyección (solo campos exportables; _id siempre se incluye; 400 si no queda ninguno)
+//   limit=N y despues=<_id>  paginación por cursor
+//   desde=<fecha ISO>  solo documentos modificados desde esa fecha (updatedAt >= desde)
+const exportarNdjson = (Modelo, camposExportables) => async (req, res) => {
+  try {
+    const campos = req.query.campos
+      ? req.query.campos.split(',').filter(campo => camposExportables.includes(campo))
+      : camposExportables;
+    // Una proyección vacía exportaría todos los campos, también los no exportables
+    if (campos.length === 0) {
+      return res.status(400).json({ message: 'Ningún campo exportable en campos' });
+    }
+    const proyeccion = campos.join(' ');
+
+    const filtro = {};
+    if (req.query.despues) {
+      if (!mongoose.Types.ObjectId.isValid(req.query.despues)) {
+        return res.status(400).json({ message: 'Cursor no válido' });
+      }
+      filtro._id = { $gt: req.query.despues };
+    }
+    if (req.query.desde) {
+      const desde = new Date(req.query.desde);
+      if (isNaN(desde.getTime())) {
+        return res.status(400).json({ message: 'Fecha desde no válida' });
+      }
+      filtro.updatedAt = { $gte: desde };
+    }
+
+    let consulta = Modelo.find(filtro, proyeccion).sort({ _id: 1 }).lean();
+    const limit = parseInt(req.query.limit, 10);
+    if (limit > 0) {
+      consulta = consulta.limit(limit);
+    }
+
+    res.status(200).set('Content-Type', 'application/x-ndjson');
+
+    // pipeline respeta la contrapresión del socket y cierra el cursor si el cliente se desconecta
+    await pipeline(
+      consulta.cursor({ batchSize: 1000 }),
+      new Transform({
+        objectMode: true,
+        transform(documento, encoding, callback) {
+          callback(null, JSON.stringify(documento) + '\n');
+        }
+      }),
+      res
+    );
+  } catch (error) {
+    console.error(error);
+    if (res.headersSent) {
+      return res.destroy(error);
+    }
+    res.status(500).json({ message: 'Error del servidor' });
+  }
+};
+
+module.exports = exportarNdjson;
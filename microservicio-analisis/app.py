@@ -1,17 +1,193 @@
-import datetime
-from flask import Flask, request, jsonify, send_file
+import functools
+import time
+from datetime import datetime
+from flask import Flask, request, jsonify, g, Response, stream_with_context
 from flask_cors import CORS
 from config import Config
 from database import db
-from models import AnalisisReporte
-from services.analisis_service import AnalisisService
-from services.pdf_service import PDFService
+from models import AnalisisReporte, InstantaneaInventario, PERIODOS, escritor
+from services.analisis_service import AnalisisService, COLECCIONES_CACHE, TIPOS_TODO
+from services.cache_service import cache
+from services.espacial import ConsultaEspacial
+from services.exportacion import FORMATOS, FormatoNoDisponible, anticipar, exportar, validar_formato
+from services.filtros import Filtros, FiltroInvalido, leer_fecha
+from services.metricas import metricas, iniciar_perfil, terminar_perfil, LIMITES_BYTES
+from services.pdf_service import PDFService, pdf_cache
+from services.precalculo import almacen, precalculador
+from services.replica import replica
+from services.respuestas import preparar, representaciones
 
 app = Flask(__name__)
 CORS(app)
 
-# Crear tablas al iniciar
-db.create_tables()
+# Indicadores que se leen en cada scrape de /metrics
+metricas.registrar_indicador('oracle_pool_sesiones', 'Sesiones del pool de Oracle de este proceso', db.sesiones)
+metricas.registrar_indicador('cache_operaciones_total', 'Aciertos, fallos y desalojos de las cachés', lambda: [
+    ({'cache': nombre, 'resultado': resultado}, instancia.estadisticas()[resultado])
+    for nombre, instancia in (('instantaneas', cache), ('pdf', pdf_cache), ('http', representaciones))
+    for resultado in ('aciertos', 'fallos', 'desalojos')
+], tipo='counter')
+metricas.registrar_indicador('cache_entradas', 'Entradas en cada caché', lambda: [
+    ({'cache': 'instantaneas'}, cache.estadisticas()['entradas']),
+    ({'cache': 'pdf'}, pdf_cache.estadisticas()['entradas']),
+    ({'cache': 'http'}, representaciones.estadisticas()['entradas'])
+])
+metricas.registrar_indicador('replica_filas', 'Árboles en la versión vigente de la réplica local',
+                              lambda: replica.estadisticas()['filas'])
+metricas.registrar_indicador('reportes_escritor', 'Reportes en cola, escritos, descartados y fallidos', lambda: [
+    ({'estado': estado}, valor) for estado, valor in escritor.estadisticas().items()
+])
+
+@app.before_request
+def iniciar_medicion():
+    g.inicio = time.perf_counter()
+    # Perfil por petición opcional: cabecera "X-Perfil: 1" -> Server-Timing en la respuesta
+    if Config.PERFIL_HABILITADO and request.headers.get('X-Perfil') == '1':
+        g.perfil = iniciar_perfil()
+
+@app.after_request
+def registrar_medicion(response):
+    ruta = request.url_rule.rule if request.url_rule else 'desconocida'
+    if ruta != '/metrics':
+        metricas.observar(
+            'http_peticion_segundos', time.perf_counter() - g.inicio, 'Latencia de las peticiones HTTP',
+            ruta=ruta, metodo=request.method, estado=response.status_code
+        )
+        if response.content_length is not None:
+            metricas.observar('http_respuesta_bytes', response.content_length, 'Tamaño de las respuestas HTTP', LIMITES_BYTES, ruta=ruta)
+    if 'perfil' in g:
+        etapas = terminar_perfil(g.pop('perfil'))
+        total = f'total;dur={(time.perf_counter() - g.inicio) * 1000:.2f}'
+        response.headers['Server-Timing'] = f'{etapas}, {total}' if etapas else total
+    return response
+
+@app.after_request
+def preparar_respuesta(response):
+    """ETag, 304, Cache-Control y compresión (se ejecuta antes de registrar_medicion,
+    así que el tamaño medido es el enviado)"""
+    return preparar(response, request)
+
+def error_interno(e):
+    """Registrar la excepción con su traza y responder 500"""
+    ruta = request.url_rule.rule if request.url_rule else request.path
+    app.logger.exception(f"❌ Error en {request.method} {request.path}")
+    metricas.incrementar('errores_total', 1, 'Excepciones no controladas por ruta', ruta=ruta, tipo=type(e).__name__)
+    return jsonify({'error': str(e)}), 500
+
+def iniciar_servicio():
+    """Iniciar los hilos en segundo plano.
+    
+    Con el servidor de desarrollo se llama al arrancar; con gunicorn, en cada worker
+    (ver gunicorn.conf.py). Las tablas se crean aparte con `python manage.py migrar`,
+    y Oracle se conecta con la primera consulta.
+    """
+    # Recalcular los análisis en segundo plano (PRECALCULO_INTERVALO=0 lo desactiva)
+    precalculador.iniciar()
+    if Config.REPLICA_HABILITADA:
+        replica.iniciar()
+
+def detener_servicio():
+    """Detener los hilos, guardar los reportes pendientes y cerrar el pool de Oracle"""
+    precalculador.detener()
+    replica.detener()
+    escritor.detener()
+    db.cerrar()
+
+def usar_precalculo(filtros):
+    """Leer del almacén de resultados salvo que se pida ?fresh=1 o haya filtros"""
+    return precalculador.activo and filtros.vacio and request.args.get('fresh') != '1'
+
+def obtener_resultado(tipo_reporte, calcular, agrupable=True):
+    """Resultado publicado por el precálculo o, si no hay, calculado en esta petición.
+    
+    Los filtros y la agrupación se leen de la query (ver services/filtros.py) y se
+    guardan como parámetros del reporte. Devuelve (resultado, calculado_en). Solo
+    los cálculos síncronos se guardan aquí: los del precálculo ya se guardaron al
+    publicarse.
+    """
+    filtros = Filtros.desde_argumentos(request.args)
+    if filtros.agrupar and not agrupable:
+        raise FiltroInvalido('agrupar no está disponible en este reporte')
+    if usar_precalculo(filtros):
+        publicado = almacen.obtener(tipo_reporte)
+        if publicado:
+            return publicado
+    
+    calculado_en = datetime.now().isoformat(timespec='seconds')
+    resultado = calcular(filtros)
+    if resultado:
+        AnalisisReporte.guardar(tipo_reporte, resultado, filtros.parametros())
+    return resultado, calculado_en
+
+def parametros_tendencia():
+    """meses hacia atrás (1-120, 12 por defecto) y periodo (dia, semana o mes) de la query"""
+    try:
+        meses = int(request.args.get('meses', 12))
+    except ValueError:
+        raise FiltroInvalido('meses debe ser un número entero')
+    if not 1 <= meses <= 120:
+        raise FiltroInvalido('meses debe estar entre 1 y 120')
+    periodo = request.args.get('periodo', 'mes')
+    if periodo not in PERIODOS:
+        raise FiltroInvalido(f"periodo debe ser uno de: {', '.join(PERIODOS)}")
+    return meses, periodo
+
+def version_datos(tipo_reporte):
+    """Versión de los datos de un análisis para la petición en curso (None = desconocida)"""
+    try:
+        filtros = Filtros.desde_argumentos(request.args)
+    except FiltroInvalido:
+        return None
+    if usar_precalculo(filtros):
+        tipos = TIPOS_TODO if tipo_reporte == 'todo' else (tipo_reporte,)
+        if all(almacen.obtener(tipo) for tipo in tipos):
+            return ('precalculo', almacen.version)
+    return AnalisisService.version_datos(tipo_reporte, filtros)
+
+def respuesta_pdf(pdf_bytes, nombre):
+    """PDF como descarga adjunta. El cuerpo va en memoria y no en streaming (como con
+    send_file), así que recibe ETag, respuesta condicional y compresión"""
+    respuesta = Response(pdf_bytes, mimetype='application/pdf')
+    respuesta.headers.set('Content-Disposition', 'attachment', filename=nombre)
+    return respuesta
+
+def versionada(tipo_reporte):
+    """Servir la respuesta ya generada mientras no cambie la versión de los datos.
+    
+    La versión se consulta sin calcular nada, así que un cliente que sondea sin
+    cambios en los datos recibe la misma respuesta (o un 304) sin recalcular el
+    análisis ni serializar el JSON. Si la versión no se conoce (instantáneas
+    vencidas) la vista las recarga; si los datos no cambiaron, se sigue sirviendo
+    la representación guardada con su ETag.
+    """
+    def version():
+        try:
+            return version_datos(tipo_reporte)
+        except Exception:
+            # Sin versión no se reutiliza nada: la vista responde (y reporta) el error en JSON
+            app.logger.exception(f"Versión de datos no disponible para {request.path}")
+            return None
+    
+    def decorador(vista):
+        @functools.wraps(vista)
+        def envoltura():
+            consulta = (request.path, tuple(sorted(request.args.items(multi=True))))
+            actual = version()
+            representacion = representaciones.obtener(consulta + (actual,)) if actual is not None else None
+            if representacion is None:
+                respuesta = app.make_response(vista())
+                if respuesta.status_code != 200:
+                    return respuesta
+                if actual is None:
+                    # La vista cargó las instantáneas: ahora la versión se conoce
+                    actual = version()
+                    if actual is None:
+                        return respuesta
+                    representacion = representaciones.obtener(consulta + (actual,))
+                representacion = representacion or representaciones.guardar(consulta + (actual,), respuesta)
+            return representacion.respuesta()
+        return envoltura
+    return decorador
 
 @app.route('/health', methods=['GET'])
 def health():
@@ -20,195 +196,419 @@ def health():
         'status': 'ok',
         'service': 'Microservicio de Análisis',
         'version': '1.0.0',
-        'database': 'Oracle'
+        'database': 'Oracle',
+        # Sin consultar Oracle: el servicio responde aunque la base no esté disponible
+        'oracle_conectado': db.pool is not None
     }), 200
 
+@app.route('/metrics', methods=['GET'])
+def exportar_metricas():
+    """Métricas de este proceso en formato de texto de Prometheus"""
+    return Response(metricas.exportar(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/api/analisis/especies', methods=['GET'])
+@versionada('distribucion_especies')
 def analizar_especies():
     """Analizar distribución de especies"""
     try:
-        resultado = AnalisisService.analizar_distribucion_especies()
-        
-        if resultado:
-            # Guardar en Oracle
-            AnalisisReporte.crear(
-                tipo_reporte='distribucion_especies',
-                titulo='Análisis de Distribución de Especies',
-                descripcion='Análisis estadístico de la distribución de especies forestales',
-                parametros={},
-                resultado=resultado,
-                generado_por='sistema'
-            )
+        resultado, calculado_en = obtener_resultado('distribucion_especies', AnalisisService.analizar_distribucion_especies)
         
         return jsonify({
             'success': True,
-            'data': resultado
+            'data': resultado,
+            'calculado_en': calculado_en
         }), 200
         
+    except FiltroInvalido as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return error_interno(e)
 
 @app.route('/api/analisis/condicion-arboles', methods=['GET'])
+@versionada('condicion_arboles')
 def analizar_condicion():
     """Analizar condición de árboles"""
     try:
-        resultado = AnalisisService.analizar_condicion_arboles()
-        
-        if resultado:
-            AnalisisReporte.crear(
-                tipo_reporte='condicion_arboles',
-                titulo='Análisis de Condición de Árboles',
-                descripcion='Distribución de árboles por condición y estado sanitario',
-                parametros={},
-                resultado=resultado,
-                generado_por='sistema'
-            )
+        resultado, calculado_en = obtener_resultado('condicion_arboles', AnalisisService.analizar_condicion_arboles)
         
         return jsonify({
             'success': True,
-            'data': resultado
+            'data': resultado,
+            'calculado_en': calculado_en
         }), 200
         
+    except FiltroInvalido as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return error_interno(e)
 
 @app.route('/api/analisis/muestras', methods=['GET'])
+@versionada('analisis_muestras')
 def analizar_muestras():
     """Analizar muestras por tipo"""
     try:
-        resultado = AnalisisService.analizar_muestras_por_tipo()
-        
-        if resultado:
-            AnalisisReporte.crear(
-                tipo_reporte='analisis_muestras',
-                titulo='Análisis de Muestras',
-                descripcion='Distribución de muestras por tipo, estado y condición',
-                parametros={},
-                resultado=resultado,
-                generado_por='sistema'
-            )
+        resultado, calculado_en = obtener_resultado('analisis_muestras', AnalisisService.analizar_muestras_por_tipo)
         
         return jsonify({
             'success': True,
-            'data': resultado
+            'data': resultado,
+            'calculado_en': calculado_en
         }), 200
         
+    except FiltroInvalido as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return error_interno(e)
 
 @app.route('/api/analisis/dap-altura', methods=['GET'])
+@versionada('dap_altura')
 def analizar_dap_altura():
     """Análisis estadístico de DAP y altura"""
     try:
-        resultado = AnalisisService.analizar_dap_altura()
-        
-        if resultado:
-            AnalisisReporte.crear(
-                tipo_reporte='dap_altura',
-                titulo='Análisis de DAP y Altura',
-                descripcion='Estadísticas de diámetro a la altura del pecho y altura total',
-                parametros={},
-                resultado=resultado,
-                generado_por='sistema'
-            )
+        resultado, calculado_en = obtener_resultado('dap_altura', AnalisisService.analizar_dap_altura)
         
         return jsonify({
             'success': True,
-            'data': resultado
+            'data': resultado,
+            'calculado_en': calculado_en
         }), 200
         
+    except FiltroInvalido as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return error_interno(e)
 
 @app.route('/api/analisis/resumen-general', methods=['GET'])
+@versionada('resumen_general')
 def resumen_general():
     """Generar resumen general"""
     try:
-        resultado = AnalisisService.generar_resumen_general()
+        resultado, calculado_en = obtener_resultado('resumen_general', AnalisisService.generar_resumen_general)
+        
+        return jsonify({
+            'success': True,
+            'data': resultado,
+            'calculado_en': calculado_en
+        }), 200
+        
+    except FiltroInvalido as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return error_interno(e)
+
+@app.route('/api/analisis/biomasa', methods=['GET'])
+@versionada('biomasa_carbono')
+def analizar_biomasa():
+    """Biomasa aérea y carbono por subparcela, conglomerado y departamento"""
+    try:
+        resultado, calculado_en = obtener_resultado('biomasa_carbono', AnalisisService.analizar_biomasa)
+        
+        return jsonify({
+            'success': True,
+            'data': resultado,
+            'calculado_en': calculado_en
+        }), 200
+        
+    except FiltroInvalido as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return error_interno(e)
+
+@app.route('/api/analisis/todo', methods=['GET'])
+@versionada('todo')
+def analizar_todo():
+    """Todos los análisis en una sola respuesta"""
+    try:
+        filtros = Filtros.desde_argumentos(request.args)
+        publicados = {tipo: almacen.obtener(tipo) for tipo in TIPOS_TODO}
+        
+        if usar_precalculo(filtros) and all(publicados.values()):
+            resultados = {tipo: resultado for tipo, (resultado, _) in publicados.items()}
+            calculado_en = min(calculado for _, calculado in publicados.values())
+        else:
+            calculado_en = datetime.now().isoformat(timespec='seconds')
+            resultados = AnalisisService.analizar_todo(filtros)
+            if resultados:
+                for tipo_reporte, resultado in resultados.items():
+                    if resultado:
+                        AnalisisReporte.guardar(tipo_reporte, resultado, filtros.parametros())
+        
+        return jsonify({
+            'success': True,
+            'data': resultados,
+            'calculado_en': calculado_en
+        }), 200
         
-        if resultado:
-            AnalisisReporte.crear(
-                tipo_reporte='resumen_general',
-                titulo='Resumen General del Inventario',
-                descripcion='Vista general de todos los datos del inventario forestal',
-                parametros={},
-                resultado=resultado,
-                generado_por='sistema'
-            )
+    except FiltroInvalido as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return error_interno(e)
+
+# Consultas espaciales: no se guardan como reportes (cada movimiento del mapa es una consulta)
+@app.route('/api/espacial/parcelas', methods=['GET'])
+def parcelas_espaciales():
+    """Conglomerados y subparcelas en un rectángulo (bbox) o en un radio (lat, lon, radio_km)"""
+    try:
+        consulta = ConsultaEspacial.desde_argumentos(request.args)
+        calculado_en = datetime.now().isoformat(timespec='seconds')
         
         return jsonify({
             'success': True,
-            'data': resultado
+            'data': AnalisisService.parcelas_en(consulta),
+            'calculado_en': calculado_en
         }), 200
         
+    except FiltroInvalido as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return error_interno(e)
+
+@app.route('/api/espacial/celdas', methods=['GET'])
+def celdas_espaciales():
+    """Mapa de calor por celdas: árboles, densidad, riqueza de especies y DAP medio"""
+    try:
+        consulta = ConsultaEspacial.desde_argumentos(request.args)
+        calculado_en = datetime.now().isoformat(timespec='seconds')
+        
+        return jsonify({
+            'success': True,
+            'data': AnalisisService.celdas_espaciales(consulta),
+            'calculado_en': calculado_en
+        }), 200
+        
+    except FiltroInvalido as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return error_interno(e)
 
 @app.route('/api/reportes/historial', methods=['GET'])
 def obtener_historial():
-    """Obtener historial de reportes generados"""
+    """Obtener historial de reportes generados (metadatos, paginado por cursor)"""
     try:
         tipo = request.args.get('tipo')
-        limit = int(request.args.get('limit', 50))
+        limit = max(1, min(int(request.args.get('limit', 50)), 500))
+        cursor = request.args.get('cursor')
         
-        if tipo:
-            reportes = AnalisisReporte.obtener_por_tipo(tipo, limit)
-        else:
-            reportes = AnalisisReporte.obtener_todos(limit)
+        reportes, siguiente = AnalisisReporte.listar(tipo, limit, cursor)
         
         return jsonify({
             'success': True,
             'total': len(reportes),
-            'reportes': reportes
+            'reportes': reportes,
+            'siguiente': siguiente
         }), 200
         
+    except ValueError:
+        return jsonify({'error': 'Parámetros de paginación no válidos'}), 400
+    except Exception as e:
+        return error_interno(e)
+
+@app.route('/api/reportes/exportar', methods=['GET'])
+def exportar_reportes():
+    """Exportar reportes completos (NDJSON, CSV o Parquet) en streaming.
+    
+    Query: formato, tipo, desde/hasta (fecha de creación) y resultado=0 para
+    exportar solo metadatos y parámetros. Las filas se leen de Oracle por lotes y
+    los CLOB por trozos, así que la memoria no crece con el tamaño de la exportación.
+    """
+    try:
+        formato = request.args.get('formato', 'ndjson')
+        validar_formato(formato)
+        desde, hasta = (
+            leer_fecha(request.args[nombre], nombre) if request.args.get(nombre) else None
+            for nombre in ('desde', 'hasta')
+        )
+        reportes = AnalisisReporte.iterar_exportacion(
+            request.args.get('tipo'), desde, hasta, con_resultado=request.args.get('resultado') != '0'
+        )
+        
+        bloques = anticipar(exportar(reportes, formato))
+        nombre = f'reportes_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{formato}'
+        return Response(
+            stream_with_context(bloques),
+            mimetype=FORMATOS[formato],
+            headers={'Content-Disposition': f'attachment; filename={nombre}'}
+        )
+        
+    except (FormatoNoDisponible, FiltroInvalido) as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return error_interno(e)
+
+@app.route('/api/reportes/<int:reporte_id>', methods=['GET'])
+def obtener_reporte(reporte_id):
+    """Obtener un reporte con su resultado completo"""
+    try:
+        reporte = AnalisisReporte.obtener_por_id(reporte_id)
+        
+        if not reporte:
+            return jsonify({'error': 'Reporte no encontrado'}), 404
+        
+        return jsonify({
+            'success': True,
+            'reporte': reporte
+        }), 200
+        
+    except Exception as e:
+        return error_interno(e)
+
+@app.route('/api/cache/invalidar', methods=['POST'])
+def invalidar_cache():
+    """Invalidar la caché de instantáneas del backend (una colección o todas)"""
+    try:
+        coleccion = request.args.get('coleccion')
+        
+        if coleccion and coleccion not in COLECCIONES_CACHE:
+            return jsonify({'error': f'Colección desconocida: {coleccion}'}), 400
+        
+        eliminadas = cache.invalidar(coleccion)
+        respuesta = {
+            'success': True,
+            'invalidadas': eliminadas,
+            'cache': cache.estadisticas()
+        }
+        
+        # La réplica de árboles no pasa por la caché: se le aplican los cambios pendientes
+        if Config.REPLICA_HABILITADA and coleccion in (None, 'arboles'):
+            replica.refrescar()
+            respuesta['replica'] = replica.estadisticas()
+        
+        return jsonify(respuesta), 200
+        
+    except Exception as e:
+        return error_interno(e)
+
+@app.route('/api/reportes/compactar', methods=['POST'])
+def compactar_reportes():
+    """Aplicar la retención al historial y borrar resultados sin referencias"""
+    try:
+        dias = request.args.get('dias', type=int)
+        resultado = AnalisisReporte.compactar(dias)
+        
+        return jsonify({
+            'success': True,
+            **resultado
+        }), 200
+        
+    except Exception as e:
+        return error_interno(e)
+
+@app.route('/api/tendencias/instantanea', methods=['POST'])
+def tomar_instantanea():
+    """Guardar ahora una instantánea del inventario (además de las del precálculo)"""
+    try:
+        resultados = AnalisisService.analizar_todo()
+        if not resultados:
+            return jsonify({'error': 'No hay datos disponibles'}), 404
+        
+        tomada_en = datetime.now().replace(microsecond=0)
+        if not InstantaneaInventario.guardar(resultados, tomada_en):
+            return jsonify({'error': 'Ya existe una instantánea con esa fecha'}), 409
+        
+        return jsonify({
+            'success': True,
+            'tomada_en': tomada_en.isoformat()
+        }), 201
+        
+    except Exception as e:
+        return error_interno(e)
+
+@app.route('/api/tendencias/resumen', methods=['GET'])
+def tendencia_resumen():
+    """Totales y deriva de DAP y altura por período (?meses=12&periodo=mes)"""
+    try:
+        meses, periodo = parametros_tendencia()
+        serie = InstantaneaInventario.tendencia_resumen(meses, periodo)
+        
+        return jsonify({
+            'success': True,
+            'periodo': periodo,
+            'serie': serie
+        }), 200
+        
+    except FiltroInvalido as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return error_interno(e)
+
+@app.route('/api/tendencias/especies', methods=['GET'])
+def tendencia_especies():
+    """Árboles por especie en cada período (?especie=a,b para limitar las especies)"""
+    try:
+        meses, periodo = parametros_tendencia()
+        especies = Filtros.desde_argumentos(request.args).especie
+        serie = InstantaneaInventario.tendencia_especies(meses, periodo, especies)
+        
+        return jsonify({
+            'success': True,
+            'periodo': periodo,
+            'serie': serie
+        }), 200
+        
+    except FiltroInvalido as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return error_interno(e)
+
+@app.route('/api/tendencias/clases-dap', methods=['GET'])
+def tendencia_clases_dap():
+    """Árboles por clase diamétrica en cada período"""
+    try:
+        meses, periodo = parametros_tendencia()
+        serie = InstantaneaInventario.tendencia_clases_dap(meses, periodo)
+        
+        return jsonify({
+            'success': True,
+            'periodo': periodo,
+            'serie': serie
+        }), 200
+        
+    except FiltroInvalido as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return error_interno(e)
 
 @app.route('/api/reportes/pdf/especies', methods=['GET'])
+@versionada('distribucion_especies')
 def generar_pdf_especies():
     """Generar PDF de reporte de especies"""
     try:
-        datos = AnalisisService.analizar_distribucion_especies()
+        datos, calculado_en = obtener_resultado('distribucion_especies', AnalisisService.analizar_distribucion_especies, agrupable=False)
         
         if not datos:
             return jsonify({'error': 'No hay datos disponibles'}), 404
         
-        pdf_buffer = PDFService.generar_reporte_especies(datos)
+        pdf_bytes = PDFService.obtener_pdf('especies', datos, calculado_en)
         
-        return send_file(
-            pdf_buffer,
-            mimetype='application/pdf',
-            as_attachment=True,
-            download_name=f'reporte_especies_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
-        )
+        return respuesta_pdf(pdf_bytes, f'reporte_especies_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf')
         
+    except FiltroInvalido as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return error_interno(e)
 
 @app.route('/api/reportes/pdf/general', methods=['GET'])
+@versionada('resumen_general')
 def generar_pdf_general():
     """Generar PDF de resumen general"""
     try:
-        from datetime import datetime
-        datos = AnalisisService.generar_resumen_general()
+        datos, calculado_en = obtener_resultado('resumen_general', AnalisisService.generar_resumen_general, agrupable=False)
         
         if not datos:
             return jsonify({'error': 'No hay datos disponibles'}), 404
         
-        pdf_buffer = PDFService.generar_reporte_general(datos)
+        pdf_bytes = PDFService.obtener_pdf('general', datos, calculado_en)
         
-        return send_file(
-            pdf_buffer,
-            mimetype='application/pdf',
-            as_attachment=True,
-            download_name=f'resumen_general_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
-        )
+        return respuesta_pdf(pdf_bytes, f'resumen_general_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf')
         
+    except FiltroInvalido as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return error_interno(e)
 
 if __name__ == '__main__':
+    # Servidor de desarrollo; en producción: gunicorn -c gunicorn.conf.py wsgi:app
+    iniciar_servicio()
     print(f"🚀 Microservicio de Análisis iniciando en puerto {Config.FLASK_PORT}")
     print(f"📊 Conectado a Oracle Database")
     app.run(host='0.0.0.0', port=Config.FLASK_PORT, debug=True)
\ No newline at end of file
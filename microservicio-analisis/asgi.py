@@ -0,0 +1,43 @@
+"""Punto de entrada ASGI (modo asíncrono): uvicorn asgi:app --host 0.0.0.0 --port 5001
+
+Las rutas son las mismas de app.py. El event loop atiende las conexiones y
+descarga del backend con httpx (services/precarga.py) las colecciones que va a
+leer cada petición, de modo que cientos de peticiones pueden esperar al backend
+sin ocupar hilos. Después la vista Flask corre en un pool de ASGI_HILOS hilos,
+ocupado solo mientras calcula (pandas, reportlab) o consulta Oracle.
+
+Un proceso por núcleo, como con gunicorn: uvicorn asgi:app --workers N
+"""
+from urllib.parse import parse_qsl
+from a2wsgi import WSGIMiddleware
+from werkzeug.datastructures import MultiDict
+from app import app as aplicacion_flask, detener_servicio, iniciar_servicio
+from config import Config
+from services.backend_asincrono import backend_asincrono
+from services.precarga import precargar
+
+_vistas = WSGIMiddleware(aplicacion_flask, workers=Config.ASGI_HILOS)
+
+
+async def _ciclo_de_vida(receive, send):
+    """Arranque y apagado del proceso (mensajes lifespan del servidor ASGI)"""
+    while True:
+        mensaje = await receive()
+        if mensaje['type'] == 'lifespan.startup':
+            await backend_asincrono.abrir()
+            iniciar_servicio()
+            await send({'type': 'lifespan.startup.complete'})
+        elif mensaje['type'] == 'lifespan.shutdown':
+            await backend_asincrono.cerrar()
+            detener_servicio()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _ciclo_de_vida(receive, send)
+    if scope['type'] == 'http':
+        argumentos = MultiDict(parse_qsl(scope['query_string'].decode(), keep_blank_values=True))
+        await precargar(scope['path'], argumentos)
+    await _vistas(scope, receive, send)
@@ -0,0 +1,99 @@
+"""Benchmark de arranque en frío: tiempo hasta que /health responde 200.
+
+Arranca el servicio N veces en un proceso nuevo (sin cachés calientes en memoria)
+apuntando Oracle a un DSN inalcanzable, para comprobar que /health no depende de
+la base de datos. Mide también el tiempo de `import wsgi` por separado.
+
+    python benchmarks/arranque.py --repeticiones 5 --limite 1.0
+
+Sale con código 1 si la mediana supera el límite (segundos).
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVIDOR = """
+import sys, time
+inicio = time.perf_counter()
+import wsgi
+print(f"import {time.perf_counter() - inicio:.4f}", flush=True)
+from werkzeug.serving import make_server
+make_server('127.0.0.1', int(sys.argv[1]), wsgi.app, threaded=True).serve_forever()
+"""
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def medir_arranque(timeout):
+    puerto = puerto_libre()
+    entorno = dict(
+        os.environ,
+        # Oracle inalcanzable: el servicio no debe intentar conectarse para /health
+        ORACLE_DSN='127.0.0.1:9/NOEXISTE',
+        PRECALCULO_INTERVALO='0'
+    )
+    inicio = time.perf_counter()
+    proceso = subprocess.Popen(
+        [sys.executable, '-c', SERVIDOR, str(puerto)],
+        cwd=RAIZ, env=entorno, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+    )
+    try:
+        while time.perf_counter() - inicio < timeout:
+            if proceso.poll() is not None:
+                raise RuntimeError(f"el servicio terminó con código {proceso.returncode}")
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{puerto}/health', timeout=1) as respuesta:
+                    if respuesta.status == 200:
+                        total = time.perf_counter() - inicio
+                        importacion = float(proceso.stdout.readline().split()[1])
+                        return total, importacion
+            except OSError:
+                time.sleep(0.01)
+        raise TimeoutError(f"/health no respondió en {timeout} s")
+    finally:
+        proceso.terminate()
+        proceso.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--limite', type=float, default=1.0, help='mediana máxima aceptada (s)')
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--json', action='store_true', help='imprimir el resultado como JSON')
+    args = parser.parse_args()
+
+    mediciones = [medir_arranque(args.timeout) for _ in range(args.repeticiones)]
+    totales = [total for total, _ in mediciones]
+    importaciones = [importacion for _, importacion in mediciones]
+    resultado = {
+        'repeticiones': args.repeticiones,
+        'health_mediana_s': round(statistics.median(totales), 4),
+        'health_max_s': round(max(totales), 4),
+        'import_mediana_s': round(statistics.median(importaciones), 4),
+        'limite_s': args.limite
+    }
+
+    if args.json:
+        print(json.dumps(resultado))
+    else:
+        print(f"/health en frío: mediana {resultado['health_mediana_s']:.3f} s, máximo {resultado['health_max_s']:.3f} s")
+        print(f"import wsgi:     mediana {resultado['import_mediana_s']:.3f} s (límite {args.limite:.3f} s)")
+
+    return 0 if resultado['health_mediana_s'] <= args.limite else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,169 @@
+"""Backend simulado para los benchmarks: sirve datos sintéticos con las mismas rutas
+que usa el microservicio del backend Node (colecciones completas con populate,
+exportación NDJSON con campos/despues/limit/desde y agregados de /api/agregados/*).
+
+    python benchmarks/backend_simulado.py --arboles 100000 --puerto 5999
+
+Las respuestas se serializan una vez por consulta y se guardan, para que el
+tiempo medido sea el del microservicio y no el de este proceso.
+"""
+import argparse
+import json
+import threading
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+from datos_sinteticos import (
+    DatosSinteticos, ESPECIES, CONDICIONES, SANITARIOS, TIPOS_MUESTRA,
+    CONDICIONES_MUESTRA, ESTADOS_MUESTRA, DEPARTAMENTOS
+)
+
+LIMITES_DAP = [15, 30, 60]
+CLASES_DAP = ['pequeño (<15cm)', 'mediano (15-30cm)', 'grande (30-60cm)', 'muy_grande (>=60cm)']
+
+
+def _conteos(codigos, etiquetas):
+    conteos = np.bincount(codigos, minlength=len(etiquetas))
+    orden = sorted(range(len(etiquetas)), key=lambda i: (-conteos[i], etiquetas[i]))
+    return {etiquetas[i]: int(conteos[i]) for i in orden if conteos[i]}
+
+
+def _resumen(valores):
+    return {
+        'promedio': float(valores.mean()),
+        'mediana': float(np.median(valores)),
+        'minimo': float(valores.min()),
+        'maximo': float(valores.max()),
+        'desviacion_std': float(valores.std(ddof=1))
+    }
+
+
+class BackendSimulado:
+    def __init__(self, datos):
+        self.datos = datos
+        self._respuestas = {}
+        self._lock = threading.Lock()
+
+    def responder(self, ruta, consulta):
+        """(tipo de contenido, cuerpo) de una petición, o None si la ruta no existe"""
+        clave = (ruta, tuple(sorted((k, tuple(v)) for k, v in consulta.items())))
+        with self._lock:
+            if clave not in self._respuestas:
+                self._respuestas[clave] = self._generar(ruta, consulta)
+            return self._respuestas[clave]
+
+    def _generar(self, ruta, consulta):
+        partes = ruta.strip('/').split('/')
+        if len(partes) == 2 and partes[1] in ('arboles', 'muestras', 'conglomerados'):
+            # Como las rutas del backend: las muestras traen el árbol poblado, que es
+            # donde el microservicio evalúa los filtros de especie y ubicación
+            total, _ = self.datos.documentos(partes[1])
+            cuerpo = json.dumps([self.datos.poblado(partes[1], i) for i in range(total)]).encode()
+            return 'application/json', cuerpo
+        if len(partes) == 3 and partes[2] == 'export' and partes[1] in ('arboles', 'subparcelas', 'muestras'):
+            return 'application/x-ndjson', self._exportar(partes[1], consulta)
+        if len(partes) == 3 and partes[1] == 'agregados':
+            agregados = {
+                'arboles': self._agregados_arboles,
+                'muestras': self._agregados_muestras,
+                'conglomerados': self._agregados_conglomerados
+            }.get(partes[2])
+            if agregados:
+                return 'application/json', json.dumps(agregados()).encode()
+        return None
+
+    def _exportar(self, coleccion, consulta):
+        total, documento = self.datos.documentos(coleccion)
+        indices = np.arange(total)
+        if 'desde' in consulta and self.datos.actualizados(coleccion) is not None:
+            desde = datetime.fromisoformat(consulta['desde'][0].replace('Z', '+00:00'))
+            indices = indices[self.datos.actualizados(coleccion) >= int(desde.timestamp() * 1000)]
+        if 'despues' in consulta:
+            # _id = prefijo de colección (2 hex) + índice
+            indices = indices[indices > int(consulta['despues'][0][2:], 16)]
+        if 'limit' in consulta:
+            indices = indices[:int(consulta['limit'][0])]
+        campos = [campo for campo in consulta.get('campos', [''])[0].split(',') if campo]
+
+        lineas = []
+        for i in indices:
+            doc = documento(int(i))
+            if campos:
+                doc = {'_id': doc['_id'], **{campo: doc[campo] for campo in campos if campo in doc}}
+            lineas.append(json.dumps(doc))
+        return ('\n'.join(lineas) + '\n').encode() if lineas else b''
+
+    def _agregados_arboles(self):
+        d = self.datos
+        clases = np.bincount(np.digitize(d.dap, LIMITES_DAP), minlength=len(CLASES_DAP))
+        return {
+            'total': d.n_arboles,
+            'porEspecie': _conteos(d.especie, ESPECIES),
+            'porCondicion': _conteos(d.condicion, CONDICIONES),
+            'porSanitario': _conteos(d.sanitario, SANITARIOS),
+            'clasesDap': {clase: int(cantidad) for clase, cantidad in zip(CLASES_DAP, clases)},
+            'dap': _resumen(d.dap),
+            'altura': _resumen(d.altura)
+        }
+
+    def _agregados_muestras(self):
+        d = self.datos
+        return {
+            'total': d.n_muestras,
+            'porTipo': _conteos(d.tipo_muestra, TIPOS_MUESTRA),
+            'porEstado': _conteos(d.estado_muestra, ESTADOS_MUESTRA),
+            'porCondicion': _conteos(d.condicion_muestra, CONDICIONES_MUESTRA)
+        }
+
+    def _agregados_conglomerados(self):
+        d = self.datos
+        return {
+            'total': d.n_conglomerados,
+            'porDepartamento': _conteos(d.departamento, DEPARTAMENTOS)
+        }
+
+
+def crear_servidor(backend, puerto, host='127.0.0.1'):
+    class Manejador(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            respuesta = backend.responder(url.path, parse_qs(url.query))
+            if respuesta is None:
+                cuerpo = json.dumps({'message': 'Ruta no encontrada'}).encode()
+                self.send_response(404)
+                tipo = 'application/json'
+            else:
+                tipo, cuerpo = respuesta
+                self.send_response(200)
+            self.send_header('Content-Type', tipo)
+            self.send_header('Content-Length', str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+    servidor = ThreadingHTTPServer((host, puerto), Manejador)
+    servidor.daemon_threads = True
+    return servidor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--arboles', type=int, default=10000)
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--puerto', type=int, default=5999)
+    args = parser.parse_args()
+
+    datos = DatosSinteticos(args.arboles, args.semilla)
+    servidor = crear_servidor(BackendSimulado(datos), args.puerto)
+    print(f"backend simulado: {datos.n_arboles} árboles, {datos.n_muestras} muestras, "
+          f"{datos.n_conglomerados} conglomerados en http://127.0.0.1:{args.puerto}", flush=True)
+    servidor.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
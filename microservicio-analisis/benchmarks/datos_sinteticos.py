@@ -0,0 +1,200 @@
+"""Generador reproducible de datos sintéticos del IFN para los benchmarks.
+
+Sigue los esquemas de Mongoose del backend: códigos AR-####, SP-####, CG-####
+y MS-####, los enums de condición, tipo y estado, y distribuciones plausibles:
+DAP log-normal desde 10 cm (umbral de medición del IFN), altura por una curva
+altura-diámetro con ruido y especies con frecuencias tipo Zipf.
+
+Los datos quedan en columnas numpy, no en dicts, para que 1M de árboles quepa
+en memoria. Los patrones de 4 dígitos admiten 10.000 códigos distintos, así que
+en tamaños mayores los códigos de árbol y de muestra se repiten (los análisis
+no dependen de que sean únicos).
+"""
+from datetime import datetime, timezone
+import numpy as np
+
+ESPECIES = [
+    'Quercus humboldtii', 'Cedrela odorata', 'Ceiba pentandra', 'Tabebuia rosea',
+    'Anacardium excelsum', 'Cordia alliodora', 'Swietenia macrophylla', 'Guazuma ulmifolia',
+    'Ochroma pyramidale', 'Cecropia peltata', 'Inga edulis', 'Jacaranda copaia',
+    'Hura crepitans', 'Enterolobium cyclocarpum', 'Pseudosamanea guachapele', 'Gmelina arborea',
+    'Weinmannia tomentosa', 'Clusia multiflora', 'Miconia squamulosa', 'Alnus acuminata',
+    'Podocarpus oleifolius', 'Ficus insipida', 'Virola sebifera', 'Brosimum alicastrum'
+]
+CONDICIONES = ['Vivo', 'Muerto en pie', 'Tumbado', 'Cepa']
+PESOS_CONDICION = [0.86, 0.07, 0.04, 0.03]
+SANITARIOS = ['', 'Bueno', 'Regular', 'Malo']
+PESOS_SANITARIO = [0.30, 0.45, 0.18, 0.07]
+
+TIPOS_MUESTRA = ['Hoja', 'Corteza', 'Suelo', 'Semilla', 'Fruto']
+PESOS_TIPO_MUESTRA = [0.35, 0.20, 0.20, 0.15, 0.10]
+CONDICIONES_MUESTRA = ['Fresca', 'Seca', 'Preservada']
+ESTADOS_MUESTRA = ['Pendiente', 'Procesado', 'Rechazado']
+PESOS_ESTADO_MUESTRA = [0.40, 0.55, 0.05]
+
+DEPARTAMENTOS = [
+    'Antioquia', 'Boyacá', 'Caquetá', 'Cundinamarca', 'Chocó', 'Meta',
+    'Nariño', 'Putumayo', 'Santander', 'Tolima', 'Amazonas', 'Guaviare'
+]
+
+# Proporciones respecto al número de árboles
+ARBOLES_POR_SUBPARCELA = 40
+SUBPARCELAS_POR_CONGLOMERADO = 5
+MUESTRAS_POR_ARBOL = 0.1
+
+# Subparcelas: el centro del conglomerado y cuatro a 80 m (grados) al N, E, S y O
+DESPLAZAMIENTOS_SUBPARCELA = [(0, 0), (0.00072, 0), (0, 0.00072), (-0.00072, 0), (0, -0.00072)]
+
+# Fechas de modificación repartidas en el último año antes de esta referencia
+FECHA_REFERENCIA = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+class DatosSinteticos:
+    """Colecciones sintéticas en columnas (arrays numpy y tablas de categorías)"""
+
+    def __init__(self, arboles, semilla=42):
+        rng = np.random.default_rng(semilla)
+        self.n_arboles = arboles
+        self.n_subparcelas = max(arboles // ARBOLES_POR_SUBPARCELA, 1)
+        self.n_conglomerados = max(self.n_subparcelas // SUBPARCELAS_POR_CONGLOMERADO, 1)
+        self.n_muestras = max(int(arboles * MUESTRAS_POR_ARBOL), 1)
+
+        # Árboles
+        zipf = 1.0 / np.arange(1, len(ESPECIES) + 1) ** 1.1
+        self.especie = rng.choice(len(ESPECIES), arboles, p=zipf / zipf.sum()).astype(np.int8)
+        self.dap = np.round(10 + rng.lognormal(mean=2.6, sigma=0.75, size=arboles), 1)
+        # Curva altura-diámetro de Chapman-Richards con ruido multiplicativo
+        altura = 1.3 + 32 * (1 - np.exp(-0.035 * self.dap)) ** 1.2
+        self.altura = np.round(np.clip(altura * rng.lognormal(0, 0.15, arboles), 1.5, 60), 1)
+        self.condicion = rng.choice(len(CONDICIONES), arboles, p=PESOS_CONDICION).astype(np.int8)
+        self.sanitario = rng.choice(len(SANITARIOS), arboles, p=PESOS_SANITARIO).astype(np.int8)
+        self.subparcela_arbol = rng.integers(0, self.n_subparcelas, arboles, dtype=np.int32)
+        self.actualizado_arboles = self._fechas(rng, arboles)
+
+        # Muestras
+        n = self.n_muestras
+        self.tipo_muestra = rng.choice(len(TIPOS_MUESTRA), n, p=PESOS_TIPO_MUESTRA).astype(np.int8)
+        self.condicion_muestra = rng.integers(0, len(CONDICIONES_MUESTRA), n, dtype=np.int8)
+        self.estado_muestra = rng.choice(len(ESTADOS_MUESTRA), n, p=PESOS_ESTADO_MUESTRA).astype(np.int8)
+        self.arbol_muestra = rng.integers(0, arboles, n, dtype=np.int64)
+        self.cantidad_muestra = rng.integers(1, 20, n, dtype=np.int16)
+        self.actualizado_muestras = self._fechas(rng, n)
+
+        # Conglomerados
+        n = self.n_conglomerados
+        self.departamento = rng.integers(0, len(DEPARTAMENTOS), n, dtype=np.int8)
+        self.latitud = np.round(rng.uniform(-4.2, 12.4, n), 6)
+        self.longitud = np.round(rng.uniform(-79.0, -66.9, n), 6)
+
+    @staticmethod
+    def _fechas(rng, n):
+        """Milisegundos epoch de la última modificación de cada documento"""
+        referencia = int(FECHA_REFERENCIA.timestamp() * 1000)
+        return referencia - rng.integers(0, 365 * 24 * 3600 * 1000, n, dtype=np.int64)
+
+    @staticmethod
+    def object_id(coleccion, indice):
+        """_id de 24 hex: prefijo por colección + índice, así el orden de _id es el de inserción"""
+        return f'{coleccion:02x}{indice:022x}'
+
+    @staticmethod
+    def iso(ms):
+        return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.') + f'{ms % 1000:03d}Z'
+
+    def arbol(self, i):
+        subparcela = int(self.subparcela_arbol[i])
+        return {
+            '_id': self.object_id(1, i),
+            'codigoSubparcela': f'SP-{subparcela % 10000:04d}',
+            'codigoArbol': f'AR-{i % 10000:04d}',
+            'numIndividuo': i % ARBOLES_POR_SUBPARCELA + 1,
+            'especie': ESPECIES[self.especie[i]],
+            'dap': float(self.dap[i]),
+            'altura': float(self.altura[i]),
+            'alturaCom': 0,
+            'condicion': CONDICIONES[self.condicion[i]],
+            'sanitario': SANITARIOS[self.sanitario[i]],
+            'observaciones': '',
+            'subparcela': self.object_id(4, subparcela),
+            'usuario': self.object_id(9, 1),
+            'createdAt': self.iso(int(self.actualizado_arboles[i])),
+            'updatedAt': self.iso(int(self.actualizado_arboles[i]))
+        }
+
+    def subparcela(self, i):
+        conglomerado = i // SUBPARCELAS_POR_CONGLOMERADO % self.n_conglomerados
+        delta_lat, delta_lon = DESPLAZAMIENTOS_SUBPARCELA[i % SUBPARCELAS_POR_CONGLOMERADO]
+        return {
+            '_id': self.object_id(4, i),
+            'codigoCong': f'CG-{conglomerado % 10000:04d}',
+            'numeroSub': str(i % SUBPARCELAS_POR_CONGLOMERADO + 1),
+            'latitud': round(float(self.latitud[conglomerado]) + delta_lat, 6),
+            'longitud': round(float(self.longitud[conglomerado]) + delta_lon, 6),
+            'conglomerado': self.object_id(3, conglomerado)
+        }
+
+    def muestra(self, i):
+        arbol = int(self.arbol_muestra[i])
+        actualizado = self.iso(int(self.actualizado_muestras[i]))
+        return {
+            '_id': self.object_id(2, i),
+            'codigo': f'MS-{i % 10000:04d}',
+            'codigoArbol': f'AR-{arbol % 10000:04d}',
+            'fecha': actualizado,
+            'tipo': TIPOS_MUESTRA[self.tipo_muestra[i]],
+            'cantidad': int(self.cantidad_muestra[i]),
+            'condicion': CONDICIONES_MUESTRA[self.condicion_muestra[i]],
+            'imagen': '',
+            'observaciones': '',
+            'estado': ESTADOS_MUESTRA[self.estado_muestra[i]],
+            'arbol': self.object_id(1, arbol),
+            'usuario': self.object_id(9, 1),
+            'updatedAt': actualizado
+        }
+
+    def conglomerado(self, i):
+        return {
+            '_id': self.object_id(3, i),
+            'codigo': f'CG-{i % 10000:04d}',
+            'departamento': DEPARTAMENTOS[self.departamento[i]],
+            'municipio': f'Municipio {i % 97}',
+            'vereda': f'Vereda {i % 389}',
+            'latitud': float(self.latitud[i]),
+            'longitud': float(self.longitud[i]),
+            'datum': 'MAGNA-SIRGAS',
+            'zonaUTM': '18N',
+            'precision': 5,
+            'fecha': self.iso(int(FECHA_REFERENCIA.timestamp() * 1000)),
+            'observaciones': '',
+            'usuario': self.object_id(9, 1)
+        }
+
+    def documentos(self, coleccion):
+        """(total, función índice -> documento) de una colección"""
+        return {
+            'arboles': (self.n_arboles, self.arbol),
+            'subparcelas': (self.n_subparcelas, self.subparcela),
+            'muestras': (self.n_muestras, self.muestra),
+            'conglomerados': (self.n_conglomerados, self.conglomerado)
+        }[coleccion]
+
+    def usuario(self):
+        # populate('usuario', 'nombre correo')
+        return {'_id': self.object_id(9, 1), 'nombre': 'Brigadista IFN', 'correo': 'brigadista@ifn.gov.co'}
+
+    def poblado(self, coleccion, i):
+        """Documento como lo entrega GET /api/<coleccion>, con los mismos populate que la
+        ruta del backend (usuario; subparcela en árboles y árbol en muestras)"""
+        if coleccion == 'arboles':
+            documento = self.arbol(i)
+            documento['subparcela'] = self.subparcela(int(self.subparcela_arbol[i]))
+        elif coleccion == 'muestras':
+            documento = self.muestra(i)
+            documento['arbol'] = self.arbol(int(self.arbol_muestra[i]))
+        else:
+            documento = self.documentos(coleccion)[1](i)
+        documento['usuario'] = self.usuario()
+        return documento
+
+    def actualizados(self, coleccion):
+        return {'arboles': self.actualizado_arboles, 'muestras': self.actualizado_muestras}.get(coleccion)
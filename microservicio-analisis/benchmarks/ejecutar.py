@@ -0,0 +1,309 @@
+"""Benchmark del microservicio de análisis con datos sintéticos del IFN.
+
+Para cada tamaño arranca un backend simulado (benchmarks/backend_simulado.py) y
+el servicio con Oracle en memoria (benchmarks/servidor.py), cada uno en su
+proceso. Después mide cada endpoint de /api/analisis/* y /api/reportes/*:
+
+- primera petición con la caché de instantáneas vacía (descarga + cálculo)
+- N peticiones con C clientes concurrentes: p50, p99, media y peticiones/s
+- RSS máximo del servicio durante el endpoint y pico del proceso (VmHWM)
+
+    python benchmarks/ejecutar.py --tamanos 10000,100000,1000000 --peticiones 50 --concurrencia 4
+    python benchmarks/ejecutar.py --entorno MODO_AGREGACION=incremental --comparar benchmarks/resultados/anterior.json
+
+Los resultados se guardan como JSON en benchmarks/resultados/ para comparar
+ejecuciones. El RSS se lee de /proc (solo Linux).
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+RAIZ = os.path.dirname(DIRECTORIO)
+
+ENDPOINTS = [
+    '/api/analisis/especies',
+    '/api/analisis/condicion-arboles',
+    '/api/analisis/muestras',
+    '/api/analisis/dap-altura',
+    '/api/analisis/resumen-general',
+    '/api/analisis/todo',
+    '/api/reportes/historial',
+    '/api/reportes/{id}',
+    '/api/reportes/pdf/especies',
+    '/api/reportes/pdf/general'
+]
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def peticion(url, metodo='GET', timeout=300):
+    inicio = time.perf_counter()
+    solicitud = urllib.request.Request(url, method=metodo)
+    try:
+        with urllib.request.urlopen(solicitud, timeout=timeout) as respuesta:
+            cuerpo = respuesta.read()
+            estado = respuesta.status
+    except urllib.error.HTTPError as e:
+        cuerpo, estado = e.read(), e.code
+    return time.perf_counter() - inicio, estado, cuerpo
+
+
+def esperar_puerto(puerto, proceso, timeout=600):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError(f"el proceso terminó con código {proceso.returncode}")
+        try:
+            with socket.create_connection(('127.0.0.1', puerto), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(f"el puerto {puerto} no abrió en {timeout} s")
+
+
+def leer_memoria(pid, campo):
+    """VmRSS o VmHWM de un proceso en MB (None fuera de Linux)"""
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for linea in status:
+                if linea.startswith(campo + ':'):
+                    return int(linea.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+class MuestreadorRSS:
+    """Máximo de VmRSS de un proceso mientras está activo"""
+
+    def __init__(self, pid, intervalo=0.02):
+        self.pid = pid
+        self.intervalo = intervalo
+        self.maximo = None
+        self._detener = threading.Event()
+        self._hilo = threading.Thread(target=self._muestrear, daemon=True)
+
+    def _muestrear(self):
+        while not self._detener.is_set():
+            rss = leer_memoria(self.pid, 'VmRSS')
+            if rss is not None:
+                self.maximo = rss if self.maximo is None else max(self.maximo, rss)
+            self._detener.wait(self.intervalo)
+
+    def __enter__(self):
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *args):
+        self._detener.set()
+        self._hilo.join()
+
+
+def percentil(valores, p):
+    """Percentil por rango más cercano"""
+    ordenados = sorted(valores)
+    indice = max(int(round(p / 100 * len(ordenados) + 0.5)) - 1, 0)
+    return ordenados[min(indice, len(ordenados) - 1)]
+
+
+def medir_endpoint(base, ruta, pid, peticiones, concurrencia):
+    url = base + ruta
+    # Primera petición sin instantáneas en caché
+    peticion(base + '/api/cache/invalidar', 'POST')
+    with MuestreadorRSS(pid) as muestreador:
+        primera, estado, cuerpo = peticion(url)
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrencia) as executor:
+            respuestas = list(executor.map(lambda _: peticion(url), range(peticiones)))
+        duracion = time.perf_counter() - inicio
+
+    latencias = [latencia for latencia, estado_respuesta, _ in respuestas if estado_respuesta == 200]
+    resultado = {
+        'estado_primera': estado,
+        'primera_ms': round(primera * 1000, 2),
+        'bytes_respuesta': len(cuerpo),
+        'peticiones': peticiones,
+        'concurrencia': concurrencia,
+        'errores': peticiones - len(latencias),
+        'rss_max_mb': round(muestreador.maximo, 1) if muestreador.maximo else None
+    }
+    if latencias:
+        resultado.update({
+            'p50_ms': round(percentil(latencias, 50) * 1000, 2),
+            'p99_ms': round(percentil(latencias, 99) * 1000, 2),
+            'media_ms': round(sum(latencias) / len(latencias) * 1000, 2),
+            'rendimiento_rps': round(len(latencias) / duracion, 2)
+        })
+    return resultado
+
+
+def primer_reporte(base):
+    """Id de algún reporte ya guardado (el escritor guarda en segundo plano)"""
+    for _ in range(50):
+        _, estado, cuerpo = peticion(base + '/api/reportes/historial?limit=1')
+        if estado == 200:
+            reportes = json.loads(cuerpo)['reportes']
+            if reportes:
+                return reportes[0]['id']
+        time.sleep(0.1)
+    return None
+
+
+def iniciar(argumentos, entorno, marca):
+    """Lanzar un script de benchmarks; su stderr queda en el directorio temporal"""
+    with open(os.path.join(tempfile.gettempdir(), f'benchmark_{marca}.log'), 'w') as log:
+        return subprocess.Popen([sys.executable] + argumentos, cwd=RAIZ, env=entorno,
+                                stdout=subprocess.DEVNULL, stderr=log)
+
+
+def medir_tamano(tamano, args, extra_entorno):
+    puerto_backend, puerto_servicio = puerto_libre(), puerto_libre()
+    entorno = dict(os.environ, PYTHONUNBUFFERED='1')
+
+    inicio = time.perf_counter()
+    backend = iniciar([os.path.join(DIRECTORIO, 'backend_simulado.py'), '--arboles', str(tamano),
+                       '--semilla', str(args.semilla), '--puerto', str(puerto_backend)], entorno, 'backend')
+    servicio = None
+    try:
+        esperar_puerto(puerto_backend, backend)
+        generacion = time.perf_counter() - inicio
+
+        entorno_servicio = dict(entorno, NODE_BACKEND_URL=f'http://127.0.0.1:{puerto_backend}',
+                                PRECALCULO_INTERVALO='0', **extra_entorno)
+        servicio = iniciar([os.path.join(DIRECTORIO, 'servidor.py'), '--puerto', str(puerto_servicio)],
+                           entorno_servicio, 'servicio')
+        esperar_puerto(puerto_servicio, servicio)
+        base = f'http://127.0.0.1:{puerto_servicio}'
+
+        # Las respuestas del backend simulado se serializan una vez: calentarlo antes de medir
+        peticion(base + '/api/analisis/todo')
+
+        endpoints = {}
+        for ruta in ENDPOINTS:
+            if args.endpoints and not any(filtro in ruta for filtro in args.endpoints.split(',')):
+                continue
+            if '{id}' in ruta:
+                reporte_id = primer_reporte(base)
+                if reporte_id is None:
+                    endpoints[ruta] = {'omitido': 'no hay reportes guardados'}
+                    continue
+                ruta_real = ruta.replace('{id}', str(reporte_id))
+            else:
+                ruta_real = ruta
+            endpoints[ruta] = medir_endpoint(base, ruta_real, servicio.pid, args.peticiones, args.concurrencia)
+            print(f"  {tamano:>9} {ruta:<34} {resumen(endpoints[ruta])}", flush=True)
+
+        return {
+            'arboles': tamano,
+            'generacion_backend_s': round(generacion, 2),
+            'rss_pico_servicio_mb': leer_memoria(servicio.pid, 'VmHWM'),
+            'endpoints': endpoints
+        }
+    finally:
+        for proceso in (servicio, backend):
+            if proceso is not None:
+                proceso.terminate()
+                proceso.wait()
+
+
+def resumen(medicion):
+    if 'omitido' in medicion:
+        return f"omitido: {medicion['omitido']}"
+    if 'p50_ms' not in medicion:
+        return f"sin respuestas correctas (estado {medicion['estado_primera']})"
+    return (f"primera {medicion['primera_ms']:>9.1f} ms  p50 {medicion['p50_ms']:>8.1f} ms  "
+            f"p99 {medicion['p99_ms']:>8.1f} ms  {medicion['rendimiento_rps']:>8.1f} req/s  "
+            f"RSS {medicion['rss_max_mb'] or 0:>7.1f} MB")
+
+
+def commit_actual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(actual, anterior):
+    """Imprimir la variación de p50/p99 respecto de otra ejecución"""
+    print(f"\nComparación con {anterior.get('fecha')} ({anterior.get('commit')}):")
+    previos = {str(r['arboles']): r for r in anterior['resultados']}
+    for resultado in actual['resultados']:
+        previo = previos.get(str(resultado['arboles']))
+        if not previo:
+            continue
+        for ruta, medicion in resultado['endpoints'].items():
+            antes = previo['endpoints'].get(ruta, {})
+            if 'p50_ms' not in medicion or 'p50_ms' not in antes:
+                continue
+            variaciones = '  '.join(
+                f"{metrica} {medicion[metrica] / antes[metrica] - 1:+.1%}"
+                for metrica in ('p50_ms', 'p99_ms', 'primera_ms') if antes[metrica]
+            )
+            print(f"  {resultado['arboles']:>9} {ruta:<34} {variaciones}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tamanos', default='10000,100000', help='árboles por ejecución, separados por coma')
+    parser.add_argument('--peticiones', type=int, default=50)
+    parser.add_argument('--concurrencia', type=int, default=4)
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--endpoints', help='medir solo las rutas que contengan alguno de estos textos (coma)')
+    parser.add_argument('--entorno', action='append', default=[], metavar='CLAVE=VALOR',
+                        help='variable de configuración del servicio (repetible)')
+    parser.add_argument('--salida', default=os.path.join(DIRECTORIO, 'resultados'))
+    parser.add_argument('--comparar', help='JSON de una ejecución anterior')
+    args = parser.parse_args()
+
+    extra_entorno = dict(valor.split('=', 1) for valor in args.entorno)
+    tamanos = [int(tamano) for tamano in args.tamanos.split(',')]
+
+    ejecucion = {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit_actual(),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+        'parametros': {
+            'peticiones': args.peticiones,
+            'concurrencia': args.concurrencia,
+            'semilla': args.semilla,
+            'entorno': extra_entorno
+        },
+        'resultados': []
+    }
+    for tamano in tamanos:
+        print(f"▶ {tamano} árboles", flush=True)
+        ejecucion['resultados'].append(medir_tamano(tamano, args, extra_entorno))
+
+    os.makedirs(args.salida, exist_ok=True)
+    archivo = os.path.join(args.salida, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(archivo, 'w') as salida:
+        json.dump(ejecucion, salida, indent=2, ensure_ascii=False)
+    print(f"\nResultados en {archivo}")
+
+    if args.comparar:
+        with open(args.comparar) as anterior:
+            comparar(ejecucion, json.load(anterior))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""Benchmark de memoria de la ingestión con esquema (services/esquemas.py).
+
+Para cada colección compara, en un proceso nuevo por medición, el RSS que queda
+ocupado después de cargar los datos:
+
+- documentos: la lista de documentos JSON completos (con usuario, subparcela o
+  árbol poblados, como los entrega /api/<coleccion>) y pd.DataFrame(documentos)
+  con los tipos inferidos
+- esquema: solo las columnas del esquema, textos como categorías y dap/altura en
+  float32 (árboles desde el export NDJSON; muestras y conglomerados proyectados)
+
+    python benchmarks/memoria.py --arboles 1000000
+
+Los documentos pasan por json.dumps/json.loads para que cada texto sea un objeto
+propio, como al parsear la respuesta del backend. El RSS se lee de /proc (solo Linux).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+RAIZ = os.path.dirname(DIRECTORIO)
+
+COLECCIONES = ('arboles', 'muestras', 'conglomerados')
+VARIANTES = ('documentos', 'esquema')
+
+
+def leer_rss():
+    """VmRSS del proceso actual en MB (None fuera de Linux)"""
+    try:
+        with open('/proc/self/status') as status:
+            for linea in status:
+                if linea.startswith('VmRSS:'):
+                    return int(linea.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def parseados(documentos):
+    for documento in documentos:
+        yield json.loads(json.dumps(documento))
+
+
+def medir(coleccion, variante, arboles):
+    sys.path[:0] = [RAIZ, DIRECTORIO]
+    import pandas as pd
+    from datos_sinteticos import DatosSinteticos
+    from services.esquemas import (ColumnasArboles, ESQUEMA_ARBOLES, ESQUEMA_CONGLOMERADOS, ESQUEMA_MUESTRAS,
+                                   construir_frame, construir_frame_arboles, proyectar)
+
+    datos = DatosSinteticos(arboles)
+    total, _ = datos.documentos(coleccion)
+    rss_inicial = leer_rss()
+    inicio = time.perf_counter()
+
+    if variante == 'documentos':
+        registros = list(parseados(datos.poblado(coleccion, i) for i in range(total)))
+        frame = pd.DataFrame(registros)
+    elif coleccion == 'arboles':
+        # El export ya proyecta los campos: ni usuario ni subparcela poblados
+        exportados = ({campo: documento.get(campo) for campo in ESQUEMA_ARBOLES}
+                      for documento in (datos.arbol(i) for i in range(total)))
+        columnas = ColumnasArboles()
+        for documento in parseados(exportados):
+            columnas.agregar(documento)
+        # Como en analisis_service: se queda solo con las columnas terminadas
+        registros = columnas.columnas()
+        del columnas
+        frame = construir_frame_arboles(registros)
+    else:
+        esquema = ESQUEMA_MUESTRAS if coleccion == 'muestras' else ESQUEMA_CONGLOMERADOS
+        registros = proyectar(parseados(datos.poblado(coleccion, i) for i in range(total)), esquema)
+        frame = construir_frame(registros, esquema)
+
+    segundos = time.perf_counter() - inicio
+    rss = leer_rss()
+    return {
+        'coleccion': coleccion,
+        'variante': variante,
+        'filas': total,
+        'rss_mb': round(rss - rss_inicial, 1) if rss is not None else None,
+        'frame_mb': round(frame.memory_usage(deep=True).sum() / 2 ** 20, 1),
+        'tipos': {columna: str(tipo) for columna, tipo in frame.dtypes.items()},
+        'segundos': round(segundos, 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--arboles', type=int, default=1000000, help='árboles (muestras y conglomerados en proporción)')
+    parser.add_argument('--colecciones', default=','.join(COLECCIONES))
+    parser.add_argument('--salida', help='guardar los resultados en este JSON')
+    parser.add_argument('--medir', nargs=2, metavar=('COLECCION', 'VARIANTE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.medir:
+        print(json.dumps(medir(*args.medir, args.arboles)))
+        return
+
+    resultados = []
+    for coleccion in args.colecciones.split(','):
+        por_variante = {}
+        for variante in VARIANTES:
+            # Un proceso por medición: el RSS no arrastra lo que liberó la anterior
+            salida = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--arboles', str(args.arboles), '--medir', coleccion, variante],
+                cwd=RAIZ, check=True, capture_output=True, text=True
+            ).stdout
+            por_variante[variante] = json.loads(salida.strip().splitlines()[-1])
+            resultados.append(por_variante[variante])
+
+        antes, despues = por_variante['documentos'], por_variante['esquema']
+        print(f"\n{coleccion} ({antes['filas']:,} filas)")
+        print(f"  {'variante':<12}{'RSS MB':>10}{'frame MB':>10}{'s':>8}")
+        for variante in VARIANTES:
+            medicion = por_variante[variante]
+            print(f"  {variante:<12}{medicion['rss_mb'] or 0:>10.1f}{medicion['frame_mb']:>10.1f}{medicion['segundos']:>8.2f}")
+        if antes['rss_mb'] and despues['rss_mb'] is not None:
+            print(f"  reducción del RSS: {100 * (1 - despues['rss_mb'] / antes['rss_mb']):.1f}% "
+                  f"({antes['rss_mb'] / max(despues['rss_mb'], 0.1):.1f}x)")
+        print(f"  tipos con esquema: {despues['tipos']}")
+
+    if args.salida:
+        with open(args.salida, 'w') as archivo:
+            json.dump({'arboles': args.arboles, 'resultados': resultados}, archivo, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,404 @@
+"""Sustituto en memoria de cx_Oracle para los benchmarks.
+
+Implementa la parte de la API que usa el microservicio (SessionPool, cursores,
+execute/executemany, fetchmany, setinputsizes, arraydmlrowcounts, LOB) y las sentencias de
+models.py sobre analisis_reportes y analisis_resultados y sobre las instantáneas de
+tendencias (inventario_instantaneas y sus conteos), evaluadas en Python.
+Las sentencias que no reconoce fallan con DatabaseError en lugar de devolver
+resultados vacíos que falsearían las mediciones.
+
+Se instala antes de importar la aplicación:
+
+    import oracle_memoria; oracle_memoria.instalar()
+"""
+import re
+import sys
+import threading
+from datetime import datetime, timedelta
+
+DB_TYPE_CLOB = 'CLOB'
+DB_TYPE_LONG = 'LONG'
+DB_TYPE_NCLOB = 'NCLOB'
+CLOB = DB_TYPE_CLOB
+NUMBER = 'NUMBER'
+STRING = 'STRING'
+TIMESTAMP = 'TIMESTAMP'
+
+
+class Error(Exception):
+    pass
+
+
+class DatabaseError(Error):
+    pass
+
+
+class IntegrityError(DatabaseError):
+    pass
+
+
+class LOB:
+    """CLOB leído por trozos (read con posición desde 1, como cx_Oracle.LOB)"""
+
+    def __init__(self, texto):
+        self._texto = texto
+
+    def read(self, offset=1, amount=None):
+        inicio = offset - 1
+        return self._texto[inicio:inicio + amount] if amount else self._texto[inicio:]
+
+    def size(self):
+        return len(self._texto)
+
+
+class _Almacen:
+    """Tablas analisis_reportes y analisis_resultados, y las de instantáneas"""
+
+    def __init__(self):
+        self.reportes = []
+        self.resultados = {}
+        self.secuencia = 0
+        # tomada_en -> fila de inventario_instantaneas
+        self.instantaneas = {}
+        # tabla de conteos -> {(tomada_en, valor): cantidad}
+        self.conteos = {'INSTANTANEA_ESPECIES': {}, 'INSTANTANEA_CLASES_DAP': {}}
+        self.lock = threading.Lock()
+
+
+_almacen = _Almacen()
+
+
+def _normalizar(sql):
+    return ' '.join(sql.split()).upper()
+
+
+def _fecha_cursor(texto):
+    return datetime.strptime(texto, '%Y-%m-%dT%H:%M:%S.%f')
+
+
+def _texto(fecha):
+    return fecha.strftime('%Y-%m-%d %H:%M:%S') if fecha else None
+
+
+def _truncar(fecha, formato):
+    """TRUNC(fecha, 'DD' | 'IW' | 'MM')"""
+    dia = datetime(fecha.year, fecha.month, fecha.day)
+    if formato == 'IW':
+        return dia - timedelta(days=dia.weekday())
+    if formato == 'MM':
+        return dia.replace(day=1)
+    return dia
+
+
+def _inicio_ventana(meses):
+    """ADD_MONTHS(TRUNC(SYSDATE, 'MM'), 1 - meses)"""
+    hoy = datetime.now()
+    mes = hoy.year * 12 + hoy.month - 1 - (meses - 1)
+    return datetime(mes // 12, mes % 12 + 1, 1)
+
+
+def _periodos(formato, meses):
+    """Instantáneas de la ventana agrupadas por período, en orden: {periodo: [filas]}"""
+    inicio = _inicio_ventana(meses)
+    periodos = {}
+    for tomada_en in sorted(_almacen.instantaneas):
+        if tomada_en >= inicio:
+            periodos.setdefault(_truncar(tomada_en, formato), []).append(_almacen.instantaneas[tomada_en])
+    return periodos
+
+
+def _diferencia(actual, anterior):
+    return actual - anterior if actual is not None and anterior is not None else None
+
+
+class Cursor:
+    arraysize = 100
+    prefetchrows = 2
+
+    def __init__(self):
+        self.description = None
+        self.rowcount = 0
+        self.outputtypehandler = None
+        self._filas = []
+        self._conteos = []
+
+    def setinputsizes(self, *args, **kwargs):
+        pass
+
+    def var(self, *args, **kwargs):
+        return None
+
+    def close(self):
+        pass
+
+    def _resultado(self, columnas, filas):
+        self.description = [(columna,) for columna in columnas]
+        self._filas = filas
+        self.rowcount = len(filas)
+
+    def fetchall(self):
+        filas, self._filas = self._filas, []
+        return filas
+
+    def fetchone(self):
+        return self._filas.pop(0) if self._filas else None
+
+    def fetchmany(self, cantidad=None):
+        cantidad = cantidad or self.arraysize
+        filas, self._filas = self._filas[:cantidad], self._filas[cantidad:]
+        return filas
+
+    def getarraydmlrowcounts(self):
+        return self._conteos
+
+    def execute(self, sql, params=None):
+        params = params or {}
+        sentencia = _normalizar(sql)
+        with _almacen.lock:
+            if sentencia.startswith('BEGIN'):
+                # DDL de create_tables: las tablas en memoria ya existen
+                self.rowcount = 0
+            elif sentencia.startswith('SELECT ID, TIPO_REPORTE, TITULO'):
+                self._listar(params)
+            elif sentencia.startswith('SELECT R.ID, R.TIPO_REPORTE, R.TITULO, R.GENERADO_POR'):
+                self._exportar(params, 'NVL(R.RESULTADO' in sentencia)
+            elif sentencia.startswith('SELECT R.ID'):
+                self._detalle(params)
+            elif sentencia.startswith('DELETE FROM ANALISIS_REPORTES'):
+                self._retener(params)
+            elif sentencia.startswith('INSERT INTO INVENTARIO_INSTANTANEAS'):
+                fila = {columna.upper(): valor for columna, valor in params.items()}
+                if fila['TOMADA_EN'] in _almacen.instantaneas:
+                    raise IntegrityError('ORA-00001: restricción única violada (PK_INVENTARIO_INSTANTANEAS)')
+                _almacen.instantaneas[fila['TOMADA_EN']] = fila
+                self.rowcount = 1
+            elif sentencia.startswith('WITH PERIODOS AS'):
+                self._tendencia_resumen(params, re.search(r"TRUNC\(TOMADA_EN, '(\w+)'\)", sentencia).group(1))
+            elif sentencia.startswith('WITH ULTIMAS AS'):
+                self._tendencia_conteos(
+                    params,
+                    re.search(r"TRUNC\(TOMADA_EN, '(\w+)'\)", sentencia).group(1),
+                    re.search(r'JOIN (\w+) C ', sentencia).group(1)
+                )
+            elif sentencia.startswith('DELETE FROM ANALISIS_RESULTADOS'):
+                usados = {reporte['RESULTADO_HASH'] for reporte in _almacen.reportes}
+                huerfanos = [huella for huella in _almacen.resultados if huella not in usados]
+                for huella in huerfanos:
+                    del _almacen.resultados[huella]
+                self.rowcount = len(huerfanos)
+            else:
+                raise DatabaseError(f"Sentencia no soportada por el sustituto en memoria: {sentencia[:80]}")
+
+    def executemany(self, sql, filas, arraydmlrowcounts=False, **kwargs):
+        sentencia = _normalizar(sql)
+        filas = list(filas)
+        with _almacen.lock:
+            if sentencia.startswith('MERGE INTO ANALISIS_RESULTADOS'):
+                for fila in filas:
+                    _almacen.resultados.setdefault(fila['hash'], fila['res'])
+                self._conteos = [1] * len(filas)
+            elif sentencia.startswith('UPDATE ANALISIS_REPORTES'):
+                self._conteos = [self._repetir(fila) for fila in filas]
+            elif sentencia.startswith('INSERT INTO ANALISIS_REPORTES'):
+                for fila in filas:
+                    _almacen.secuencia += 1
+                    _almacen.reportes.append({
+                        'ID': _almacen.secuencia,
+                        'TIPO_REPORTE': fila['tipo'],
+                        'TITULO': fila['titulo'],
+                        'DESCRIPCION': fila['desc'],
+                        'PARAMETROS': fila['params'],
+                        'PARAMETROS_HASH': fila['params_hash'],
+                        'RESULTADO_HASH': fila['hash'],
+                        'RESULTADO': None,
+                        'GENERADO_POR': fila['gen'],
+                        'CREATED_AT': fila['creado'],
+                        'ULTIMA_VEZ': fila['creado'],
+                        'REPETICIONES': fila['repeticiones']
+                    })
+                self._conteos = [1] * len(filas)
+            elif sentencia.startswith('INSERT INTO INSTANTANEA_'):
+                tabla = sentencia.split()[2]
+                conteos = _almacen.conteos[tabla]
+                columna = 'especie' if tabla == 'INSTANTANEA_ESPECIES' else 'clase'
+                claves = [(fila['tomada_en'], fila[columna]) for fila in filas]
+                if len(set(claves)) < len(claves) or any(clave in conteos for clave in claves):
+                    raise IntegrityError(f'ORA-00001: restricción única violada (PK_{tabla})')
+                for clave, fila in zip(claves, filas):
+                    conteos[clave] = fila['cantidad']
+                self._conteos = [1] * len(filas)
+            else:
+                raise DatabaseError(f"Sentencia no soportada por el sustituto en memoria: {sentencia[:80]}")
+            self.rowcount = sum(self._conteos)
+
+    def _repetir(self, fila):
+        candidatos = [
+            reporte for reporte in _almacen.reportes
+            if reporte['TIPO_REPORTE'] == fila['tipo'] and reporte['PARAMETROS_HASH'] == fila['params_hash']
+        ]
+        if not candidatos:
+            return 0
+        ultimo = max(candidatos, key=lambda reporte: reporte['ID'])
+        if ultimo['RESULTADO_HASH'] != fila['hash']:
+            return 0
+        ultimo['ULTIMA_VEZ'] = fila['creado']
+        ultimo['REPETICIONES'] += fila['repeticiones']
+        return 1
+
+    def _listar(self, params):
+        reportes = _almacen.reportes
+        if 'tipo' in params:
+            reportes = [reporte for reporte in reportes if reporte['TIPO_REPORTE'] == params['tipo']]
+        if 'cursor_fecha' in params:
+            limite = (_fecha_cursor(params['cursor_fecha']), params['cursor_id'])
+            reportes = [reporte for reporte in reportes if (reporte['CREATED_AT'], reporte['ID']) < limite]
+        reportes = sorted(reportes, key=lambda reporte: (reporte['CREATED_AT'], reporte['ID']), reverse=True)
+        reportes = reportes[:params['limit']]
+        columnas = ['ID', 'TIPO_REPORTE', 'TITULO', 'GENERADO_POR', 'REPETICIONES', 'CREATED_AT', 'ULTIMA_VEZ', 'CURSOR_FECHA']
+        self._resultado(columnas, [(
+            reporte['ID'], reporte['TIPO_REPORTE'], reporte['TITULO'], reporte['GENERADO_POR'],
+            reporte['REPETICIONES'], _texto(reporte['CREATED_AT']), _texto(reporte['ULTIMA_VEZ']),
+            reporte['CREATED_AT'].strftime('%Y-%m-%dT%H:%M:%S.%f')
+        ) for reporte in reportes])
+
+    def _detalle(self, params):
+        columnas = ['ID', 'TIPO_REPORTE', 'TITULO', 'DESCRIPCION', 'PARAMETROS', 'RESULTADO',
+                    'GENERADO_POR', 'REPETICIONES', 'CREATED_AT', 'ULTIMA_VEZ']
+        filas = []
+        for reporte in _almacen.reportes:
+            if reporte['ID'] == params['id']:
+                resultado = reporte['RESULTADO'] or _almacen.resultados.get(reporte['RESULTADO_HASH'])
+                filas.append((
+                    reporte['ID'], reporte['TIPO_REPORTE'], reporte['TITULO'], reporte['DESCRIPCION'],
+                    reporte['PARAMETROS'], resultado, reporte['GENERADO_POR'], reporte['REPETICIONES'],
+                    _texto(reporte['CREATED_AT']), _texto(reporte['ULTIMA_VEZ'])
+                ))
+        self._resultado(columnas, filas)
+
+    def _exportar(self, params, con_resultado):
+        reportes = _almacen.reportes
+        if 'tipo' in params:
+            reportes = [reporte for reporte in reportes if reporte['TIPO_REPORTE'] == params['tipo']]
+        if 'desde' in params:
+            reportes = [reporte for reporte in reportes if reporte['CREATED_AT'] >= params['desde']]
+        if 'hasta' in params:
+            reportes = [reporte for reporte in reportes if reporte['CREATED_AT'] <= params['hasta']]
+        reportes = sorted(reportes, key=lambda reporte: (reporte['CREATED_AT'], reporte['ID']))
+        columnas = ['ID', 'TIPO_REPORTE', 'TITULO', 'GENERADO_POR', 'REPETICIONES', 'CREATED_AT',
+                    'ULTIMA_VEZ', 'PARAMETROS', 'RESULTADO']
+        filas = []
+        for reporte in reportes:
+            resultado = reporte['RESULTADO'] or _almacen.resultados.get(reporte['RESULTADO_HASH'])
+            filas.append((
+                reporte['ID'], reporte['TIPO_REPORTE'], reporte['TITULO'], reporte['GENERADO_POR'],
+                reporte['REPETICIONES'], _texto(reporte['CREATED_AT']), _texto(reporte['ULTIMA_VEZ']),
+                # Sin outputtypehandler los CLOB llegan como LOB
+                LOB(reporte['PARAMETROS']) if reporte['PARAMETROS'] is not None else None,
+                LOB(resultado) if con_resultado and resultado is not None else None
+            ))
+        self._resultado(columnas, filas)
+
+    def _tendencia_resumen(self, params, formato):
+        """Última instantánea de cada período, promedios y extremos, y la deriva con el anterior (LAG)"""
+        columnas = ['PERIODO', 'INSTANTANEAS', 'TOTAL_ARBOLES', 'ESPECIES_UNICAS', 'TOTAL_MUESTRAS',
+                    'TOTAL_CONGLOMERADOS', 'DAP_PROMEDIO', 'DAP_MEDIANA', 'DAP_PROMEDIO_PERIODO', 'DAP_MINIMO',
+                    'DAP_MAXIMO', 'ALTURA_PROMEDIO', 'ALTURA_MEDIANA', 'ALTURA_PROMEDIO_PERIODO', 'ALTURA_MINIMO',
+                    'ALTURA_MAXIMO', 'VARIACION_ARBOLES', 'DERIVA_DAP', 'DERIVA_ALTURA']
+        filas, anterior = [], None
+        for periodo, instantaneas in _periodos(formato, params['meses']).items():
+            ultima = instantaneas[-1]
+            fila = {'PERIODO': periodo.strftime('%Y-%m-%d'), 'INSTANTANEAS': len(instantaneas)}
+            for columna in ('TOTAL_ARBOLES', 'ESPECIES_UNICAS', 'TOTAL_MUESTRAS', 'TOTAL_CONGLOMERADOS'):
+                fila[columna] = ultima.get(columna)
+            for medida in ('DAP', 'ALTURA'):
+                fila[f'{medida}_PROMEDIO'] = ultima.get(f'{medida}_PROMEDIO')
+                fila[f'{medida}_MEDIANA'] = ultima.get(f'{medida}_MEDIANA')
+                # AVG, MIN y MAX ignoran los NULL
+                promedios = [i[f'{medida}_PROMEDIO'] for i in instantaneas if i.get(f'{medida}_PROMEDIO') is not None]
+                minimos = [i[f'{medida}_MINIMO'] for i in instantaneas if i.get(f'{medida}_MINIMO') is not None]
+                maximos = [i[f'{medida}_MAXIMO'] for i in instantaneas if i.get(f'{medida}_MAXIMO') is not None]
+                fila[f'{medida}_PROMEDIO_PERIODO'] = sum(promedios) / len(promedios) if promedios else None
+                fila[f'{medida}_MINIMO'] = min(minimos, default=None)
+                fila[f'{medida}_MAXIMO'] = max(maximos, default=None)
+            anterior = anterior or {}
+            fila['VARIACION_ARBOLES'] = _diferencia(fila['TOTAL_ARBOLES'], anterior.get('TOTAL_ARBOLES'))
+            fila['DERIVA_DAP'] = _diferencia(fila['DAP_PROMEDIO'], anterior.get('DAP_PROMEDIO'))
+            fila['DERIVA_ALTURA'] = _diferencia(fila['ALTURA_PROMEDIO'], anterior.get('ALTURA_PROMEDIO'))
+            filas.append(fila)
+            anterior = fila
+        self._resultado(columnas, [tuple(fila[columna] for columna in columnas) for fila in filas])
+
+    def _tendencia_conteos(self, params, formato, tabla):
+        """Conteos de la última instantánea de cada período con su variación por valor (LAG)"""
+        valores = {valor for nombre, valor in params.items() if re.fullmatch(r'v\d+', nombre)}
+        conteos = _almacen.conteos[tabla]
+        filas, previas = [], {}
+        for periodo, instantaneas in _periodos(formato, params['meses']).items():
+            tomada_en = instantaneas[-1]['TOMADA_EN']
+            del_periodo = [
+                (valor, cantidad) for (fecha, valor), cantidad in conteos.items()
+                if fecha == tomada_en and (not valores or valor in valores)
+            ]
+            for valor, cantidad in sorted(del_periodo, key=lambda conteo: (-conteo[1], conteo[0])):
+                filas.append((periodo.strftime('%Y-%m-%d'), valor, cantidad, _diferencia(cantidad, previas.get(valor))))
+                previas[valor] = cantidad
+        self._resultado(['PERIODO', 'VALOR', 'CANTIDAD', 'VARIACION'], filas)
+
+    def _retener(self, params):
+        limite = datetime.now() - timedelta(days=params['dias'])
+        ultimos = {}
+        for reporte in _almacen.reportes:
+            clave = (reporte['TIPO_REPORTE'], reporte['PARAMETROS_HASH'])
+            ultimos[clave] = max(ultimos.get(clave, 0), reporte['ID'])
+        conservar = set(ultimos.values())
+        antes = len(_almacen.reportes)
+        _almacen.reportes = [
+            reporte for reporte in _almacen.reportes
+            if reporte['ID'] in conservar or (reporte['ULTIMA_VEZ'] or reporte['CREATED_AT']) >= limite
+        ]
+        self.rowcount = antes - len(_almacen.reportes)
+
+
+class Connection:
+    def cursor(self):
+        return Cursor()
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class SessionPool:
+    def __init__(self, min=1, max=1, increment=1, **kwargs):
+        self.min = min
+        self.max = max
+        self.opened = min
+        self.busy = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            self.busy += 1
+            self.opened = max(self.opened, self.busy)
+        return Connection()
+
+    def release(self, connection):
+        with self._lock:
+            self.busy -= 1
+
+    def close(self, force=False):
+        pass
+
+
+
+def instalar():
+    """Registrar este módulo como cx_Oracle (antes de importar la aplicación)"""
+    sys.modules['cx_Oracle'] = sys.modules[__name__]
+
+
+def reiniciar():
+    global _almacen
+    _almacen = _Almacen()
+
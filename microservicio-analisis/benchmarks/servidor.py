@@ -0,0 +1,37 @@
+"""Microservicio de análisis con Oracle en memoria, para los benchmarks.
+
+    python benchmarks/servidor.py --puerto 5101
+
+Usa el mismo wsgi:app que producción, servido por werkzeug con hilos (un solo
+proceso, para que el RSS medido sea el de toda la aplicación).
+"""
+import argparse
+import os
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import oracle_memoria
+
+oracle_memoria.instalar()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--puerto', type=int, default=5101)
+    args = parser.parse_args()
+
+    os.chdir(RAIZ)
+    from werkzeug.serving import make_server
+    from app import app, iniciar_servicio
+    from database import db
+
+    db.create_tables()
+    iniciar_servicio()
+    print(f"servicio en http://127.0.0.1:{args.puerto}", flush=True)
+    make_server('127.0.0.1', args.puerto, app, threaded=True).serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -8,4 +8,109 @@ class Config:
     ORACLE_USER = os.getenv('ORACLE_USER')
     ORACLE_PASSWORD = os.getenv('ORACLE_PASSWORD')
     ORACLE_DSN = os.getenv('ORACLE_DSN')
-    NODE_BACKEND_URL = os.getenv('NODE_BACKEND_URL', 'http://localhost:5000')
\ No newline at end of file
+    # Pool de sesiones de Oracle (uno por proceso)
+    ORACLE_POOL_MIN = int(os.getenv('ORACLE_POOL_MIN', 2))
+    ORACLE_POOL_MAX = int(os.getenv('ORACLE_POOL_MAX', 10))
+    ORACLE_POOL_INCREMENT = int(os.getenv('ORACLE_POOL_INCREMENT', 1))
+    # Lecturas por lotes (exportación): filas por fetchmany y caracteres por lectura de CLOB
+    ORACLE_ARRAYSIZE = int(os.getenv('ORACLE_ARRAYSIZE', 500))
+    ORACLE_LOB_TROZO = int(os.getenv('ORACLE_LOB_TROZO', 65536))
+    NODE_BACKEND_URL = os.getenv('NODE_BACKEND_URL', 'http://localhost:5000')
+    NODE_BACKEND_TOKEN = os.getenv('NODE_BACKEND_TOKEN')
+
+    # Cliente HTTP del backend
+    BACKEND_TIMEOUT_CONEXION = float(os.getenv('BACKEND_TIMEOUT_CONEXION', 3))
+    BACKEND_TIMEOUT_LECTURA = float(os.getenv('BACKEND_TIMEOUT_LECTURA', 30))
+    BACKEND_REINTENTOS = int(os.getenv('BACKEND_REINTENTOS', 2))
+    BACKEND_POOL_MAX = int(os.getenv('BACKEND_POOL_MAX', 10))
+    BACKEND_TAMANO_PAGINA = int(os.getenv('BACKEND_TAMANO_PAGINA', 0))
+
+    # Caché de instantáneas del backend
+    CACHE_TTL = int(os.getenv('CACHE_TTL', 60))
+    CACHE_MAX_ENTRADAS = int(os.getenv('CACHE_MAX_ENTRADAS', 32))
+
+    # Origen de los agregados:
+    #   filas: se descargan los documentos y se agregan aquí (por defecto)
+    #   incremental: agregados mantenidos con el feed de cambios del backend
+    #   mongodb: agregados calculados por MongoDB (/api/agregados/*)
+    MODO_AGREGACION = os.getenv('MODO_AGREGACION', 'filas')
+    AGREGADOS_INTERVALO = int(os.getenv('AGREGADOS_INTERVALO', 10))
+    AGREGADOS_RECONCILIACION = int(os.getenv('AGREGADOS_RECONCILIACION', 3600))
+
+    # Persistencia de reportes en segundo plano
+    REPORTES_COLA_MAX = int(os.getenv('REPORTES_COLA_MAX', 1000))
+    REPORTES_LOTE = int(os.getenv('REPORTES_LOTE', 50))
+    REPORTES_INTERVALO = float(os.getenv('REPORTES_INTERVALO', 2))
+    REPORTES_ESPERA_COLA = float(os.getenv('REPORTES_ESPERA_COLA', 0.5))
+
+    # Retención del historial de reportes (RETENCION_INTERVALO=0 desactiva la compactación automática)
+    RETENCION_DIAS = int(os.getenv('RETENCION_DIAS', 90))
+    RETENCION_INTERVALO = int(os.getenv('RETENCION_INTERVALO', 3600))
+
+    # Renderizado de PDFs (PDF_WORKERS=0 renderiza en el mismo hilo)
+    PDF_WORKERS = int(os.getenv('PDF_WORKERS', 2))
+    PDF_TIMEOUT = float(os.getenv('PDF_TIMEOUT', 60))
+    PDF_CACHE_TTL = int(os.getenv('PDF_CACHE_TTL', 3600))
+    PDF_CACHE_MAX_ENTRADAS = int(os.getenv('PDF_CACHE_MAX_ENTRADAS', 16))
+
+    # Precálculo de análisis en segundo plano (segundos; 0 = desactivado)
+    PRECALCULO_INTERVALO = int(os.getenv('PRECALCULO_INTERVALO', 0))
+    PRECALCULO_PDFS = os.getenv('PRECALCULO_PDFS', 'false').lower() == 'true'
+    # Instantáneas del inventario para tendencias: como mucho una por tramo de
+    # INSTANTANEAS_INTERVALO segundos, guardada por el precálculo (0 = desactivado)
+    INSTANTANEAS_INTERVALO = int(os.getenv('INSTANTANEAS_INTERVALO', 3600))
+
+    # Agregación paralela de árboles (services/paralelo.py): a partir de
+    # PARALELO_MIN_FILAS filas se reparten por subparcela o conglomerado en un pool
+    # de PARALELO_WORKERS procesos con memoria compartida (0 = en el hilo de la petición)
+    PARALELO_WORKERS = int(os.getenv('PARALELO_WORKERS', 0))
+    PARALELO_MIN_FILAS = int(os.getenv('PARALELO_MIN_FILAS', 500000))
+    PARALELO_TIMEOUT = float(os.getenv('PARALELO_TIMEOUT', 120))
+
+    # Servidor de producción (gunicorn.conf.py). Un worker por núcleo: los
+    # análisis son de CPU y cada worker mantiene sus propias cachés en memoria
+    GUNICORN_WORKERS = int(os.getenv('GUNICORN_WORKERS', os.cpu_count() or 1))
+    GUNICORN_THREADS = int(os.getenv('GUNICORN_THREADS', 4))
+    GUNICORN_TIMEOUT = int(os.getenv('GUNICORN_TIMEOUT', 120))
+    GUNICORN_GRACEFUL_TIMEOUT = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+    GUNICORN_KEEPALIVE = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+    # Modo asíncrono (asgi.py): hilos para las vistas Flask, que solo los ocupan
+    # mientras calculan o consultan Oracle (las descargas del backend son asíncronas)
+    ASGI_HILOS = int(os.getenv('ASGI_HILOS', 16))
+
+    # Biomasa y carbono (services/biomasa.py): área de cada subparcela en hectáreas,
+    # densidad de la madera (g/cm³) de las especies sin dato y el parámetro ambiental E
+    # del modelo altura-diámetro de Chave et al. 2014 (0 = sin ajuste regional)
+    BIOMASA_AREA_SUBPARCELA_HA = float(os.getenv('BIOMASA_AREA_SUBPARCELA_HA', 0.0707))
+    BIOMASA_DENSIDAD_DEFECTO = float(os.getenv('BIOMASA_DENSIDAD_DEFECTO', 0.60))
+    BIOMASA_E = float(os.getenv('BIOMASA_E', 0.0))
+
+    # Índice espacial (services/espacial.py): malla de celdas de ESPACIAL_CELDA_GRADOS
+    # grados sobre las coordenadas de subparcelas y conglomerados. Los agregados por
+    # celda se mantienen con el feed de cambios cada ESPACIAL_INTERVALO segundos y se
+    # reconstruyen completos cada ESPACIAL_RECONCILIACION segundos (borrados)
+    ESPACIAL_CELDA_GRADOS = float(os.getenv('ESPACIAL_CELDA_GRADOS', 0.05))
+    ESPACIAL_INTERVALO = int(os.getenv('ESPACIAL_INTERVALO', 10))
+    ESPACIAL_RECONCILIACION = int(os.getenv('ESPACIAL_RECONCILIACION', 3600))
+
+    # Caché HTTP: respuestas por versión de los datos (ETag/304) y compresión gzip/br.
+    # HTTP_MAX_AGE=0 envía Cache-Control: no-cache (el cliente revalida siempre)
+    HTTP_CACHE_MAX_ENTRADAS = int(os.getenv('HTTP_CACHE_MAX_ENTRADAS', 64))
+    HTTP_COMPRESION_MINIMO = int(os.getenv('HTTP_COMPRESION_MINIMO', 1024))
+    HTTP_MAX_AGE = int(os.getenv('HTTP_MAX_AGE', 0))
+
+    # Perfil por petición con la cabecera "X-Perfil: 1" (responde con Server-Timing)
+    PERFIL_HABILITADO = os.getenv('PERFIL_HABILITADO', 'true').lower() == 'true'
+
+    # Réplica local de árboles en columnas (memory mapping compartido entre workers)
+    REPLICA_HABILITADA = os.getenv('REPLICA_HABILITADA', 'false').lower() == 'true'
+    REPLICA_DIR = os.getenv('REPLICA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'replica'))
+    REPLICA_INTERVALO = int(os.getenv('REPLICA_INTERVALO', 30))
+    REPLICA_RECONCILIACION = int(os.getenv('REPLICA_RECONCILIACION', 3600))
+    # Segundos que se conserva una versión reemplazada para los workers que la están abriendo
+    REPLICA_GRACIA = int(os.getenv('REPLICA_GRACIA', 300))
+
+    # Exportación masiva de reportes (/api/reportes/exportar)
+    EXPORTACION_BLOQUE_BYTES = int(os.getenv('EXPORTACION_BLOQUE_BYTES', 64 * 1024))
+    EXPORTACION_PARQUET_FILAS = int(os.getenv('EXPORTACION_PARQUET_FILAS', 500))
@@ -1,10 +1,45 @@
+import os
+import threading
 import cx_Oracle
+from contextlib import contextmanager
 from config import Config
+from services.metricas import cronometro, medir
+
+def clob_como_texto(cursor, name, default_type, size, precision, scale):
+    """Output type handler: leer CLOB como str en el mismo fetch, sin un round-trip por LOB"""
+    if default_type == cx_Oracle.DB_TYPE_CLOB:
+        return cursor.var(cx_Oracle.DB_TYPE_LONG, arraysize=cursor.arraysize)
+
+def trozos_lob(valor, tamano=None):
+    """Contenido de un CLOB por trozos de `tamano` caracteres (un str se entrega entero)"""
+    if valor is None:
+        return
+    if isinstance(valor, str):
+        yield valor
+        return
+    tamano = tamano or Config.ORACLE_LOB_TROZO
+    posicion = 1
+    while True:
+        trozo = valor.read(posicion, tamano)
+        if not trozo:
+            return
+        yield trozo
+        posicion += len(trozo)
+
+# Partición por mes de tomada_en: las consultas de tendencias por rango de fechas
+# solo leen los meses pedidos y la historia vieja se puede borrar por partición
+PARTICION_MENSUAL = """
+    PARTITION BY RANGE (tomada_en) INTERVAL (NUMTOYMINTERVAL(1, 'MONTH'))
+    (PARTITION p_inicial VALUES LESS THAN (TIMESTAMP '2024-01-01 00:00:00'))
+"""
 
 class Database:
     def __init__(self):
+        # El pool se crea con la primera conexión y no al importar: así cada
+        # worker de gunicorn abre sus propias sesiones después del fork
         self.pool = None
-        self.connect()
+        self._pid = None
+        self._lock = threading.Lock()
     
     def connect(self):
         try:
@@ -12,22 +47,58 @@ class Database:
                 user=Config.ORACLE_USER,
                 password=Config.ORACLE_PASSWORD,
                 dsn=Config.ORACLE_DSN,
-                min=2,
-                max=10,
-                increment=1,
+                min=Config.ORACLE_POOL_MIN,
+                max=Config.ORACLE_POOL_MAX,
+                increment=Config.ORACLE_POOL_INCREMENT,
+                threaded=True,
                 encoding="UTF-8"
             )
-            print("✅ Oracle DB conectado correctamente")
+            self._pid = os.getpid()
+            print(f"✅ Oracle DB conectado correctamente (pid {self._pid})")
         except cx_Oracle.Error as e:
             print(f"❌ Error al conectar Oracle: {e}")
             raise
     
+    def reiniciar(self):
+        """Olvidar el pool heredado de otro proceso sin cerrar sus sesiones (son del padre)"""
+        with self._lock:
+            self.pool = None
+            self._pid = None
+    
+    def cerrar(self):
+        """Cerrar el pool de este proceso, si existe"""
+        with self._lock:
+            if self.pool is not None and self._pid == os.getpid():
+                try:
+                    self.pool.close(force=True)
+                except cx_Oracle.Error as e:
+                    print(f"⚠️ Error al cerrar el pool de Oracle: {e}")
+            self.pool = None
+            self._pid = None
+    
     def get_connection(self):
-        return self.pool.acquire()
+        if self.pool is None or self._pid != os.getpid():
+            with self._lock:
+                if self.pool is None or self._pid != os.getpid():
+                    self.connect()
+        # Espera por una sesión libre cuando el pool está al máximo
+        with cronometro('oracle_acquire'):
+            return self.pool.acquire()
+    
+    def sesiones(self):
+        """Sesiones ocupadas, abiertas y máximas del pool de este proceso (para /metrics)"""
+        if self.pool is None or self._pid != os.getpid():
+            return [({'estado': 'ocupadas'}, 0), ({'estado': 'abiertas'}, 0), ({'estado': 'maximo'}, Config.ORACLE_POOL_MAX)]
+        return [
+            ({'estado': 'ocupadas'}, self.pool.busy),
+            ({'estado': 'abiertas'}, self.pool.opened),
+            ({'estado': 'maximo'}, self.pool.max)
+        ]
     
     def release_connection(self, connection):
         self.pool.release(connection)
     
+    @medir('oracle_execute_query')
     def execute_query(self, query, params=None):
         connection = self.get_connection()
         cursor = connection.cursor()
@@ -45,9 +116,31 @@ class Database:
             cursor.close()
             self.release_connection(connection)
     
+    @medir('oracle_execute_many')
+    def execute_many(self, query, filas, clobs=()):
+        """Ejecutar la misma sentencia para varias filas con un solo round-trip y commit"""
+        if not filas:
+            return
+        connection = self.get_connection()
+        cursor = connection.cursor()
+        try:
+            if clobs:
+                # Sin esto executemany infiere VARCHAR2 de la primera fila y falla con textos largos
+                cursor.setinputsizes(**{nombre: cx_Oracle.DB_TYPE_CLOB for nombre in clobs})
+            cursor.executemany(query, filas)
+            connection.commit()
+        except Exception as e:
+            connection.rollback()
+            raise e
+        finally:
+            cursor.close()
+            self.release_connection(connection)
+    
+    @medir('oracle_fetch_all')
     def fetch_all(self, query, params=None):
         connection = self.get_connection()
         cursor = connection.cursor()
+        cursor.outputtypehandler = clob_como_texto
         try:
             if params:
                 cursor.execute(query, params)
@@ -64,9 +157,11 @@ class Database:
             cursor.close()
             self.release_connection(connection)
     
+    @medir('oracle_fetch_one')
     def fetch_one(self, query, params=None):
         connection = self.get_connection()
         cursor = connection.cursor()
+        cursor.outputtypehandler = clob_como_texto
         try:
             if params:
                 cursor.execute(query, params)
@@ -83,11 +178,62 @@ class Database:
             cursor.close()
             self.release_connection(connection)
     
+    def iterar(self, query, params=None, tamano_lote=None):
+        """Recorrer el resultado de una consulta por lotes (fetchmany) sin cargarlo entero.
+        
+        Es un generador: la sesión queda tomada hasta agotarlo o cerrarlo. Los CLOB
+        llegan como LOB, para leerlos por trozos con trozos_lob.
+        """
+        tamano_lote = tamano_lote or Config.ORACLE_ARRAYSIZE
+        connection = self.get_connection()
+        cursor = connection.cursor()
+        # Un round-trip por lote; con prefetchrows el primero llega con el execute
+        cursor.arraysize = tamano_lote
+        cursor.prefetchrows = tamano_lote + 1
+        try:
+            cursor.execute(query, params or {})
+            columns = [col[0] for col in cursor.description]
+            while True:
+                with cronometro('oracle_fetchmany'):
+                    rows = cursor.fetchmany()
+                if not rows:
+                    return
+                for row in rows:
+                    yield dict(zip(columns, row))
+        finally:
+            cursor.close()
+            self.release_connection(connection)
+    
+    def _ddl_idempotente(self, ddl, codigos_ignorados=(-955,)):
+        """Ejecutar DDL ignorando los errores de "ya existe" indicados por SQLCODE"""
+        condicion = ' AND '.join(f'SQLCODE != {codigo}' for codigo in codigos_ignorados)
+        ddl = ddl.replace("'", "''")
+        self.execute_query(f"""
+        BEGIN
+            EXECUTE IMMEDIATE '{ddl}';
+        EXCEPTION
+            WHEN OTHERS THEN
+                IF {condicion} THEN
+                    RAISE;
+                END IF;
+        END;
+        """)
+    
+    def _crear_tabla_mensual(self, ddl):
+        """Crear una tabla particionada por mes de tomada_en (una partición nueva por mes,
+        automática). Sin la opción de particionamiento (ORA-00439) se crea sin particiones."""
+        try:
+            self._ddl_idempotente(ddl + PARTICION_MENSUAL)
+        except cx_Oracle.DatabaseError as e:
+            if getattr(e.args[0], 'code', None) != 439:
+                raise
+            self._ddl_idempotente(ddl)
+    
     def create_tables(self):
         """Crear tablas necesarias para análisis"""
-        create_table_query = """
-        BEGIN
-            EXECUTE IMMEDIATE '
+        # -955: nombre ya usado, -1430: columna ya existe, -1408: columnas ya indexadas
+        ddls = [
+            ("""
                 CREATE TABLE analisis_reportes (
                     id NUMBER GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
                     tipo_reporte VARCHAR2(100) NOT NULL,
@@ -98,20 +244,100 @@ class Database:
                     generado_por VARCHAR2(255),
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
-            ';
-        EXCEPTION
-            WHEN OTHERS THEN
-                IF SQLCODE != -955 THEN
-                    RAISE;
-                END IF;
-        END;
-        """
+            """, (-955,)),
+            # Resultados almacenados una sola vez por contenido (sha256 del JSON)
+            ("""
+                CREATE TABLE analisis_resultados (
+                    hash VARCHAR2(64) PRIMARY KEY,
+                    resultado CLOB,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """, (-955,)),
+            ("""
+                ALTER TABLE analisis_reportes ADD (
+                    resultado_hash VARCHAR2(64),
+                    parametros_hash VARCHAR2(64),
+                    ultima_vez TIMESTAMP,
+                    repeticiones NUMBER DEFAULT 1
+                )
+            """, (-1430,)),
+            ("CREATE INDEX idx_reportes_resultado_hash ON analisis_reportes (resultado_hash)", (-955, -1408)),
+            # Historial ordenado por fecha, con o sin filtro por tipo (paginación por cursor)
+            ("CREATE INDEX idx_reportes_tipo_fecha ON analisis_reportes (tipo_reporte, created_at, id)", (-955, -1408)),
+            ("CREATE INDEX idx_reportes_fecha ON analisis_reportes (created_at, id)", (-955, -1408)),
+            ("CREATE INDEX idx_reportes_tipo_parametros ON analisis_reportes (tipo_reporte, parametros_hash, id)", (-955, -1408))
+        ]
+        # Instantáneas del inventario para las tendencias (ver InstantaneaInventario)
+        tablas_mensuales = [
+            """
+                CREATE TABLE inventario_instantaneas (
+                    tomada_en TIMESTAMP NOT NULL,
+                    total_arboles NUMBER,
+                    especies_unicas NUMBER,
+                    dap_promedio NUMBER,
+                    dap_mediana NUMBER,
+                    dap_minimo NUMBER,
+                    dap_maximo NUMBER,
+                    dap_desviacion NUMBER,
+                    altura_promedio NUMBER,
+                    altura_mediana NUMBER,
+                    altura_minimo NUMBER,
+                    altura_maximo NUMBER,
+                    altura_desviacion NUMBER,
+                    total_muestras NUMBER,
+                    total_conglomerados NUMBER,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    CONSTRAINT pk_inventario_instantaneas PRIMARY KEY (tomada_en)
+                )
+            """,
+            """
+                CREATE TABLE instantanea_especies (
+                    tomada_en TIMESTAMP NOT NULL,
+                    especie VARCHAR2(255) NOT NULL,
+                    cantidad NUMBER NOT NULL,
+                    CONSTRAINT pk_instantanea_especies PRIMARY KEY (tomada_en, especie)
+                )
+            """,
+            """
+                CREATE TABLE instantanea_clases_dap (
+                    tomada_en TIMESTAMP NOT NULL,
+                    clase VARCHAR2(50) NOT NULL,
+                    cantidad NUMBER NOT NULL,
+                    CONSTRAINT pk_instantanea_clases_dap PRIMARY KEY (tomada_en, clase)
+                )
+            """
+        ]
+        indices = [
+            # Serie de una especie sin recorrer las demás
+            ("CREATE INDEX idx_instantanea_especie ON instantanea_especies (especie, tomada_en)", (-955, -1408))
+        ]
         
         try:
-            self.execute_query(create_table_query)
+            for ddl, codigos_ignorados in ddls:
+                self._ddl_idempotente(ddl, codigos_ignorados)
+            for ddl in tablas_mensuales:
+                self._crear_tabla_mensual(ddl)
+            for ddl, codigos_ignorados in indices:
+                self._ddl_idempotente(ddl, codigos_ignorados)
             print("✅ Tablas de análisis creadas correctamente")
+            return True
         except Exception as e:
             print(f"⚠️ Tablas ya existentes o error: {e}")
+            return False
+    
+    @contextmanager
+    def transaction(self):
+        """Conexión para varias sentencias en una misma transacción"""
+        connection = self.get_connection()
+        try:
+            with cronometro('oracle_transaction'):
+                yield connection
+                connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            self.release_connection(connection)
 
 # Instancia global
 db = Database()
\ No newline at end of file
@@ -0,0 +1,45 @@
+"""Configuración de gunicorn para el microservicio de análisis.
+
+Uso (las tablas se crean antes, una vez por despliegue):
+    python manage.py migrar
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Workers gthread: cada proceso atiende varias peticiones en hilos (las esperas a
+Oracle y al backend liberan el GIL) y los análisis de CPU se reparten entre
+procesos. Nada que dependa del proceso (pool de Oracle, hilos en segundo plano)
+se comparte a través del fork.
+"""
+from config import Config
+
+bind = f"0.0.0.0:{Config.FLASK_PORT}"
+worker_class = 'gthread'
+workers = Config.GUNICORN_WORKERS
+threads = Config.GUNICORN_THREADS
+timeout = Config.GUNICORN_TIMEOUT
+graceful_timeout = Config.GUNICORN_GRACEFUL_TIMEOUT
+keepalive = Config.GUNICORN_KEEPALIVE
+
+# La aplicación se importa en cada worker después del fork
+preload_app = False
+
+accesslog = '-'
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    """Descartar cualquier pool heredado del maestro (por ejemplo con --preload)"""
+    from database import db
+    db.reiniciar()
+
+
+def post_worker_init(worker):
+    """Iniciar en cada worker los hilos en segundo plano (los hilos no sobreviven al fork)"""
+    from app import iniciar_servicio
+    iniciar_servicio()
+    worker.log.info(f"Worker {worker.pid}: {Config.GUNICORN_THREADS} hilos, pool Oracle {Config.ORACLE_POOL_MIN}-{Config.ORACLE_POOL_MAX}")
+
+
+def worker_exit(server, worker):
+    """Guardar los reportes pendientes y cerrar el pool del worker"""
+    from app import detener_servicio
+    detener_servicio()
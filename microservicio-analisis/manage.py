@@ -0,0 +1,31 @@
+"""Comandos de administración del microservicio de análisis.
+
+    python manage.py migrar      # crear o actualizar tablas e índices en Oracle
+
+La migración ya no se ejecuta al arrancar el servicio: se corre una vez por
+despliegue, antes de iniciar los workers.
+"""
+import argparse
+import sys
+from database import db
+
+
+def migrar(args):
+    """Crear o actualizar el esquema de análisis (idempotente)"""
+    try:
+        return 0 if db.create_tables() else 1
+    finally:
+        db.cerrar()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Administración del microservicio de análisis')
+    comandos = parser.add_subparsers(dest='comando', required=True)
+    comandos.add_parser('migrar', help='Crear o actualizar tablas e índices en Oracle').set_defaults(funcion=migrar)
+    
+    args = parser.parse_args(argv)
+    return args.funcion(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
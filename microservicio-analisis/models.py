@@ -1,46 +1,520 @@
 from database import db
 from datetime import datetime
+from config import Config
+from services.escritor_reportes import EscritorReportes
+import base64
+import hashlib
 import json
+import cx_Oracle
+
+# Título y descripción con que se guarda cada tipo de análisis en Oracle
+TIPOS_REPORTE = {
+    'distribucion_especies': ('Análisis de Distribución de Especies', 'Análisis estadístico de la distribución de especies forestales'),
+    'condicion_arboles': ('Análisis de Condición de Árboles', 'Distribución de árboles por condición y estado sanitario'),
+    'analisis_muestras': ('Análisis de Muestras', 'Distribución de muestras por tipo, estado y condición'),
+    'dap_altura': ('Análisis de DAP y Altura', 'Estadísticas de diámetro a la altura del pecho y altura total'),
+    'resumen_general': ('Resumen General del Inventario', 'Vista general de todos los datos del inventario forestal'),
+    'biomasa_carbono': ('Estimación de Biomasa y Carbono', 'Biomasa aérea y carbono almacenado por subparcela, conglomerado y departamento')
+}
 
 class AnalisisReporte:
+    @staticmethod
+    def guardar(tipo_reporte, resultado, parametros=None, generado_por='sistema'):
+        """Guardar el resultado de un análisis con el título y descripción de su tipo"""
+        titulo, descripcion = TIPOS_REPORTE[tipo_reporte]
+        AnalisisReporte.crear(
+            tipo_reporte=tipo_reporte,
+            titulo=titulo,
+            descripcion=descripcion,
+            parametros=parametros or {},
+            resultado=resultado,
+            generado_por=generado_por
+        )
+    
     @staticmethod
     def crear(tipo_reporte, titulo, descripcion, parametros, resultado, generado_por):
-        query = """
-        INSERT INTO analisis_reportes (tipo_reporte, titulo, descripcion, parametros, resultado, generado_por)
-        VALUES (:tipo, :titulo, :desc, :params, :res, :gen)
+        """Encolar el reporte; se guarda en segundo plano junto con otros (ver crear_lote)"""
+        escritor.encolar({
+            'tipo_reporte': tipo_reporte,
+            'titulo': titulo,
+            'descripcion': descripcion,
+            'parametros': parametros,
+            'resultado': resultado,
+            'generado_por': generado_por,
+            # Hora de la petición, no la del lote
+            'creado': datetime.now()
+        })
+    
+    @staticmethod
+    def _huella(texto):
+        return hashlib.sha256(texto.encode('utf-8')).hexdigest() if texto else None
+    
+    @staticmethod
+    def _guardar_resultados(cursor, contenidos):
+        """Insertar los resultados que todavía no están (por hash).
+        
+        El MERGE no es atómico frente a otra transacción que inserta el mismo hash:
+        si otro worker lo guardó entre el ON y el INSERT llega ORA-00001 (solo se
+        deshace la sentencia, no el lote) y al repetirla ese hash ya coincide.
         """
+        for intento in range(3):
+            try:
+                cursor.setinputsizes(res=cx_Oracle.DB_TYPE_CLOB)
+                cursor.executemany("""
+                MERGE INTO analisis_resultados r
+                USING (SELECT :hash AS hash FROM dual) n
+                ON (r.hash = n.hash)
+                WHEN NOT MATCHED THEN INSERT (hash, resultado) VALUES (n.hash, :res)
+                """, [{'hash': huella, 'res': res} for huella, res in contenidos.items()])
+                return
+            except cx_Oracle.IntegrityError:
+                if intento == 2:
+                    raise
+    
+    @staticmethod
+    def crear_lote(reportes):
+        """Guardar varios reportes en una sola transacción con resultados direccionados por contenido.
         
-        params_json = json.dumps(parametros) if parametros else None
-        resultado_json = json.dumps(resultado) if resultado else None
+        Cada `resultado` distinto se guarda una sola vez en analisis_resultados. Si un
+        reporte repite el resultado del último reporte del mismo tipo y parámetros,
+        solo se actualizan su `ultima_vez` y `repeticiones`; si no, se inserta una fila
+        liviana que referencia el resultado por su hash.
         
-        db.execute_query(query, {
-            'tipo': tipo_reporte,
-            'titulo': titulo,
-            'desc': descripcion,
-            'params': params_json,
-            'res': resultado_json,
-            'gen': generado_por
-        })
+        Solo el primer reporte de cada tipo y parámetros del lote se compara con la
+        tabla: los siguientes siguen a otro reporte del lote con un resultado
+        distinto, así que siempre son filas nuevas.
+        """
+        filas = []
+        ultima_por_clave = {}
+        for reporte in reportes:
+            params_json = json.dumps(reporte['parametros'], sort_keys=True) if reporte['parametros'] else None
+            resultado_json = json.dumps(reporte['resultado'], sort_keys=True) if reporte['resultado'] else None
+            fila = {
+                'tipo': reporte['tipo_reporte'],
+                'titulo': reporte['titulo'],
+                'desc': reporte['descripcion'],
+                'params': params_json,
+                'params_hash': AnalisisReporte._huella(params_json),
+                'res': resultado_json,
+                'hash': AnalisisReporte._huella(resultado_json),
+                'gen': reporte['generado_por'],
+                'creado': reporte['creado'],
+                'repeticiones': 1
+            }
+            
+            # Repeticiones consecutivas dentro del mismo lote se agrupan en una sola fila
+            clave = (fila['tipo'], fila['params_hash'])
+            anterior = ultima_por_clave.get(clave)
+            if anterior is not None and anterior['hash'] == fila['hash']:
+                anterior['repeticiones'] += 1
+                anterior['creado'] = fila['creado']
+                continue
+            fila['primera'] = anterior is None
+            ultima_por_clave[clave] = fila
+            filas.append(fila)
+        
+        with db.transaction() as connection:
+            cursor = connection.cursor()
+            try:
+                contenidos = {fila['hash']: fila['res'] for fila in filas if fila['hash']}
+                if contenidos:
+                    AnalisisReporte._guardar_resultados(cursor, contenidos)
+                
+                # Repetición del último reporte del mismo tipo y parámetros: solo "visto por última vez"
+                primeras = [fila for fila in filas if fila['primera']]
+                cursor.executemany("""
+                UPDATE analisis_reportes
+                SET ultima_vez = :creado, repeticiones = repeticiones + :repeticiones
+                WHERE id = (
+                    SELECT MAX(id) FROM analisis_reportes
+                    WHERE tipo_reporte = :tipo
+                    AND (parametros_hash = :params_hash OR (parametros_hash IS NULL AND :params_hash IS NULL))
+                )
+                AND resultado_hash = :hash
+                """, [{
+                    'creado': fila['creado'],
+                    'repeticiones': fila['repeticiones'],
+                    'tipo': fila['tipo'],
+                    'params_hash': fila['params_hash'],
+                    'hash': fila['hash']
+                } for fila in primeras], arraydmlrowcounts=True)
+                actualizadas = {id(fila) for fila, cantidad in zip(primeras, cursor.getarraydmlrowcounts()) if cantidad}
+                
+                # En el orden del lote: el último reporte de cada clave queda con el mayor id
+                nuevas = [fila for fila in filas if id(fila) not in actualizadas]
+                if nuevas:
+                    cursor.setinputsizes(desc=cx_Oracle.DB_TYPE_CLOB, params=cx_Oracle.DB_TYPE_CLOB)
+                    cursor.executemany("""
+                    INSERT INTO analisis_reportes (
+                        tipo_reporte, titulo, descripcion, parametros, parametros_hash,
+                        resultado_hash, generado_por, created_at, ultima_vez, repeticiones
+                    )
+                    VALUES (:tipo, :titulo, :desc, :params, :params_hash, :hash, :gen, :creado, :creado, :repeticiones)
+                    """, [{
+                        'tipo': fila['tipo'],
+                        'titulo': fila['titulo'],
+                        'desc': fila['desc'],
+                        'params': fila['params'],
+                        'params_hash': fila['params_hash'],
+                        'hash': fila['hash'],
+                        'gen': fila['gen'],
+                        'creado': fila['creado'],
+                        'repeticiones': fila['repeticiones']
+                    } for fila in nuevas])
+            finally:
+                cursor.close()
     
     @staticmethod
-    def obtener_todos(limit=50):
-        query = """
-        SELECT id, tipo_reporte, titulo, descripcion, parametros, resultado, generado_por,
-               TO_CHAR(created_at, 'YYYY-MM-DD HH24:MI:SS') as created_at
+    def compactar(dias=None):
+        """Borrar reportes más antiguos que la retención (conservando el último de cada
+        tipo y parámetros) y los resultados que ya nadie referencia"""
+        dias = dias if dias is not None else Config.RETENCION_DIAS
+        with db.transaction() as connection:
+            cursor = connection.cursor()
+            try:
+                cursor.execute("""
+                DELETE FROM analisis_reportes
+                WHERE NVL(ultima_vez, created_at) < SYSTIMESTAMP - NUMTODSINTERVAL(:dias, 'DAY')
+                AND id NOT IN (
+                    SELECT MAX(id) FROM analisis_reportes GROUP BY tipo_reporte, parametros_hash
+                )
+                """, {'dias': dias})
+                reportes_borrados = cursor.rowcount
+                
+                cursor.execute("""
+                DELETE FROM analisis_resultados r
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM analisis_reportes a WHERE a.resultado_hash = r.hash
+                )
+                """)
+                resultados_borrados = cursor.rowcount
+            finally:
+                cursor.close()
+        
+        return {'reportes_borrados': reportes_borrados, 'resultados_borrados': resultados_borrados}
+    
+    @staticmethod
+    def codificar_cursor(reporte):
+        """Cursor opaco de paginación a partir del último reporte de una página"""
+        return base64.urlsafe_b64encode(f"{reporte['CURSOR_FECHA']}|{reporte['ID']}".encode()).decode()
+    
+    @staticmethod
+    def decodificar_cursor(cursor):
+        fecha, reporte_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return fecha, int(reporte_id)
+    
+    @staticmethod
+    def listar(tipo_reporte=None, limit=50, cursor=None):
+        """Historial de reportes (solo metadatos), del más reciente al más antiguo.
+        
+        La paginación es por cursor (created_at, id): cada página continúa donde
+        terminó la anterior usando el índice, sin recorrer las filas ya vistas.
+        Devuelve (reportes, siguiente_cursor).
+        """
+        condiciones = []
+        params = {'limit': limit}
+        
+        if tipo_reporte:
+            condiciones.append("tipo_reporte = :tipo")
+            params['tipo'] = tipo_reporte
+        
+        if cursor:
+            params['cursor_fecha'], params['cursor_id'] = AnalisisReporte.decodificar_cursor(cursor)
+            condiciones.append("""(created_at < TO_TIMESTAMP(:cursor_fecha, 'YYYY-MM-DD"T"HH24:MI:SS.FF6')
+                 OR (created_at = TO_TIMESTAMP(:cursor_fecha, 'YYYY-MM-DD"T"HH24:MI:SS.FF6') AND id < :cursor_id))""")
+        
+        where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+        query = f"""
+        SELECT id, tipo_reporte, titulo, generado_por, repeticiones,
+               TO_CHAR(created_at, 'YYYY-MM-DD HH24:MI:SS') as created_at,
+               TO_CHAR(ultima_vez, 'YYYY-MM-DD HH24:MI:SS') as ultima_vez,
+               TO_CHAR(created_at, 'YYYY-MM-DD"T"HH24:MI:SS.FF6') as cursor_fecha
         FROM analisis_reportes
-        ORDER BY created_at DESC
+        {where}
+        ORDER BY created_at DESC, id DESC
         FETCH FIRST :limit ROWS ONLY
         """
-        return db.fetch_all(query, {'limit': limit})
+        filas = db.fetch_all(query, params)
+        
+        siguiente = AnalisisReporte.codificar_cursor(filas[-1]) if filas and len(filas) == limit else None
+        reportes = [{
+            'id': fila['ID'],
+            'tipo_reporte': fila['TIPO_REPORTE'],
+            'titulo': fila['TITULO'],
+            'generado_por': fila['GENERADO_POR'],
+            'repeticiones': fila['REPETICIONES'],
+            'created_at': fila['CREATED_AT'],
+            'ultima_vez': fila['ULTIMA_VEZ']
+        } for fila in filas]
+        return reportes, siguiente
     
     @staticmethod
-    def obtener_por_tipo(tipo_reporte, limit=20):
+    def obtener_por_id(reporte_id):
+        """Reporte completo, con descripción, parámetros y resultado"""
         query = """
-        SELECT id, tipo_reporte, titulo, descripcion, parametros, resultado, generado_por,
-               TO_CHAR(created_at, 'YYYY-MM-DD HH24:MI:SS') as created_at
-        FROM analisis_reportes
-        WHERE tipo_reporte = :tipo
-        ORDER BY created_at DESC
-        FETCH FIRST :limit ROWS ONLY
+        SELECT r.id, r.tipo_reporte, r.titulo, r.descripcion, r.parametros,
+               NVL(r.resultado, res.resultado) as resultado, r.generado_por, r.repeticiones,
+               TO_CHAR(r.created_at, 'YYYY-MM-DD HH24:MI:SS') as created_at,
+               TO_CHAR(r.ultima_vez, 'YYYY-MM-DD HH24:MI:SS') as ultima_vez
+        FROM analisis_reportes r
+        LEFT JOIN analisis_resultados res ON res.hash = r.resultado_hash
+        WHERE r.id = :id
         """
-        return db.fetch_all(query, {'tipo': tipo_reporte, 'limit': limit})
\ No newline at end of file
+        fila = db.fetch_one(query, {'id': reporte_id})
+        if not fila:
+            return None
+        
+        return {
+            'id': fila['ID'],
+            'tipo_reporte': fila['TIPO_REPORTE'],
+            'titulo': fila['TITULO'],
+            'descripcion': fila['DESCRIPCION'],
+            'parametros': json.loads(fila['PARAMETROS']) if fila['PARAMETROS'] else {},
+            'resultado': json.loads(fila['RESULTADO']) if fila['RESULTADO'] else None,
+            'generado_por': fila['GENERADO_POR'],
+            'repeticiones': fila['REPETICIONES'],
+            'created_at': fila['CREATED_AT'],
+            'ultima_vez': fila['ULTIMA_VEZ']
+        }
+    
+    @staticmethod
+    def iterar_exportacion(tipo_reporte=None, desde=None, hasta=None, con_resultado=True):
+        """Reportes completos del más antiguo al más reciente, leídos por lotes.
+        
+        Generador de dicts con la misma forma que obtener_por_id, salvo parametros
+        y resultado: llegan como CLOB sin decodificar (texto JSON), para copiarlos
+        por trozos con trozos_lob.
+        """
+        condiciones = []
+        params = {}
+        if tipo_reporte:
+            condiciones.append("r.tipo_reporte = :tipo")
+            params['tipo'] = tipo_reporte
+        if desde:
+            condiciones.append("r.created_at >= :desde")
+            params['desde'] = desde
+        if hasta:
+            condiciones.append("r.created_at <= :hasta")
+            params['hasta'] = hasta
+        
+        where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+        resultado = "NVL(r.resultado, res.resultado)" if con_resultado else "NULL"
+        query = f"""
+        SELECT r.id, r.tipo_reporte, r.titulo, r.generado_por, r.repeticiones,
+               TO_CHAR(r.created_at, 'YYYY-MM-DD HH24:MI:SS') as created_at,
+               TO_CHAR(r.ultima_vez, 'YYYY-MM-DD HH24:MI:SS') as ultima_vez,
+               r.parametros, {resultado} as resultado
+        FROM analisis_reportes r
+        LEFT JOIN analisis_resultados res ON res.hash = r.resultado_hash
+        {where}
+        ORDER BY r.created_at, r.id
+        """
+        for fila in db.iterar(query, params):
+            yield {
+                'id': fila['ID'],
+                'tipo_reporte': fila['TIPO_REPORTE'],
+                'titulo': fila['TITULO'],
+                'generado_por': fila['GENERADO_POR'],
+                'repeticiones': fila['REPETICIONES'],
+                'created_at': fila['CREATED_AT'],
+                'ultima_vez': fila['ULTIMA_VEZ'],
+                'parametros': fila['PARAMETROS'],
+                'resultado': fila['RESULTADO']
+            }
+
+# Períodos de las tendencias -> formato de TRUNC en Oracle
+PERIODOS = {'dia': 'DD', 'semana': 'IW', 'mes': 'MM'}
+
+# Estadísticas de dap_altura -> sufijo de columna en inventario_instantaneas
+ESTADISTICAS_INSTANTANEA = {
+    'promedio': 'promedio',
+    'mediana': 'mediana',
+    'minimo': 'minimo',
+    'maximo': 'maximo',
+    'desviacion_std': 'desviacion'
+}
+
+def _numero(valor):
+    """NaN (estadística sin datos) -> NULL"""
+    return None if valor is None or valor != valor else valor
+
+class InstantaneaInventario:
+    """Instantáneas tipadas del inventario para consultar tendencias en Oracle.
+    
+    Cada instantánea es una fila de inventario_instantaneas (totales y estadísticas
+    de DAP y altura) más sus conteos por especie y por clase diamétrica, todas con
+    la misma tomada_en. Las tablas están particionadas por mes (ver create_tables).
+    """
+    
+    @staticmethod
+    def _filas(resultados, tomada_en):
+        """Resultados de analizar_todo -> (fila resumen, filas por especie, filas por clase)"""
+        especies = resultados.get('distribucion_especies') or {}
+        dap_altura = resultados.get('dap_altura') or {}
+        muestras = resultados.get('analisis_muestras') or {}
+        general = resultados.get('resumen_general') or {}
+        
+        resumen = {
+            'tomada_en': tomada_en,
+            'total_arboles': especies.get('total_arboles', 0),
+            'especies_unicas': especies.get('especies_unicas', 0),
+            'total_muestras': muestras.get('total_muestras', 0),
+            'total_conglomerados': (general.get('conglomerados') or {}).get('total')
+        }
+        for medida in ('dap', 'altura'):
+            estadisticas = dap_altura.get(medida) or {}
+            for clave, sufijo in ESTADISTICAS_INSTANTANEA.items():
+                resumen[f'{medida}_{sufijo}'] = _numero(estadisticas.get(clave))
+        
+        por_especie = [
+            {'tomada_en': tomada_en, 'especie': especie, 'cantidad': cantidad}
+            for especie, cantidad in (especies.get('distribucion_completa') or {}).items()
+        ]
+        por_clase = [
+            {'tomada_en': tomada_en, 'clase': clase, 'cantidad': cantidad}
+            for clase, cantidad in (dap_altura.get('clasificacion_dap') or {}).items()
+        ]
+        return resumen, por_especie, por_clase
+    
+    @staticmethod
+    def guardar(resultados, tomada_en):
+        """Guardar una instantánea de los resultados sin filtros de analizar_todo.
+        
+        Los conteos se cargan con executemany en la misma transacción. Devuelve
+        False si ya existe una instantánea con esa tomada_en (otro worker la guardó).
+        """
+        resumen, por_especie, por_clase = InstantaneaInventario._filas(resultados, tomada_en)
+        columnas = list(resumen)
+        try:
+            with db.transaction() as connection:
+                cursor = connection.cursor()
+                try:
+                    cursor.execute(f"""
+                    INSERT INTO inventario_instantaneas ({', '.join(columnas)})
+                    VALUES ({', '.join(':' + columna for columna in columnas)})
+                    """, resumen)
+                    if por_especie:
+                        cursor.executemany("""
+                        INSERT INTO instantanea_especies (tomada_en, especie, cantidad)
+                        VALUES (:tomada_en, :especie, :cantidad)
+                        """, por_especie)
+                    if por_clase:
+                        cursor.executemany("""
+                        INSERT INTO instantanea_clases_dap (tomada_en, clase, cantidad)
+                        VALUES (:tomada_en, :clase, :cantidad)
+                        """, por_clase)
+                finally:
+                    cursor.close()
+        except cx_Oracle.IntegrityError:
+            return False
+        return True
+    
+    @staticmethod
+    def tendencia_resumen(meses=12, periodo='mes'):
+        """Totales y estadísticas de DAP y altura por período, calculados en Oracle.
+        
+        De cada período se toma la última instantánea (KEEP DENSE_RANK LAST), el
+        promedio de los promedios y los extremos; las derivas son la diferencia con
+        el período anterior (LAG).
+        """
+        formato = PERIODOS[periodo]
+        ultimo = "KEEP (DENSE_RANK LAST ORDER BY tomada_en)"
+        query = f"""
+        WITH periodos AS (
+            SELECT TRUNC(tomada_en, '{formato}') AS periodo,
+                   COUNT(*) AS instantaneas,
+                   MAX(total_arboles) {ultimo} AS total_arboles,
+                   MAX(especies_unicas) {ultimo} AS especies_unicas,
+                   MAX(total_muestras) {ultimo} AS total_muestras,
+                   MAX(total_conglomerados) {ultimo} AS total_conglomerados,
+                   MAX(dap_promedio) {ultimo} AS dap_promedio,
+                   MAX(dap_mediana) {ultimo} AS dap_mediana,
+                   AVG(dap_promedio) AS dap_promedio_periodo,
+                   MIN(dap_minimo) AS dap_minimo,
+                   MAX(dap_maximo) AS dap_maximo,
+                   MAX(altura_promedio) {ultimo} AS altura_promedio,
+                   MAX(altura_mediana) {ultimo} AS altura_mediana,
+                   AVG(altura_promedio) AS altura_promedio_periodo,
+                   MIN(altura_minimo) AS altura_minimo,
+                   MAX(altura_maximo) AS altura_maximo
+            FROM inventario_instantaneas
+            WHERE tomada_en >= ADD_MONTHS(TRUNC(SYSDATE, 'MM'), 1 - :meses)
+            GROUP BY TRUNC(tomada_en, '{formato}')
+        )
+        SELECT TO_CHAR(periodo, 'YYYY-MM-DD') AS periodo, instantaneas,
+               total_arboles, especies_unicas, total_muestras, total_conglomerados,
+               dap_promedio, dap_mediana, dap_promedio_periodo, dap_minimo, dap_maximo,
+               altura_promedio, altura_mediana, altura_promedio_periodo, altura_minimo, altura_maximo,
+               total_arboles - LAG(total_arboles) OVER (ORDER BY periodo) AS variacion_arboles,
+               dap_promedio - LAG(dap_promedio) OVER (ORDER BY periodo) AS deriva_dap,
+               altura_promedio - LAG(altura_promedio) OVER (ORDER BY periodo) AS deriva_altura
+        FROM periodos
+        ORDER BY periodo
+        """
+        return [
+            {columna.lower(): valor for columna, valor in fila.items()}
+            for fila in db.fetch_all(query, {'meses': meses})
+        ]
+    
+    @staticmethod
+    def _tendencia_conteos(tabla, columna, meses, periodo, valores=()):
+        """Conteos de la última instantánea de cada período: {periodo: {valor: (cantidad, variación)}}"""
+        formato = PERIODOS[periodo]
+        params = {'meses': meses}
+        filtro = ""
+        if valores:
+            nombres = [f'v{i}' for i in range(len(valores))]
+            params.update(zip(nombres, valores))
+            filtro = f"AND c.{columna} IN ({', '.join(':' + nombre for nombre in nombres)})"
+        
+        # La última instantánea de cada período se ubica en la tabla resumen y sus
+        # conteos se leen por la clave primaria (tomada_en, valor)
+        query = f"""
+        WITH ultimas AS (
+            SELECT TRUNC(tomada_en, '{formato}') AS periodo, MAX(tomada_en) AS tomada_en
+            FROM inventario_instantaneas
+            WHERE tomada_en >= ADD_MONTHS(TRUNC(SYSDATE, 'MM'), 1 - :meses)
+            GROUP BY TRUNC(tomada_en, '{formato}')
+        )
+        SELECT TO_CHAR(u.periodo, 'YYYY-MM-DD') AS periodo, c.{columna} AS valor, c.cantidad,
+               c.cantidad - LAG(c.cantidad) OVER (PARTITION BY c.{columna} ORDER BY u.periodo) AS variacion
+        FROM ultimas u
+        JOIN {tabla} c ON c.tomada_en = u.tomada_en
+        WHERE 1 = 1 {filtro}
+        ORDER BY u.periodo, c.cantidad DESC, c.{columna}
+        """
+        serie = {}
+        for fila in db.fetch_all(query, params):
+            serie.setdefault(fila['PERIODO'], {})[fila['VALOR']] = (fila['CANTIDAD'], fila['VARIACION'])
+        return serie
+    
+    @staticmethod
+    def tendencia_especies(meses=12, periodo='mes', especies=()):
+        """Árboles por especie en cada período (opcionalmente solo algunas especies)"""
+        serie = InstantaneaInventario._tendencia_conteos('instantanea_especies', 'especie', meses, periodo, especies)
+        return [{
+            'periodo': fecha,
+            'especies': {especie: cantidad for especie, (cantidad, _) in conteos.items()},
+            'variacion': {especie: variacion for especie, (_, variacion) in conteos.items() if variacion is not None}
+        } for fecha, conteos in serie.items()]
+    
+    @staticmethod
+    def tendencia_clases_dap(meses=12, periodo='mes'):
+        """Árboles por clase diamétrica en cada período"""
+        serie = InstantaneaInventario._tendencia_conteos('instantanea_clases_dap', 'clase', meses, periodo)
+        return [{
+            'periodo': fecha,
+            'clases': {clase: cantidad for clase, (cantidad, _) in conteos.items()},
+            'variacion': {clase: variacion for clase, (_, variacion) in conteos.items() if variacion is not None}
+        } for fecha, conteos in serie.items()]
+
+# Escritor en segundo plano de los reportes generados
+escritor = EscritorReportes(
+    AnalisisReporte.crear_lote,
+    tamano_cola=Config.REPORTES_COLA_MAX,
+    tamano_lote=Config.REPORTES_LOTE,
+    intervalo=Config.REPORTES_INTERVALO,
+    espera_cola=Config.REPORTES_ESPERA_COLA,
+    mantenimiento=AnalisisReporte.compactar,
+    intervalo_mantenimiento=Config.RETENCION_INTERVALO
+)
@@ -0,0 +1,485 @@
+import math
+import threading
+import time
+from bisect import bisect_right
+from collections import Counter
+import numpy as np
+from config import Config
+from services.backend_client import backend
+from services.motor_analisis import LIMITES_DAP, CLASES_DAP
+
+
+class EstadisticaWelford:
+    """Media y varianza en línea (algoritmo de Welford) con altas, bajas y combinación"""
+
+    __slots__ = ('n', 'media', 'm2')
+
+    def __init__(self, n=0, media=0.0, m2=0.0):
+        self.n = n
+        self.media = media
+        self.m2 = m2
+
+    def agregar(self, x):
+        self.n += 1
+        delta = x - self.media
+        self.media += delta / self.n
+        self.m2 += delta * (x - self.media)
+
+    def quitar(self, x):
+        if self.n <= 1:
+            self.n, self.media, self.m2 = 0, 0.0, 0.0
+            return
+        media_anterior = (self.n * self.media - x) / (self.n - 1)
+        self.m2 = max(self.m2 - (x - self.media) * (x - media_anterior), 0.0)
+        self.media = media_anterior
+        self.n -= 1
+
+    def combinar(self, otra):
+        """Combinar con otra estadística parcial (Chan et al.)"""
+        if not otra.n:
+            return
+        n = self.n + otra.n
+        delta = otra.media - self.media
+        self.media += delta * otra.n / n
+        self.m2 += otra.m2 + delta * delta * self.n * otra.n / n
+        self.n = n
+
+    @property
+    def desviacion_std(self):
+        # Muestral (ddof=1), igual que pandas.Series.std()
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else float('nan')
+
+
+class HistogramaCuantiles:
+    """Sketch de cuantiles combinable: histograma de cubetas logarítmicas con error
+    relativo acotado (al estilo de DDSketch).
+
+    A diferencia de t-digest admite bajas exactas, que hacen falta para aplicar
+    modificaciones y borrados del feed de cambios.
+    """
+
+    def __init__(self, minimo=0.01, maximo=10000.0, error_relativo=0.005):
+        self.minimo = minimo
+        self.maximo = maximo
+        self.gamma = (1 + error_relativo) / (1 - error_relativo)
+        self._log_gamma = math.log(self.gamma)
+        # Cubeta 0 para valores <= minimo y la última para valores > maximo
+        self.conteos = np.zeros(int(math.ceil(math.log(maximo / minimo) / self._log_gamma)) + 2, dtype=np.int64)
+
+    def _cubetas(self, valores):
+        valores = np.asarray(valores, dtype=np.float64)
+        valores = valores[~np.isnan(valores)]
+        indices = np.zeros(len(valores), dtype=np.int64)
+        positivos = valores > self.minimo
+        indices[positivos] = np.ceil(np.log(valores[positivos] / self.minimo) / self._log_gamma).astype(np.int64)
+        return np.minimum(indices, len(self.conteos) - 1)
+
+    def agregar(self, valores, signo=1):
+        np.add.at(self.conteos, self._cubetas(valores), signo)
+
+    def agregar_valor(self, valor, signo=1):
+        """Versión escalar de agregar(), sin el costo de crear arrays por fila"""
+        if valor <= self.minimo:
+            cubeta = 0
+        else:
+            cubeta = min(math.ceil(math.log(valor / self.minimo) / self._log_gamma), len(self.conteos) - 1)
+        self.conteos[cubeta] += signo
+
+    def quitar(self, valores):
+        self.agregar(valores, -1)
+
+    def combinar(self, otro):
+        self.conteos += otro.conteos
+
+    def cuantil(self, q):
+        total = int(self.conteos.sum())
+        if not total:
+            return float('nan')
+        acumulado = np.cumsum(self.conteos)
+        cubeta = int(np.searchsorted(acumulado, q * (total - 1), side='right'))
+        if cubeta == 0:
+            return self.minimo
+        if cubeta >= len(self.conteos) - 1:
+            return self.maximo
+        # Punto de la cubeta (minimo*g^(i-1), minimo*g^i] con error relativo acotado
+        return self.minimo * 2 * self.gamma ** cubeta / (self.gamma + 1)
+
+
+def clase_dap(dap):
+    """Clase diamétrica de un valor, con el mismo criterio que np.digitize"""
+    return CLASES_DAP[bisect_right(LIMITES_DAP, dap)]
+
+
+class AgregadoColeccion:
+    """Conteos por campo categórico y estadísticas de campos numéricos de una colección,
+    mantenidos a partir de altas, modificaciones y reconciliaciones.
+
+    Las filas se guardan por columnas: una posición por documento en un array por
+    campo (códigos para los categóricos, float64 para los numéricos) en lugar de un
+    dict por documento.
+    """
+
+    CAPACIDAD_INICIAL = 1024
+    BLOQUE = 4096
+
+    def __init__(self, categoricos, numericos=(), derivados=None):
+        self.categoricos = tuple(categoricos)
+        self.numericos = tuple(numericos)
+        # Campos categóricos calculados a partir de un campo numérico
+        self.derivados = derivados or {}
+        campos_categoricos = self.categoricos + tuple(self.derivados)
+        self._posiciones = {}
+        self._capacidad = self.CAPACIDAD_INICIAL
+        self._codigos = {campo: {} for campo in campos_categoricos}
+        self._categorias = {campo: [] for campo in campos_categoricos}
+        self._columnas_categoricas = {campo: np.full(self.CAPACIDAD_INICIAL, -1, dtype=np.int32)
+                                      for campo in campos_categoricos}
+        self._columnas_numericas = {campo: np.full(self.CAPACIDAD_INICIAL, np.nan) for campo in self.numericos}
+        self.conteos = {campo: Counter() for campo in campos_categoricos}
+        self.estadisticas = {campo: EstadisticaWelford() for campo in self.numericos}
+        self.sketches = {campo: HistogramaCuantiles() for campo in self.numericos}
+        self._extremos = {campo: [math.inf, -math.inf] for campo in self.numericos}
+        self._extremos_sucios = set()
+
+    def __len__(self):
+        return len(self._posiciones)
+
+    def vacio(self):
+        return AgregadoColeccion(self.categoricos, self.numericos, self.derivados)
+
+    def _posicion(self, documento_id):
+        """Posición del documento en las columnas y si ya estaba"""
+        posicion = self._posiciones.get(documento_id)
+        if posicion is not None:
+            return posicion, True
+        posicion = len(self._posiciones)
+        if posicion == self._capacidad:
+            self._crecer()
+        self._posiciones[documento_id] = posicion
+        return posicion, False
+
+    def _crecer(self):
+        self._capacidad *= 2
+        for columnas, relleno in ((self._columnas_categoricas, -1), (self._columnas_numericas, np.nan)):
+            for campo, columna in columnas.items():
+                nueva = np.full(self._capacidad, relleno, dtype=columna.dtype)
+                nueva[:len(columna)] = columna
+                columnas[campo] = nueva
+
+    def _codigo(self, campo, valor):
+        if valor is None:
+            return -1
+        codigos = self._codigos[campo]
+        codigo = codigos.get(valor)
+        if codigo is None:
+            codigo = codigos[valor] = len(self._categorias[campo])
+            self._categorias[campo].append(valor)
+        return codigo
+
+    def _extraer(self, documento):
+        """Códigos categóricos y valores numéricos de un documento, en el orden de los campos"""
+        valores = []
+        for campo in self.numericos:
+            valor = documento.get(campo)
+            valores.append(float(valor) if valor is not None else math.nan)
+        codigos = [self._codigo(campo, documento.get(campo)) for campo in self.categoricos]
+        for campo, (origen, funcion) in self.derivados.items():
+            valor = valores[self.numericos.index(origen)]
+            codigos.append(self._codigo(campo, funcion(valor)) if not math.isnan(valor) else -1)
+        return codigos, valores
+
+    def _leer(self, posicion):
+        codigos = [int(columna[posicion]) for columna in self._columnas_categoricas.values()]
+        valores = [float(columna[posicion]) for columna in self._columnas_numericas.values()]
+        return codigos, valores
+
+    def _restar(self, codigos, valores):
+        """Descontar la fila anterior de un documento modificado"""
+        for (campo, conteo), codigo in zip(self.conteos.items(), codigos):
+            if codigo < 0:
+                continue
+            valor = self._categorias[campo][codigo]
+            conteo[valor] -= 1
+            if conteo[valor] <= 0:
+                del conteo[valor]
+        for campo, valor in zip(self.numericos, valores):
+            if math.isnan(valor):
+                continue
+            self.estadisticas[campo].quitar(valor)
+            if valor in self._extremos[campo]:
+                self._extremos_sucios.add(campo)
+            self.sketches[campo].agregar_valor(valor, -1)
+
+    def aplicar(self, documentos):
+        """Aplicar documentos nuevos o modificados; devuelve el mayor updatedAt visto.
+
+        Las altas se suman por bloques con operaciones sobre arrays; la fila anterior
+        de un documento modificado se descuenta de a una. Aplicar otra vez un
+        documento ya aplicado no cambia nada: reemplaza su fila.
+        """
+        marca = None
+        posiciones, filas, pendientes = [], [], set()
+        for documento in documentos:
+            posicion, existente = self._posicion(documento['_id'])
+            if existente:
+                if posicion in pendientes:
+                    self._sumar_bloque(posiciones, filas)
+                    posiciones, filas, pendientes = [], [], set()
+                self._restar(*self._leer(posicion))
+            posiciones.append(posicion)
+            filas.append(self._extraer(documento))
+            pendientes.add(posicion)
+            if len(posiciones) == self.BLOQUE:
+                self._sumar_bloque(posiciones, filas)
+                posiciones, filas, pendientes = [], [], set()
+            actualizado = documento.get('updatedAt')
+            if actualizado and (marca is None or actualizado > marca):
+                marca = actualizado
+        if posiciones:
+            self._sumar_bloque(posiciones, filas)
+        return marca
+
+    def _sumar_bloque(self, posiciones, filas):
+        """Guardar un bloque de filas en las columnas y sumarlas a los agregados"""
+        posiciones = np.asarray(posiciones)
+        codigos = np.array([codigos for codigos, _ in filas], dtype=np.int32).reshape(len(filas), -1)
+        valores = np.array([valores for _, valores in filas], dtype=np.float64).reshape(len(filas), -1)
+
+        for k, (campo, columna) in enumerate(self._columnas_categoricas.items()):
+            columna[posiciones] = codigos[:, k]
+            conteo, categorias = self.conteos[campo], self._categorias[campo]
+            cantidades = np.bincount(codigos[:, k][codigos[:, k] >= 0])
+            for codigo in np.flatnonzero(cantidades):
+                conteo[categorias[codigo]] += int(cantidades[codigo])
+
+        for k, campo in enumerate(self.numericos):
+            self._columnas_numericas[campo][posiciones] = valores[:, k]
+            validos = valores[:, k][~np.isnan(valores[:, k])]
+            if not len(validos):
+                continue
+            media = float(validos.mean())
+            self.estadisticas[campo].combinar(EstadisticaWelford(len(validos), media, float(((validos - media) ** 2).sum())))
+            self.sketches[campo].agregar(validos)
+            extremos = self._extremos[campo]
+            extremos[0] = min(extremos[0], float(validos.min()))
+            extremos[1] = max(extremos[1], float(validos.max()))
+
+    def extremos(self, campo):
+        if campo in self._extremos_sucios:
+            # Se quitó un mínimo o máximo: se recalculan solo en ese caso, sobre la columna
+            columna = self._columnas_numericas[campo][:len(self)]
+            validos = columna[~np.isnan(columna)]
+            self._extremos[campo] = [float(validos.min()), float(validos.max())] if len(validos) else [math.inf, -math.inf]
+            self._extremos_sucios.discard(campo)
+        minimo, maximo = self._extremos[campo]
+        return (minimo, maximo) if minimo <= maximo else (math.nan, math.nan)
+
+    def resumen_numerico(self, campo):
+        estadistica = self.estadisticas[campo]
+        minimo, maximo = self.extremos(campo)
+        return {
+            'promedio': estadistica.media if estadistica.n else math.nan,
+            'mediana': self.sketches[campo].cuantil(0.5),
+            'minimo': minimo,
+            'maximo': maximo,
+            'desviacion_std': estadistica.desviacion_std
+        }
+
+
+class AgregadosIncrementales:
+    """Agregados de árboles y muestras mantenidos con el feed de cambios del backend
+    (exportación con ?desde=), con reconciliación completa periódica para reflejar
+    borrados y corregir cualquier deriva.
+
+    La reconciliación periódica corre en un hilo aparte: reconstruye cada colección
+    sin el lock y solo la reemplaza al final, así las consultas no la esperan.
+    """
+
+    CAMPOS = {
+        'arboles': ('especie', 'condicion', 'sanitario', 'dap', 'altura', 'updatedAt'),
+        'muestras': ('tipo', 'estado', 'condicion', 'updatedAt')
+    }
+
+    def __init__(self):
+        self.colecciones = {
+            'arboles': AgregadoColeccion(
+                ('especie', 'condicion', 'sanitario'),
+                ('dap', 'altura'),
+                {'clase_dap': ('dap', clase_dap)}
+            ),
+            'muestras': AgregadoColeccion(('tipo', 'estado', 'condicion'))
+        }
+        self._marcas = {coleccion: None for coleccion in self.colecciones}
+        self._ultima_sincronizacion = None
+        self._ultima_reconciliacion = None
+        self._reconciliando = False
+        self._lock = threading.RLock()
+        self._sincronizacion = threading.Lock()
+
+    def sincronizar(self, forzar=False):
+        """Traer los cambios desde la última marca; reconciliar todo si toca.
+
+        La primera carga y forzar=True reconcilian en este hilo; las reconciliaciones
+        periódicas se lanzan en segundo plano. Los cambios se descargan sin el lock
+        de los agregados (las consultas siguen respondiendo con lo último) y solo se
+        toma para aplicarlos. Hay una sincronización a la vez: mientras corre, las
+        demás peticiones no la esperan, salvo que todavía no haya datos.
+        """
+        if not self._sincronizacion.acquire(blocking=forzar or self._ultima_reconciliacion is None):
+            return
+        try:
+            ahora = time.monotonic()
+            if (not forzar and self._ultima_sincronizacion is not None
+                    and ahora - self._ultima_sincronizacion < Config.AGREGADOS_INTERVALO):
+                return
+            if forzar or self._ultima_reconciliacion is None:
+                self._reconciliar()
+                self._ultima_sincronizacion = ahora
+                return
+
+            cambios = {
+                coleccion: list(backend.iterar_export(coleccion, self.CAMPOS[coleccion], desde=self._marcas[coleccion]))
+                for coleccion in self.colecciones
+            }
+            with self._lock:
+                for coleccion, documentos in cambios.items():
+                    self._avanzar(coleccion, self.colecciones[coleccion].aplicar(documentos))
+            self._ultima_sincronizacion = ahora
+
+            if not self._reconciliando and ahora - self._ultima_reconciliacion >= Config.AGREGADOS_RECONCILIACION:
+                self._reconciliando = True
+                threading.Thread(target=self._reconciliar_en_segundo_plano, daemon=True).start()
+        finally:
+            self._sincronizacion.release()
+
+    def _avanzar(self, coleccion, marca):
+        if marca and (self._marcas[coleccion] is None or marca > self._marcas[coleccion]):
+            self._marcas[coleccion] = marca
+
+    def _reconciliar(self):
+        """Reconstruir cada colección aparte (los borrados desaparecen) y reemplazarla.
+
+        La marca vuelve a la que había al empezar: la siguiente sincronización aplica
+        otra vez los cambios que llegaron durante la reconstrucción, sin efecto sobre
+        los que ya estaban incluidos.
+        """
+        inicio = time.monotonic()
+        for coleccion, agregado in list(self.colecciones.items()):
+            marca_inicial = self._marcas[coleccion]
+            nuevo = agregado.vacio()
+            marca = nuevo.aplicar(backend.iterar_export(coleccion, self.CAMPOS[coleccion]))
+            with self._lock:
+                self.colecciones[coleccion] = nuevo
+                self._marcas[coleccion] = marca_inicial if marca_inicial is not None else marca
+        with self._lock:
+            self._ultima_reconciliacion = inicio
+
+    def _reconciliar_en_segundo_plano(self):
+        try:
+            self._reconciliar()
+        except Exception as e:
+            # Se reintenta en la siguiente sincronización; mientras, siguen los agregados actuales
+            print(f"Error al reconciliar agregados: {e}")
+        finally:
+            self._reconciliando = False
+
+    def _preparar(self, coleccion):
+        """Sincronizar (sin el lock) y devolver el agregado vigente de la colección"""
+        try:
+            self.sincronizar()
+        except Exception as e:
+            # Sin backend se siguen sirviendo los últimos agregados conocidos
+            print(f"Error al sincronizar agregados: {e}")
+        agregado = self.colecciones[coleccion]
+        return agregado if len(agregado) else None
+
+    def version(self):
+        """(colección, marca, documentos) de cada colección, después de sincronizar.
+
+        Cambia con cada alta o modificación (marca) y con los borrados que refleja
+        una reconciliación (documentos); es la misma en todos los workers.
+        """
+        try:
+            self.sincronizar()
+        except Exception as e:
+            print(f"Error al sincronizar agregados: {e}")
+        with self._lock:
+            return tuple((coleccion, self._marcas[coleccion], len(agregado))
+                         for coleccion, agregado in self.colecciones.items())
+
+    def especies(self):
+        arboles = self._preparar('arboles')
+        if not arboles:
+            return None
+        with self._lock:
+            distribucion = dict(arboles.conteos['especie'].most_common())
+            return {
+                'total_arboles': len(arboles),
+                'especies_unicas': len(distribucion),
+                'distribucion_completa': distribucion,
+                'top_5_especies': dict(list(distribucion.items())[:5])
+            }
+
+    def condicion(self):
+        arboles = self._preparar('arboles')
+        if not arboles:
+            return None
+        with self._lock:
+            return {
+                'total': len(arboles),
+                'por_condicion': dict(arboles.conteos['condicion'].most_common()),
+                'por_estado_sanitario': dict(arboles.conteos['sanitario'].most_common())
+            }
+
+    def dap_altura(self):
+        """Estadísticas de DAP y altura en O(cambios); la mediana es aproximada (sketch)"""
+        arboles = self._preparar('arboles')
+        if not arboles:
+            return None
+        with self._lock:
+            clases = arboles.conteos['clase_dap']
+            return {
+                'dap': arboles.resumen_numerico('dap'),
+                'altura': arboles.resumen_numerico('altura'),
+                'clasificacion_dap': {clase: clases.get(clase, 0) for clase in CLASES_DAP},
+                'total_analizado': len(arboles)
+            }
+
+    def muestras(self):
+        muestras = self._preparar('muestras')
+        if not muestras:
+            return None
+        with self._lock:
+            return {
+                'total_muestras': len(muestras),
+                'por_tipo': dict(muestras.conteos['tipo'].most_common()),
+                'por_estado': dict(muestras.conteos['estado'].most_common()),
+                'por_condicion': dict(muestras.conteos['condicion'].most_common())
+            }
+
+    def resumen(self, conglomerados):
+        """Resumen general con los conteos de árboles y muestras. Los conglomerados
+        (pocos y sin feed de cambios) llegan ya agregados por el motor"""
+        arboles = self._preparar('arboles')
+        muestras = self._preparar('muestras')
+        with self._lock:
+            estados = muestras.conteos['estado'] if muestras else {}
+            return {
+                'conglomerados': {
+                    'total': conglomerados['total'],
+                    'por_departamento': conglomerados['por_departamento']
+                },
+                'arboles': {
+                    'total': len(arboles) if arboles else 0,
+                    'especies_unicas': len(arboles.conteos['especie']) if arboles else 0
+                },
+                'muestras': {
+                    'total': len(muestras) if muestras else 0,
+                    'pendientes': estados.get('Pendiente', 0),
+                    'procesadas': estados.get('Procesado', 0)
+                }
+            }
+
+
+# Instancia global
+agregados = AgregadosIncrementales()
@@ -0,0 +1,82 @@
+from services.backend_client import backend, ColeccionNoDisponible
+from services.cache_service import cache
+
+
+class AgregadosMongoDB:
+    """Análisis a partir de los agregados que calcula MongoDB (/api/agregados/*):
+    se transfieren conteos y estadísticas en lugar de documentos completos"""
+
+    @staticmethod
+    def _obtener(coleccion):
+        try:
+            return cache.obtener(f'agregados:{coleccion}', lambda: backend.obtener_agregados(coleccion))
+        except ColeccionNoDisponible:
+            return None
+
+    def especies(self):
+        arboles = self._obtener('arboles')
+        if not arboles or not arboles['total']:
+            return None
+        distribucion = arboles['porEspecie']
+        return {
+            'total_arboles': arboles['total'],
+            'especies_unicas': len(distribucion),
+            'distribucion_completa': distribucion,
+            'top_5_especies': dict(list(distribucion.items())[:5])
+        }
+
+    def condicion(self):
+        arboles = self._obtener('arboles')
+        if not arboles or not arboles['total']:
+            return None
+        return {
+            'total': arboles['total'],
+            'por_condicion': arboles['porCondicion'],
+            'por_estado_sanitario': arboles['porSanitario']
+        }
+
+    def dap_altura(self):
+        arboles = self._obtener('arboles')
+        if not arboles or not arboles['total']:
+            return None
+        return {
+            'dap': arboles['dap'],
+            'altura': arboles['altura'],
+            'clasificacion_dap': arboles['clasesDap'],
+            'total_analizado': arboles['total']
+        }
+
+    def muestras(self):
+        muestras = self._obtener('muestras')
+        if not muestras or not muestras['total']:
+            return None
+        return {
+            'total_muestras': muestras['total'],
+            'por_tipo': muestras['porTipo'],
+            'por_estado': muestras['porEstado'],
+            'por_condicion': muestras['porCondicion']
+        }
+
+    def resumen(self):
+        arboles = self._obtener('arboles') or {'total': 0, 'porEspecie': {}}
+        muestras = self._obtener('muestras') or {'total': 0, 'porEstado': {}}
+        conglomerados = self._obtener('conglomerados') or {'total': 0, 'porDepartamento': {}}
+        return {
+            'conglomerados': {
+                'total': conglomerados['total'],
+                'por_departamento': conglomerados['porDepartamento']
+            },
+            'arboles': {
+                'total': arboles['total'],
+                'especies_unicas': len(arboles['porEspecie'])
+            },
+            'muestras': {
+                'total': muestras['total'],
+                'pendientes': muestras['porEstado'].get('Pendiente', 0),
+                'procesadas': muestras['porEstado'].get('Procesado', 0)
+            }
+        }
+
+
+# Instancia global
+agregados_mongodb = AgregadosMongoDB()
@@ -1,162 +1,330 @@
-import requests
+from concurrent.futures import ThreadPoolExecutor
 from config import Config
-import pandas as pd
-import numpy as np
+from services.agregados import agregados
+from services.agregados_mongodb import agregados_mongodb
+from services.backend_client import backend, ColeccionNoDisponible
+from services.biomasa import estimar_biomasa
+from services.cache_service import cache
+from services.espacial import espacial
+from services.esquemas import (ColumnasArboles, ESQUEMA_ARBOLES, ESQUEMA_CONGLOMERADOS, ESQUEMA_MUESTRAS,
+                               ESQUEMA_SUBPARCELAS, proyectar)
+from services.filtros import FiltroInvalido, SIN_FILTROS
+from services.indices import IndiceArboles, Ubicaciones, agrupar_muestras, seleccionar_muestras
+from services.metricas import cronometro, en_contexto
+from services.motor_analisis import MemoInstantaneas, motor
+from services.replica import replica
+
+COLECCIONES = ('muestras', 'arboles', 'conglomerados')
+# También en la caché de instantáneas: subparcelas solo se descargan para filtrar por ubicación
+COLECCIONES_CACHE = COLECCIONES + ('subparcelas',)
+
+# Colecciones que lee cada análisis sin filtros (con filtros, también subparcelas y conglomerados)
+COLECCIONES_REPORTE = {
+    'distribucion_especies': ('arboles',),
+    'condicion_arboles': ('arboles',),
+    'dap_altura': ('arboles',),
+    'analisis_muestras': ('muestras',),
+    'resumen_general': COLECCIONES,
+    'biomasa_carbono': ('arboles', 'subparcelas', 'conglomerados'),
+    'todo': COLECCIONES
+}
+
+# Colecciones que se descargan con los agregados incrementales: los conglomerados no tienen feed de cambios
+COLECCIONES_INCREMENTALES = {
+    'resumen_general': ('conglomerados',),
+    'todo': ('conglomerados',)
+}
+
+# Análisis que devuelve analizar_todo
+TIPOS_TODO = ('distribucion_especies', 'condicion_arboles', 'analisis_muestras', 'dap_altura', 'resumen_general')
+
+# Únicos campos de árboles que usan los análisis y los filtros (ver services/esquemas.py)
+CAMPOS_ARBOLES = tuple(ESQUEMA_ARBOLES)
+CAMPOS_SUBPARCELAS = tuple(campo for campo in ESQUEMA_SUBPARCELAS if campo != '_id')
+
+# Colecciones que se descargan completas y se proyectan al guardarlas en la caché
+ESQUEMAS_REGISTROS = {'muestras': ESQUEMA_MUESTRAS, 'conglomerados': ESQUEMA_CONGLOMERADOS}
+
+# Descargas concurrentes de colecciones
+_executor = ThreadPoolExecutor(max_workers=len(COLECCIONES_CACHE), thread_name_prefix='backend')
+
+# Índices de las consultas filtradas, reconstruidos solo cuando cambia alguna instantánea
+_ubicaciones = MemoInstantaneas(Ubicaciones)
+_indices = MemoInstantaneas(IndiceArboles)
+_biomasa = MemoInstantaneas(estimar_biomasa)
+
+
+def _columnas_arboles():
+    """Columnas de árboles vacías, con los tipos de ESQUEMA_ARBOLES"""
+    return ColumnasArboles().columnas()
+
+
+def total_filas(columnas):
+    return len(columnas['dap'])
+
+
+def fuente_agregados(filtros=SIN_FILTROS, tipo_reporte=None):
+    """Fuente de agregados precalculados según MODO_AGREGACION (None = agregar filas aquí).
+    
+    Los agregados precalculados son de todo el inventario: con filtros siempre se
+    agregan las filas seleccionadas. La biomasa siempre se calcula con las filas.
+    """
+    if not filtros.vacio or tipo_reporte == 'biomasa_carbono':
+        return None
+    return {'incremental': agregados, 'mongodb': agregados_mongodb}.get(Config.MODO_AGREGACION)
+
+
+def colecciones_de(tipo_reporte, filtros=SIN_FILTROS):
+    """Colecciones que descarga un análisis ('todo' = todos los análisis)"""
+    colecciones = COLECCIONES_REPORTE[tipo_reporte]
+    if not filtros.vacio:
+        colecciones += ('subparcelas', 'conglomerados')
+    return tuple(dict.fromkeys(colecciones))
+
+
+def _parte(resultados, clave, filtros):
+    """Una parte de los agregados de árboles, también dentro de cada grupo"""
+    if not resultados:
+        return None
+    if filtros.agrupar:
+        return {grupo: agregados_grupo[clave] for grupo, agregados_grupo in resultados.items()}
+    return resultados[clave]
+
 
 class AnalisisService:
     @staticmethod
-    def obtener_datos_mongodb():
-        """Obtener datos del backend principal (MongoDB)"""
+    def _descargar_arboles(documentos=None):
+        """Consumir la exportación NDJSON de árboles construyendo columnas incrementalmente.
+        
+        Cada documento se descarta tras copiar sus campos, así que en memoria solo
+        permanecen las columnas proyectadas y tipadas de ESQUEMA_ARBOLES. En modo
+        ASGI la exportación ya llega descargada y se pasa en `documentos`.
+        """
+        if documentos is None:
+            documentos = backend.iterar_export('arboles', CAMPOS_ARBOLES)
+        columnas = ColumnasArboles()
+        
+        # Descarga, parseo y armado de columnas van intercalados: se miden juntos
+        with cronometro('export_arboles'):
+            for arbol in documentos:
+                columnas.agregar(arbol)
+        return columnas.columnas()
+    
+    @staticmethod
+    def proyectar_registros(coleccion, registros):
+        """Registros de muestras o conglomerados con solo los campos de su esquema"""
+        return proyectar(registros, ESQUEMAS_REGISTROS[coleccion])
+    
+    @staticmethod
+    def _descargar(coleccion):
+        if coleccion == 'arboles':
+            return AnalisisService._descargar_arboles()
+        if coleccion == 'subparcelas':
+            return list(backend.iterar_export('subparcelas', CAMPOS_SUBPARCELAS))
+        return AnalisisService.proyectar_registros(coleccion, backend.obtener_coleccion(coleccion))
+    
+    @staticmethod
+    def obtener_coleccion(coleccion):
+        """Obtener una colección a través de la caché de instantáneas.
+        
+        Con REPLICA_HABILITADA los árboles se leen de la réplica local: entrega el
+        mismo objeto mientras no publique otra versión, así que hace de instantánea.
+        """
         try:
-            # Obtener muestras
-            muestras_response = requests.get(f"{Config.NODE_BACKEND_URL}/api/muestras")
-            muestras = muestras_response.json() if muestras_response.status_code == 200 else []
-            
-            # Obtener árboles
-            arboles_response = requests.get(f"{Config.NODE_BACKEND_URL}/api/arboles")
-            arboles = arboles_response.json() if arboles_response.status_code == 200 else []
-            
-            # Obtener conglomerados
-            conglomerados_response = requests.get(f"{Config.NODE_BACKEND_URL}/api/conglomerados")
-            conglomerados = conglomerados_response.json() if conglomerados_response.status_code == 200 else []
-            
-            return {
-                'muestras': muestras,
-                'arboles': arboles,
-                'conglomerados': conglomerados
-            }
+            if coleccion == 'arboles' and Config.REPLICA_HABILITADA:
+                return replica.columnas_arboles()
+            return cache.obtener(coleccion, lambda: AnalisisService._descargar(coleccion))
+        except ColeccionNoDisponible:
+            # Las respuestas fallidas no se guardan en caché
+            return _columnas_arboles() if coleccion == 'arboles' else []
+    
+    @staticmethod
+    def version_datos(tipo_reporte, filtros=SIN_FILTROS):
+        """Versión de las instantáneas que leería el análisis, sin cargarlas.
+        
+        Mientras no cambie, el resultado tampoco cambia. None si alguna no está
+        cargada o vencida. Con agregados incrementales es la de los agregados (y la
+        de los conglomerados si el análisis los lee).
+        """
+        fuente = fuente_agregados(filtros, tipo_reporte)
+        versiones = []
+        if fuente is agregados:
+            versiones.append(('agregados', agregados.version()))
+            colecciones = COLECCIONES_INCREMENTALES.get(tipo_reporte, ())
+        else:
+            colecciones = colecciones_de(tipo_reporte, filtros)
+        for coleccion in colecciones:
+            if fuente is agregados_mongodb:
+                version = cache.version(f'agregados:{coleccion}')
+            elif coleccion == 'arboles' and Config.REPLICA_HABILITADA:
+                version = replica.estadisticas()['version']
+            else:
+                version = cache.version(coleccion)
+            if version is None:
+                return None
+            versiones.append((coleccion, version))
+        return (Config.MODO_AGREGACION, tuple(versiones))
+    
+    @staticmethod
+    def obtener_datos_mongodb(colecciones=COLECCIONES):
+        """Obtener datos del backend principal (MongoDB)
+        
+        Solo se descargan las colecciones indicadas, en paralelo.
+        """
+        try:
+            if len(colecciones) == 1:
+                return {colecciones[0]: AnalisisService.obtener_coleccion(colecciones[0])}
+            # en_contexto: las etapas de los hilos de descarga cuentan en el perfil de la petición
+            resultados = _executor.map(en_contexto(AnalisisService.obtener_coleccion), colecciones)
+            return dict(zip(colecciones, resultados))
         except Exception as e:
             print(f"Error al obtener datos: {e}")
             return None
     
     @staticmethod
-    def analizar_distribucion_especies():
-        """Analizar distribución de especies forestales"""
-        datos = AnalisisService.obtener_datos_mongodb()
-        if not datos or not datos['arboles']:
+    def _ubicaciones(datos):
+        return _ubicaciones.obtener(datos['subparcelas'], datos['conglomerados'])
+    
+    @staticmethod
+    def _arboles_filtrados(filtros):
+        """Agregados de los árboles que cumplen los filtros ({grupo: agregados} con agrupar)"""
+        datos = AnalisisService.obtener_datos_mongodb(('arboles', 'subparcelas', 'conglomerados'))
+        if not datos or not total_filas(datos['arboles']):
             return None
         
-        df = pd.DataFrame(datos['arboles'])
+        indice = _indices.obtener(datos['arboles'], AnalisisService._ubicaciones(datos))
+        filas = indice.seleccionar(filtros)
         
-        # Contar especies
-        distribucion = df['especie'].value_counts().to_dict()
+        def agregar(filas):
+            # En el modo paralelo se particiona por conglomerado
+            return motor.arboles_filtrados(indice.frame, filas, indice.conglomerado[filas],
+                                           len(indice.ubicaciones.conglomerados))
         
-        # Calcular estadísticas
-        total_arboles = len(df)
-        especies_unicas = df['especie'].nunique()
-        
-        # Top 5 especies
-        top_especies = df['especie'].value_counts().head(5).to_dict()
-        
-        return {
-            'total_arboles': total_arboles,
-            'especies_unicas': especies_unicas,
-            'distribucion_completa': distribucion,
-            'top_5_especies': top_especies
-        }
+        if filtros.agrupar:
+            return {grupo: agregar(filas_grupo) for grupo, filas_grupo in indice.agrupar(filas, filtros.agrupar)}
+        return agregar(filas) if len(filas) else None
     
     @staticmethod
-    def analizar_condicion_arboles():
-        """Analizar condición sanitaria de los árboles"""
-        datos = AnalisisService.obtener_datos_mongodb()
-        if not datos or not datos['arboles']:
+    def _muestras_filtradas(filtros):
+        """Análisis de las muestras que cumplen los filtros ({grupo: análisis} con agrupar)"""
+        datos = AnalisisService.obtener_datos_mongodb(('muestras', 'subparcelas', 'conglomerados'))
+        if not datos or not datos['muestras']:
             return None
         
-        df = pd.DataFrame(datos['arboles'])
-        
-        # Distribución por condición
-        condiciones = df['condicion'].value_counts().to_dict()
+        ubicaciones = AnalisisService._ubicaciones(datos)
+        muestras = seleccionar_muestras(datos['muestras'], filtros, ubicaciones)
+        if filtros.agrupar:
+            return {
+                grupo: motor.muestras_filtradas(registros)
+                for grupo, registros in agrupar_muestras(muestras, filtros.agrupar, ubicaciones).items()
+            }
+        return motor.muestras_filtradas(muestras) if muestras else None
+    
+    @staticmethod
+    def _resumen_filtrado(filtros, arboles, muestras):
+        """Resumen general de la selección. Los conglomerados solo se filtran por ubicación"""
+        datos = AnalisisService.obtener_datos_mongodb(('subparcelas', 'conglomerados'))
+        if not datos:
+            return None
         
-        # Distribución por estado sanitario
-        sanitario = df['sanitario'].value_counts().to_dict() if 'sanitario' in df.columns else {}
+        conglomerados = datos['conglomerados']
+        if filtros.por_ubicacion:
+            permitidos = AnalisisService._ubicaciones(datos).conglomerados_permitidos(filtros)
+            conglomerados = [conglomerados[i] for i in permitidos]
+        conglomerados = motor.conglomerados_filtrados(conglomerados)
         
+        especies = arboles['especies'] if arboles else None
+        estados = muestras['por_estado'] if muestras else {}
         return {
-            'total': len(df),
-            'por_condicion': condiciones,
-            'por_estado_sanitario': sanitario
+            'conglomerados': {
+                'total': conglomerados['total'],
+                'por_departamento': conglomerados['por_departamento']
+            },
+            'arboles': {
+                'total': especies['total_arboles'] if especies else 0,
+                'especies_unicas': especies['especies_unicas'] if especies else 0
+            },
+            'muestras': {
+                'total': muestras['total_muestras'] if muestras else 0,
+                'pendientes': estados.get('Pendiente', 0),
+                'procesadas': estados.get('Procesado', 0)
+            }
         }
     
     @staticmethod
-    def analizar_muestras_por_tipo():
+    def _agregados_arboles(filtros=SIN_FILTROS):
+        if not filtros.vacio:
+            return AnalisisService._arboles_filtrados(filtros)
+        datos = AnalisisService.obtener_datos_mongodb(('arboles',))
+        if not datos or not total_filas(datos['arboles']):
+            return None
+        return motor.arboles(datos['arboles'])
+    
+    @staticmethod
+    def analizar_distribucion_especies(filtros=SIN_FILTROS):
+        """Analizar distribución de especies forestales"""
+        fuente = fuente_agregados(filtros)
+        if fuente:
+            return fuente.especies()
+        return _parte(AnalisisService._agregados_arboles(filtros), 'especies', filtros)
+    
+    @staticmethod
+    def analizar_condicion_arboles(filtros=SIN_FILTROS):
+        """Analizar condición sanitaria de los árboles"""
+        fuente = fuente_agregados(filtros)
+        if fuente:
+            return fuente.condicion()
+        return _parte(AnalisisService._agregados_arboles(filtros), 'condicion', filtros)
+    
+    @staticmethod
+    def analizar_muestras_por_tipo(filtros=SIN_FILTROS):
         """Analizar distribución de muestras por tipo"""
-        datos = AnalisisService.obtener_datos_mongodb()
+        fuente = fuente_agregados(filtros)
+        if fuente:
+            return fuente.muestras()
+        if not filtros.vacio:
+            return AnalisisService._muestras_filtradas(filtros)
+        datos = AnalisisService.obtener_datos_mongodb(('muestras',))
         if not datos or not datos['muestras']:
             return None
         
-        df = pd.DataFrame(datos['muestras'])
-        
-        # Distribución por tipo
-        tipos = df['tipo'].value_counts().to_dict()
-        
-        # Distribución por estado
-        estados = df['estado'].value_counts().to_dict() if 'estado' in df.columns else {}
-        
-        # Distribución por condición
-        condiciones = df['condicion'].value_counts().to_dict() if 'condicion' in df.columns else {}
-        
-        return {
-            'total_muestras': len(df),
-            'por_tipo': tipos,
-            'por_estado': estados,
-            'por_condicion': condiciones
-        }
+        return motor.muestras(datos['muestras'])
     
     @staticmethod
-    def analizar_dap_altura():
+    def analizar_dap_altura(filtros=SIN_FILTROS):
         """Análisis estadístico de DAP y altura"""
-        datos = AnalisisService.obtener_datos_mongodb()
-        if not datos or not datos['arboles']:
-            return None
-        
-        df = pd.DataFrame(datos['arboles'])
-        
-        # Estadísticas de DAP
-        dap_stats = {
-            'promedio': float(df['dap'].mean()),
-            'mediana': float(df['dap'].median()),
-            'minimo': float(df['dap'].min()),
-            'maximo': float(df['dap'].max()),
-            'desviacion_std': float(df['dap'].std())
-        }
-        
-        # Estadísticas de altura
-        altura_stats = {
-            'promedio': float(df['altura'].mean()),
-            'mediana': float(df['altura'].median()),
-            'minimo': float(df['altura'].min()),
-            'maximo': float(df['altura'].max()),
-            'desviacion_std': float(df['altura'].std())
-        }
-        
-        # Clasificación de árboles por DAP
-        clasificacion_dap = {
-            'pequeño (<15cm)': int((df['dap'] < 15).sum()),
-            'mediano (15-30cm)': int(((df['dap'] >= 15) & (df['dap'] < 30)).sum()),
-            'grande (30-60cm)': int(((df['dap'] >= 30) & (df['dap'] < 60)).sum()),
-            'muy_grande (>=60cm)': int((df['dap'] >= 60).sum())
-        }
-        
-        return {
-            'dap': dap_stats,
-            'altura': altura_stats,
-            'clasificacion_dap': clasificacion_dap,
-            'total_analizado': len(df)
-        }
+        fuente = fuente_agregados(filtros)
+        if fuente:
+            return fuente.dap_altura()
+        return _parte(AnalisisService._agregados_arboles(filtros), 'dap_altura', filtros)
     
     @staticmethod
-    def generar_resumen_general():
+    def generar_resumen_general(filtros=SIN_FILTROS, datos=None):
         """Generar resumen general del inventario"""
-        datos = AnalisisService.obtener_datos_mongodb()
+        if filtros.agrupar:
+            raise FiltroInvalido('agrupar no está disponible en el resumen general')
+        if not filtros.vacio:
+            return AnalisisService._resumen_filtrado(
+                filtros, AnalisisService._arboles_filtrados(filtros), AnalisisService._muestras_filtradas(filtros)
+            )
+        fuente = fuente_agregados(filtros)
+        if fuente is agregados_mongodb:
+            return agregados_mongodb.resumen()
+        if fuente is agregados:
+            return agregados.resumen(motor.conglomerados(AnalisisService.obtener_coleccion('conglomerados')))
+        
+        datos = datos or AnalisisService.obtener_datos_mongodb()
         if not datos:
             return None
         
+        conglomerados = motor.conglomerados(datos['conglomerados'])
         resumen = {
             'conglomerados': {
-                'total': len(datos['conglomerados']),
-                'por_departamento': {}
+                'total': conglomerados['total'],
+                'por_departamento': conglomerados['por_departamento']
             },
             'arboles': {
-                'total': len(datos['arboles']),
+                'total': total_filas(datos['arboles']),
                 'especies_unicas': 0
             },
             'muestras': {
@@ -166,22 +334,90 @@ class AnalisisService:
             }
         }
         
-        # Análisis de conglomerados por departamento
-        if datos['conglomerados']:
-            df_cong = pd.DataFrame(datos['conglomerados'])
-            resumen['conglomerados']['por_departamento'] = df_cong['departamento'].value_counts().to_dict()
-        
-        # Análisis de árboles
-        if datos['arboles']:
-            df_arb = pd.DataFrame(datos['arboles'])
-            resumen['arboles']['especies_unicas'] = df_arb['especie'].nunique()
+        if total_filas(datos['arboles']):
+            resumen['arboles']['especies_unicas'] = motor.arboles(datos['arboles'])['especies']['especies_unicas']
         
-        # Análisis de muestras
         if datos['muestras']:
-            df_mues = pd.DataFrame(datos['muestras'])
-            if 'estado' in df_mues.columns:
-                estados = df_mues['estado'].value_counts().to_dict()
-                resumen['muestras']['pendientes'] = estados.get('Pendiente', 0)
-                resumen['muestras']['procesadas'] = estados.get('Procesado', 0)
+            estados = motor.muestras(datos['muestras'])['por_estado']
+            resumen['muestras']['pendientes'] = estados.get('Pendiente', 0)
+            resumen['muestras']['procesadas'] = estados.get('Procesado', 0)
+        
+        return resumen
+    
+    @staticmethod
+    def analizar_biomasa(filtros=SIN_FILTROS):
+        """Biomasa aérea y carbono por subparcela, conglomerado y departamento (ver services/biomasa.py)"""
+        if filtros.agrupar:
+            raise FiltroInvalido('agrupar no está disponible en biomasa (ya se agrupa por ubicación)')
+        datos = AnalisisService.obtener_datos_mongodb(COLECCIONES_REPORTE['biomasa_carbono'])
+        if not datos or not total_filas(datos['arboles']):
+            return None
         
-        return resumen
\ No newline at end of file
+        ubicaciones = AnalisisService._ubicaciones(datos)
+        indice = _indices.obtener(datos['arboles'], ubicaciones)
+        if filtros.vacio:
+            return _biomasa.obtener(indice)
+        filas = indice.seleccionar(filtros)
+        if not len(filas):
+            return None
+        conglomerados = ubicaciones.conglomerados_permitidos(filtros) if filtros.por_ubicacion else None
+        return estimar_biomasa(indice, filas, conglomerados)
+    
+    @staticmethod
+    def _espacial():
+        """Índice espacial al día, con los conglomerados de la caché de instantáneas"""
+        espacial.preparar(AnalisisService.obtener_coleccion('conglomerados'))
+        return espacial
+    
+    @staticmethod
+    def parcelas_en(consulta):
+        """Conglomerados y subparcelas dentro de un rectángulo o de un radio (ver services/espacial.py)"""
+        if consulta.caja is None and consulta.centro is None:
+            raise FiltroInvalido('Indique bbox=sur,oeste,norte,este o lat, lon y radio_km')
+        return AnalisisService._espacial().parcelas(consulta)
+    
+    @staticmethod
+    def celdas_espaciales(consulta):
+        """Árboles, densidad, riqueza de especies y DAP medio por celda (mapa de calor)"""
+        if consulta.centro:
+            raise FiltroInvalido('El mapa de calor se consulta por bbox, no por radio')
+        return AnalisisService._espacial().celdas(consulta)
+    
+    @staticmethod
+    def analizar_todo(filtros=SIN_FILTROS):
+        """Todos los análisis a partir de una sola descarga y una sola pasada por colección"""
+        if filtros.agrupar:
+            raise FiltroInvalido('agrupar no está disponible en /api/analisis/todo')
+        if not filtros.vacio:
+            arboles = AnalisisService._arboles_filtrados(filtros)
+            muestras = AnalisisService._muestras_filtradas(filtros)
+            return {
+                'distribucion_especies': _parte(arboles, 'especies', filtros),
+                'condicion_arboles': _parte(arboles, 'condicion', filtros),
+                'analisis_muestras': muestras,
+                'dap_altura': _parte(arboles, 'dap_altura', filtros),
+                'resumen_general': AnalisisService._resumen_filtrado(filtros, arboles, muestras)
+            }
+        
+        fuente = fuente_agregados()
+        if fuente:
+            return {
+                'distribucion_especies': fuente.especies(),
+                'condicion_arboles': fuente.condicion(),
+                'analisis_muestras': fuente.muestras(),
+                'dap_altura': fuente.dap_altura(),
+                'resumen_general': AnalisisService.generar_resumen_general()
+            }
+        
+        datos = AnalisisService.obtener_datos_mongodb()
+        if not datos:
+            return None
+        
+        arboles = motor.arboles(datos['arboles']) if total_filas(datos['arboles']) else None
+        return {
+            'distribucion_especies': arboles['especies'] if arboles else None,
+            'condicion_arboles': arboles['condicion'] if arboles else None,
+            'analisis_muestras': motor.muestras(datos['muestras']) if datos['muestras'] else None,
+            'dap_altura': arboles['dap_altura'] if arboles else None,
+            'resumen_general': AnalisisService.generar_resumen_general(datos=datos)
+        }
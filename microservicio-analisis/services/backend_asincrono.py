@@ -0,0 +1,98 @@
+import asyncio
+import json
+from config import Config
+from services.backend_client import BackendClient, ColeccionNoDisponible
+from services.metricas import cronometro
+
+# httpx solo lo necesita el modo ASGI (asgi.py): se importa al abrir el cliente
+
+# Estados con reintento, como el Retry de BackendClient
+ESTADOS_REINTENTO = (502, 503, 504)
+
+
+def documentos(paginas):
+    """Documentos de las páginas NDJSON descargadas con exportar (se parsean al recorrerlos)"""
+    for contenido in paginas:
+        for linea in contenido.splitlines():
+            if linea:
+                yield json.loads(linea)
+
+
+class BackendAsincrono:
+    """Cliente HTTP asíncrono del backend principal para el modo ASGI.
+
+    Mismos timeouts, reintentos y tamaño de pool que BackendClient, pero las
+    esperas no ocupan un hilo. Solo descarga: el parseo y el armado de columnas se
+    hacen después en el executor, fuera del event loop. Se abre y se cierra con el
+    ciclo de vida del servidor (lifespan).
+    """
+
+    def __init__(self):
+        self.base_url = Config.NODE_BACKEND_URL
+        self._cliente = None
+
+    async def abrir(self):
+        import httpx
+        cabeceras = {'x-auth-token': Config.NODE_BACKEND_TOKEN} if Config.NODE_BACKEND_TOKEN else {}
+        self._cliente = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers=cabeceras,
+            timeout=httpx.Timeout(Config.BACKEND_TIMEOUT_LECTURA, connect=Config.BACKEND_TIMEOUT_CONEXION),
+            limits=httpx.Limits(max_connections=Config.BACKEND_POOL_MAX,
+                                max_keepalive_connections=Config.BACKEND_POOL_MAX)
+        )
+
+    async def cerrar(self):
+        if self._cliente is not None:
+            await self._cliente.aclose()
+            self._cliente = None
+
+    async def _get(self, ruta, params=None):
+        """GET con reintentos ante errores de conexión y 502/503/504 (backoff 0.3 s)"""
+        import httpx
+        if self._cliente is None:
+            # Sin lifespan (p. ej. uvicorn --lifespan off) se abre con la primera descarga
+            await self.abrir()
+        for intento in range(Config.BACKEND_REINTENTOS + 1):
+            ultimo = intento == Config.BACKEND_REINTENTOS
+            try:
+                response = await self._cliente.get(ruta, params=params)
+                if response.status_code not in ESTADOS_REINTENTO or ultimo:
+                    return response
+            except httpx.TransportError:
+                if ultimo:
+                    raise
+            await asyncio.sleep(0.3 * 2 ** intento)
+
+    async def obtener(self, ruta, recurso, params=None):
+        """Cuerpo de un GET (bytes, sin decodificar)"""
+        with cronometro(f'backend_{recurso}'):
+            response = await self._get(ruta, params)
+        if response.status_code != 200:
+            raise ColeccionNoDisponible(f"{recurso}: HTTP {response.status_code}")
+        BackendClient._registrar_bytes(recurso, len(response.content))
+        return response.content
+
+    async def obtener_coleccion(self, coleccion):
+        return await self.obtener(f"/api/{coleccion}", coleccion)
+
+    async def exportar(self, coleccion, campos):
+        """Páginas NDJSON de /api/<coleccion>/export, con la misma paginación por _id
+        que BackendClient.iterar_export"""
+        params = {'campos': ','.join(campos)}
+        tamano_pagina = Config.BACKEND_TAMANO_PAGINA
+        if tamano_pagina > 0:
+            params['limit'] = tamano_pagina
+
+        paginas = []
+        while True:
+            contenido = await self.obtener(f"/api/{coleccion}/export", f'export_{coleccion}', params)
+            paginas.append(contenido)
+            lineas = [linea for linea in contenido.splitlines() if linea]
+            if tamano_pagina <= 0 or len(lineas) < tamano_pagina:
+                return paginas
+            params['despues'] = json.loads(lineas[-1])['_id']
+
+
+# Instancia global
+backend_asincrono = BackendAsincrono()
@@ -0,0 +1,103 @@
+import json
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from config import Config
+from services.metricas import metricas, cronometro, LIMITES_BYTES
+
+
+class ColeccionNoDisponible(Exception):
+    """El backend respondió con un estado distinto de 200 para una colección"""
+
+
+class BackendClient:
+    """Cliente HTTP del backend principal con sesión persistente (keep-alive),
+    pool de conexiones, timeouts y reintentos acotados"""
+
+    def __init__(self):
+        self.base_url = Config.NODE_BACKEND_URL
+        self.timeout = (Config.BACKEND_TIMEOUT_CONEXION, Config.BACKEND_TIMEOUT_LECTURA)
+        self.session = self._crear_sesion()
+
+    def _crear_sesion(self):
+        reintentos = Retry(
+            total=Config.BACKEND_REINTENTOS,
+            backoff_factor=0.3,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(['GET'])
+        )
+        adaptador = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=Config.BACKEND_POOL_MAX,
+            max_retries=reintentos
+        )
+        session = requests.Session()
+        session.mount('http://', adaptador)
+        session.mount('https://', adaptador)
+        if Config.NODE_BACKEND_TOKEN:
+            session.headers['x-auth-token'] = Config.NODE_BACKEND_TOKEN
+        return session
+
+    @staticmethod
+    def _registrar_bytes(recurso, cantidad):
+        metricas.observar('backend_respuesta_bytes', cantidad, 'Tamaño de las respuestas del backend', LIMITES_BYTES, recurso=recurso)
+
+    def _obtener_json(self, ruta, recurso):
+        """GET + decodificación JSON, midiendo por separado la descarga y el parseo"""
+        with cronometro(f'backend_{recurso}'):
+            response = self.get(ruta)
+            if response.status_code != 200:
+                raise ColeccionNoDisponible(f"{recurso}: HTTP {response.status_code}")
+            # Leer el cuerpo aquí para que la descarga no se cuente como parseo
+            contenido = response.content
+        self._registrar_bytes(recurso, len(contenido))
+        with cronometro(f'json_{recurso}'):
+            return response.json()
+
+    def get(self, ruta, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.get(f"{self.base_url}{ruta}", **kwargs)
+
+    def obtener_coleccion(self, coleccion):
+        """Descargar una colección completa del backend principal"""
+        return self._obtener_json(f"/api/{coleccion}", coleccion)
+
+    def obtener_agregados(self, coleccion):
+        """Conteos y estadísticas calculados en MongoDB (/api/agregados/<coleccion>)"""
+        return self._obtener_json(f"/api/agregados/{coleccion}", f"agregados_{coleccion}")
+
+    def iterar_export(self, coleccion, campos, desde=None):
+        """Recorrer /api/<coleccion>/export (NDJSON) documento por documento.
+
+        Con BACKEND_TAMANO_PAGINA > 0 la exportación se pide por páginas usando
+        el último _id recibido como cursor; con 0 se consume en un solo stream.
+        Con `desde` solo se reciben los documentos modificados a partir de esa fecha.
+        """
+        params = {'campos': ','.join(campos)}
+        if desde:
+            params['desde'] = desde
+        tamano_pagina = Config.BACKEND_TAMANO_PAGINA
+        if tamano_pagina > 0:
+            params['limit'] = tamano_pagina
+
+        total_bytes = 0
+        while True:
+            recibidos = 0
+            with self.get(f"/api/{coleccion}/export", params=params, stream=True) as response:
+                if response.status_code != 200:
+                    raise ColeccionNoDisponible(f"{coleccion}/export: HTTP {response.status_code}")
+                for linea in response.iter_lines(chunk_size=64 * 1024):
+                    if linea:
+                        total_bytes += len(linea)
+                        documento = json.loads(linea)
+                        recibidos += 1
+                        yield documento
+
+            if tamano_pagina <= 0 or recibidos < tamano_pagina:
+                self._registrar_bytes(f'export_{coleccion}', total_bytes)
+                return
+            params['despues'] = documento['_id']
+
+
+# Instancia global
+backend = BackendClient()
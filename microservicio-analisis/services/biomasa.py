@@ -0,0 +1,171 @@
+import numpy as np
+from config import Config
+from services.esquemas import a_float64
+from services.indices import SIN_UBICACION
+from services.metricas import cronometro
+
+# Biomasa aérea con la ecuación pantropical de Chave et al. (2014), ec. 4:
+#   AGB [kg] = 0.0673 · (ρ · D² · H)^0.976
+# con D = DAP [cm], H = altura total [m] y ρ = densidad de la madera [g/cm³]
+ECUACION = 'Chave et al. 2014: AGB = 0.0673 * (densidad * DAP^2 * altura)^0.976'
+COEFICIENTE = 0.0673
+EXPONENTE = 0.976
+
+# Altura estimada cuando falta (Chave et al. 2014, ec. 6a), con E = BIOMASA_E:
+#   ln(H) = 0.893 - E + 0.760 · ln(D) - 0.0340 · ln(D)²
+
+# Fracción de carbono de la biomasa (IPCC 2006) y relación CO2/C
+FRACCION_CARBONO = 0.47
+CO2_POR_CARBONO = 44 / 12
+
+# Densidad de la madera [g/cm³] por especie (medias de la Global Wood Density
+# Database, Zanne et al. 2009). Sin la especie se usa la media de su género y,
+# sin el género, BIOMASA_DENSIDAD_DEFECTO.
+DENSIDADES = {
+    'Alnus acuminata': 0.38,
+    'Anacardium excelsum': 0.41,
+    'Brosimum alicastrum': 0.65,
+    'Cecropia peltata': 0.36,
+    'Cedrela odorata': 0.42,
+    'Ceiba pentandra': 0.29,
+    'Clusia multiflora': 0.62,
+    'Cordia alliodora': 0.48,
+    'Enterolobium cyclocarpum': 0.42,
+    'Ficus insipida': 0.39,
+    'Gmelina arborea': 0.43,
+    'Guazuma ulmifolia': 0.50,
+    'Hura crepitans': 0.38,
+    'Inga edulis': 0.58,
+    'Jacaranda copaia': 0.34,
+    'Miconia squamulosa': 0.61,
+    'Ochroma pyramidale': 0.13,
+    'Podocarpus oleifolius': 0.49,
+    'Pseudosamanea guachapele': 0.56,
+    'Quercus humboldtii': 0.71,
+    'Swietenia macrophylla': 0.53,
+    'Tabebuia rosea': 0.52,
+    'Virola sebifera': 0.45,
+    'Weinmannia tomentosa': 0.63
+}
+
+
+def _densidades_por_genero():
+    generos = {}
+    for especie, densidad in DENSIDADES.items():
+        generos.setdefault(especie.split()[0], []).append(densidad)
+    return {genero: sum(valores) / len(valores) for genero, valores in generos.items()}
+
+
+_GENEROS = _densidades_por_genero()
+
+
+def densidad_madera(especie):
+    """(densidad, origen) de una especie: 'especie', 'genero' o 'defecto'"""
+    nombre = ' '.join(str(especie).split()).capitalize() if especie else ''
+    if nombre in DENSIDADES:
+        return DENSIDADES[nombre], 'especie'
+    genero = nombre.split(' ')[0]
+    if genero in _GENEROS:
+        return _GENEROS[genero], 'genero'
+    return Config.BIOMASA_DENSIDAD_DEFECTO, 'defecto'
+
+
+def _grupos(nombres, codigos, biomasa, areas):
+    """{nombre: totales} de los grupos con árboles; areas[c] en ha (0 = desconocida).
+
+    Un bincount por nivel: la posición 0 es el código -1 (sin ubicación).
+    """
+    posiciones = np.asarray(codigos, dtype=np.intp) + 1
+    conteos = np.bincount(posiciones, minlength=len(nombres) + 1)
+    sumas = np.bincount(posiciones, weights=biomasa, minlength=len(nombres) + 1)
+    grupos = {}
+    for posicion in np.flatnonzero(conteos):
+        codigo = posicion - 1
+        total = float(sumas[posicion])
+        area = float(areas[codigo]) if codigo >= 0 and areas[codigo] > 0 else None
+        grupos[str(nombres[codigo]) if codigo >= 0 else SIN_UBICACION] = _totales(int(conteos[posicion]), total, area)
+    return grupos
+
+
+def _totales(arboles, biomasa_mg, area_ha=None):
+    carbono = biomasa_mg * FRACCION_CARBONO
+    totales = {
+        'arboles': arboles,
+        'biomasa_mg': biomasa_mg,
+        'carbono_mg': carbono,
+        'co2e_mg': carbono * CO2_POR_CARBONO
+    }
+    if area_ha is not None:
+        totales['area_ha'] = area_ha
+        totales['biomasa_mg_ha'] = biomasa_mg / area_ha
+        totales['carbono_mg_ha'] = carbono / area_ha
+    return totales
+
+
+def estimar_biomasa(indice, filas=None, conglomerados=None):
+    """Biomasa aérea y carbono de los árboles de un IndiceArboles (todas las filas o
+    las seleccionadas), agregados por subparcela, conglomerado y departamento.
+
+    Todo el cálculo por árbol son expresiones numpy sobre las columnas: la densidad
+    se resuelve una vez por especie y se reparte con los códigos de la categoría.
+    Los árboles sin DAP válido no se estiman; la altura faltante se estima con el
+    modelo altura-diámetro. El área es la de las subparcelas registradas
+    (BIOMASA_AREA_SUBPARCELA_HA cada una), con o sin árboles; el total cuenta solo
+    los `conglomerados` indicados (códigos; None = todos).
+    """
+    with cronometro('biomasa'):
+        frame = indice.frame
+        if filas is None:
+            filas = np.arange(len(frame))
+        # Medidas en float32 (services/esquemas.py); la ecuación se evalúa en float64
+        dap = a_float64(frame['dap'].to_numpy()[filas])
+        altura = a_float64(frame['altura'].to_numpy()[filas])
+        validos = np.isfinite(dap) & (dap > 0)
+        filas, dap, altura = filas[validos], dap[validos], altura[validos]
+
+        # Densidad por categoría de especie, con la de -1 (sin especie) al final
+        especies = frame['especie'].cat.categories
+        resueltas = [densidad_madera(especie) for especie in especies]
+        tabla = np.array([densidad for densidad, _ in resueltas] + [Config.BIOMASA_DENSIDAD_DEFECTO])
+        codigos_especie = indice.especie[filas]
+        densidad = tabla[codigos_especie]
+        por_defecto = np.array([origen == 'defecto' for _, origen in resueltas] + [True])[codigos_especie]
+
+        sin_altura = ~(np.isfinite(altura) & (altura > 0))
+        ln_dap = np.log(dap)
+        altura_estimada = np.exp(0.893 - Config.BIOMASA_E + 0.760 * ln_dap - 0.0340 * ln_dap ** 2)
+        altura = np.where(sin_altura, altura_estimada, altura)
+
+        # kg -> Mg (toneladas)
+        biomasa = COEFICIENTE * (densidad * dap ** 2 * altura) ** EXPONENTE / 1000
+
+        ubicaciones = indice.ubicaciones
+        area = Config.BIOMASA_AREA_SUBPARCELA_HA
+        subparcelas_por_conglomerado = np.bincount(
+            np.array([c for c in ubicaciones.subparcelas.values() if c >= 0], dtype=np.intp),
+            minlength=len(ubicaciones.conglomerados)
+        )
+        area_conglomerado = subparcelas_por_conglomerado * area
+        area_departamento = np.bincount(ubicaciones.departamento, weights=area_conglomerado,
+                                        minlength=len(ubicaciones.departamentos))
+        codigo_subparcela = indice.codigo_subparcela
+        areas_subparcela = np.full(len(codigo_subparcela.categories), area)
+
+        area_total = area_conglomerado if conglomerados is None else area_conglomerado[conglomerados]
+        total = _totales(len(filas), float(biomasa.sum()), float(area_total.sum()) or None)
+        total.update({
+            'alturas_estimadas': int(sin_altura.sum()),
+            'densidad_por_defecto': int(por_defecto.sum()),
+            'sin_dap': int((~validos).sum())
+        })
+        return {
+            'ecuacion': ECUACION,
+            'fraccion_carbono': FRACCION_CARBONO,
+            'total': total,
+            'por_departamento': _grupos(ubicaciones.departamentos, indice.departamento[filas], biomasa,
+                                        area_departamento),
+            'por_conglomerado': _grupos(ubicaciones.conglomerados, indice.conglomerado[filas], biomasa,
+                                        area_conglomerado),
+            'por_subparcela': _grupos(codigo_subparcela.categories, codigo_subparcela.codes[filas], biomasa,
+                                      areas_subparcela)
+        }
@@ -0,0 +1,200 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from config import Config
+
+
+def _serializable(valor):
+    # Columnas numpy: su tipo, forma y un hash de los bytes (sin pasar por listas)
+    tipo = getattr(valor, 'dtype', None)
+    if tipo is not None and tipo.kind != 'O' and hasattr(valor, 'tobytes'):
+        return f'{tipo.str}{getattr(valor, "shape", ())}{hashlib.sha256(valor.tobytes()).hexdigest()}'
+    if hasattr(valor, 'tolist'):
+        return valor.tolist()
+    return str(valor)
+
+
+def huella(valor):
+    """Hash del contenido de un valor (None si no se puede serializar).
+
+    Es el mismo en todos los workers y entre recargas con los mismos datos, así que
+    sirve de versión para las respuestas HTTP.
+    """
+    try:
+        contenido = json.dumps(valor, sort_keys=True, separators=(',', ':'), default=_serializable)
+    except (TypeError, ValueError):
+        return None
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()[:32]
+
+
+class _Carga:
+    """Carga en curso de una clave, compartida por todas las peticiones que la esperan.
+
+    Si la hace una corrutina (modo ASGI), las demás corrutinas la esperan con
+    `listo` sin ocupar un hilo; los hilos siempre esperan con `evento`.
+    """
+
+    def __init__(self, asincrona=False):
+        self.evento = threading.Event()
+        self.listo = asyncio.Event() if asincrona else None
+        self.valor = None
+        self.error = None
+
+    def _resultado(self):
+        if self.error is not None:
+            raise self.error
+        return self.valor
+
+    def esperar(self):
+        self.evento.wait()
+        return self._resultado()
+
+    async def esperar_async(self):
+        if self.listo is not None:
+            await self.listo.wait()
+        else:
+            # La carga la hace un hilo: se espera en el executor del loop
+            await asyncio.get_running_loop().run_in_executor(None, self.evento.wait)
+        return self._resultado()
+
+    def terminar(self):
+        self.evento.set()
+        if self.listo is not None:
+            self.listo.set()
+
+
+class SnapshotCache:
+    """Caché en memoria de instantáneas del backend con TTL, límite de tamaño (LRU)
+    y de-duplicación de cargas concurrentes (single-flight)"""
+
+    def __init__(self, ttl, max_entradas):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()
+        self._cargas = {}
+        self._generacion = 0
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+
+    def _consultar(self, clave, asincrona=False):
+        """(True, valor vigente) o (False, (carga en curso, es_lider, generación))"""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada[1] > time.monotonic():
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return True, entrada[0]
+
+            self.fallos += 1
+            carga = self._cargas.get(clave)
+            lider = carga is None
+            if lider:
+                carga = self._cargas[clave] = _Carga(asincrona)
+            return False, (carga, lider, self._generacion)
+
+    def _completar(self, clave, carga, generacion):
+        with self._lock:
+            # Si hubo una invalidación durante la carga, el valor ya no es confiable
+            if carga.error is None and generacion == self._generacion:
+                self._guardar(clave, carga.valor)
+            self._cargas.pop(clave, None)
+        carga.terminar()
+
+    def obtener(self, clave, cargar):
+        """Devolver el valor vigente de `clave` o cargarlo con `cargar()`.
+
+        Si otra petición ya está cargando la misma clave, se espera su resultado
+        en lugar de repetir la consulta al backend.
+        """
+        vigente, valor = self._consultar(clave)
+        if vigente:
+            return valor
+        carga, lider, generacion = valor
+        if not lider:
+            return carga.esperar()
+
+        try:
+            carga.valor = cargar()
+        except Exception as e:
+            carga.error = e
+            raise
+        finally:
+            self._completar(clave, carga, generacion)
+        return carga.valor
+
+    async def obtener_async(self, clave, cargar):
+        """Como obtener, con `cargar` una corrutina: ni la descarga ni la espera de
+        la carga de otra petición ocupan un hilo"""
+        vigente, valor = self._consultar(clave, asincrona=True)
+        if vigente:
+            return valor
+        carga, lider, generacion = valor
+        if not lider:
+            return await carga.esperar_async()
+
+        try:
+            carga.valor = await cargar()
+        except BaseException as e:
+            # También si se cancela la corrutina: quienes esperan no deben quedar colgados
+            carga.error = e if isinstance(e, Exception) else RuntimeError(f'Carga de {clave} cancelada')
+            raise
+        finally:
+            self._completar(clave, carga, generacion)
+        return carga.valor
+
+    def _guardar(self, clave, valor):
+        # La huella (versión) se calcula con la primera consulta de version()
+        self._entradas[clave] = (valor, time.monotonic() + self.ttl, None)
+        self._entradas.move_to_end(clave)
+        while len(self._entradas) > self.max_entradas:
+            self._entradas.popitem(last=False)
+            self.desalojos += 1
+
+    def version(self, clave):
+        """Versión del valor vigente de `clave` (None si no hay o ya venció), sin cargarlo.
+
+        Es la huella del contenido: una recarga con los mismos datos conserva la versión.
+        """
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None or entrada[1] <= time.monotonic():
+                return None
+            if entrada[2] is not None:
+                return entrada[2]
+        # Fuera del lock: serializar una instantánea grande no frena a las demás claves
+        version = huella(entrada[0])
+        with self._lock:
+            if self._entradas.get(clave) is entrada:
+                self._entradas[clave] = (entrada[0], entrada[1], version)
+        return version
+
+    def invalidar(self, clave=None):
+        """Invalidar una clave o, si no se indica ninguna, toda la caché"""
+        with self._lock:
+            self._generacion += 1
+            if clave is None:
+                eliminadas = len(self._entradas)
+                self._entradas.clear()
+            else:
+                eliminadas = 1 if self._entradas.pop(clave, None) is not None else 0
+        return eliminadas
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'entradas': len(self._entradas),
+                'max_entradas': self.max_entradas,
+                'ttl_segundos': self.ttl,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'desalojos': self.desalojos
+            }
+
+
+# Instancia global
+cache = SnapshotCache(Config.CACHE_TTL, Config.CACHE_MAX_ENTRADAS)
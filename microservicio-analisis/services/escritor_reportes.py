@@ -0,0 +1,125 @@
+import atexit
+import queue
+import threading
+import time
+
+
+class EscritorReportes:
+    """Persistencia en segundo plano de reportes: cola acotada y escritura por lotes.
+
+    Las peticiones solo encolan el reporte; un hilo los agrupa y los escribe con
+    `executemany`, de modo que la respuesta no espera el INSERT ni el commit.
+    """
+
+    def __init__(self, escribir_lote, tamano_cola, tamano_lote, intervalo, espera_cola,
+                 mantenimiento=None, intervalo_mantenimiento=0):
+        self._escribir_lote = escribir_lote
+        # Tarea periódica opcional (p. ej. compactar el historial) en el mismo hilo
+        self._mantenimiento = mantenimiento
+        self.intervalo_mantenimiento = intervalo_mantenimiento
+        self._proximo_mantenimiento = time.monotonic() + intervalo_mantenimiento
+        self._cola = queue.Queue(maxsize=tamano_cola)
+        self.tamano_lote = tamano_lote
+        self.intervalo = intervalo
+        self.espera_cola = espera_cola
+        self._hilo = None
+        self._detener = threading.Event()
+        self._lock = threading.Lock()
+        self._registrado = False
+        self.escritos = 0
+        self.descartados = 0
+        self.fallidos = 0
+
+    def _asegurar_hilo(self):
+        # El hilo se crea con el primer reporte (y no al importar) para que cada
+        # proceso de trabajo tenga el suyo
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._detener.clear()
+                self._hilo = threading.Thread(target=self._ejecutar, name='escritor-reportes', daemon=True)
+                self._hilo.start()
+                if not self._registrado:
+                    atexit.register(self.detener)
+                    self._registrado = True
+
+    def encolar(self, reporte):
+        """Encolar un reporte. Si la cola está llena se espera hasta `espera_cola`
+        segundos (contrapresión) y después se descarta."""
+        self._asegurar_hilo()
+        try:
+            self._cola.put(reporte, timeout=self.espera_cola)
+            return True
+        except queue.Full:
+            self.descartados += 1
+            print(f"⚠️ Cola de reportes llena, reporte '{reporte['tipo_reporte']}' descartado")
+            return False
+
+    def _tomar_lote(self):
+        """Esperar el primer reporte y completar el lote durante `intervalo` segundos"""
+        try:
+            lote = [self._cola.get(timeout=self.intervalo)]
+        except queue.Empty:
+            return []
+        limite = time.monotonic() + self.intervalo
+        while len(lote) < self.tamano_lote:
+            restante = limite - time.monotonic()
+            try:
+                lote.append(self._cola.get(timeout=restante) if restante > 0 else self._cola.get_nowait())
+            except queue.Empty:
+                break
+        return lote
+
+    def _escribir(self, lote):
+        try:
+            self._escribir_lote(lote)
+            self.escritos += len(lote)
+        except Exception as e:
+            self.fallidos += len(lote)
+            print(f"❌ Error al guardar lote de {len(lote)} reportes: {e}")
+
+    def _mantener(self):
+        if not self._mantenimiento or self.intervalo_mantenimiento <= 0:
+            return
+        if time.monotonic() < self._proximo_mantenimiento:
+            return
+        self._proximo_mantenimiento = time.monotonic() + self.intervalo_mantenimiento
+        try:
+            self._mantenimiento()
+        except Exception as e:
+            print(f"❌ Error en mantenimiento de reportes: {e}")
+
+    def _ejecutar(self):
+        while not self._detener.is_set():
+            lote = self._tomar_lote()
+            if lote:
+                self._escribir(lote)
+            self._mantener()
+
+    def vaciar(self):
+        """Escribir de inmediato todo lo que quede en la cola"""
+        lote = []
+        while True:
+            try:
+                lote.append(self._cola.get_nowait())
+            except queue.Empty:
+                break
+            if len(lote) >= self.tamano_lote:
+                self._escribir(lote)
+                lote = []
+        if lote:
+            self._escribir(lote)
+
+    def detener(self, timeout=10):
+        """Detener el hilo y escribir los reportes pendientes (al apagar el proceso)"""
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout)
+        self.vaciar()
+
+    def estadisticas(self):
+        return {
+            'en_cola': self._cola.qsize(),
+            'escritos': self.escritos,
+            'descartados': self.descartados,
+            'fallidos': self.fallidos
+        }
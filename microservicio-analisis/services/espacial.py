@@ -0,0 +1,580 @@
+import math
+import sys
+import threading
+import time
+from collections import Counter, namedtuple
+import numpy as np
+from config import Config
+from services.agregados import EstadisticaWelford
+from services.backend_client import backend
+from services.filtros import FiltroInvalido
+
+# Radio medio de la Tierra en km (distancias haversine)
+RADIO_TIERRA_KM = 6371.0088
+KM_POR_GRADO = math.pi * RADIO_TIERRA_KM / 180
+
+# Campos del feed de cambios que usa el índice
+CAMPOS = {
+    'subparcelas': ('codigoCong', 'latitud', 'longitud', 'updatedAt'),
+    'arboles': ('subparcela', 'especie', 'dap', 'updatedAt')
+}
+
+
+class Caja(namedtuple('Caja', ('sur', 'oeste', 'norte', 'este'))):
+    """Rectángulo de coordenadas en grados (no cruza el antimeridiano)"""
+
+    __slots__ = ()
+
+    def contiene(self, latitud, longitud):
+        return self.sur <= latitud <= self.norte and self.oeste <= longitud <= self.este
+
+
+def distancia_km(latitud1, longitud1, latitud2, longitud2):
+    """Distancia haversine entre dos puntos"""
+    fi1, fi2 = math.radians(latitud1), math.radians(latitud2)
+    seno_lat = math.sin((fi2 - fi1) / 2)
+    seno_lon = math.sin(math.radians(longitud2 - longitud1) / 2)
+    a = seno_lat ** 2 + math.cos(fi1) * math.cos(fi2) * seno_lon ** 2
+    return 2 * RADIO_TIERRA_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def caja_de_radio(latitud, longitud, radio_km):
+    """Rectángulo que contiene el círculo (toda la franja de longitudes cerca de los polos)"""
+    delta_lat = radio_km / KM_POR_GRADO
+    sur, norte = max(latitud - delta_lat, -90.0), min(latitud + delta_lat, 90.0)
+    coseno = math.cos(math.radians(max(abs(sur), abs(norte))))
+    if coseno <= 0 or delta_lat / coseno >= 180:
+        return Caja(sur, -180.0, norte, 180.0)
+    delta_lon = delta_lat / coseno
+    return Caja(sur, max(longitud - delta_lon, -180.0), norte, min(longitud + delta_lon, 180.0))
+
+
+def _coordenadas(documento):
+    """(latitud, longitud) válidas de un documento o (None, None)"""
+    try:
+        latitud, longitud = float(documento.get('latitud')), float(documento.get('longitud'))
+    except (TypeError, ValueError):
+        return None, None
+    if not (-90 <= latitud <= 90 and -180 <= longitud <= 180):
+        return None, None
+    return latitud, longitud
+
+
+def _numero(argumentos, nombre):
+    texto = argumentos.get(nombre, '').strip()
+    if not texto:
+        return None
+    try:
+        valor = float(texto)
+    except ValueError:
+        raise FiltroInvalido(f'{nombre} debe ser un número')
+    if not math.isfinite(valor):
+        raise FiltroInvalido(f'{nombre} debe ser un número')
+    return valor
+
+
+class ConsultaEspacial(namedtuple('ConsultaEspacial', ('caja', 'centro', 'radio_km', 'celda'))):
+    """Zona de una consulta espacial y tamaño de celda del mapa de calor.
+
+    La zona es un rectángulo (bbox=sur,oeste,norte,este) o un círculo (lat, lon
+    y radio_km); celda es el lado de las celdas en grados (None = el de la malla).
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def desde_argumentos(cls, argumentos):
+        """Leer la consulta de request.args"""
+        caja = None
+        texto = argumentos.get('bbox', '').strip()
+        if texto:
+            try:
+                caja = Caja(*(float(valor) for valor in texto.split(',')))
+            except (TypeError, ValueError):
+                raise FiltroInvalido('bbox debe ser sur,oeste,norte,este')
+            if not (-90 <= caja.sur <= caja.norte <= 90 and -180 <= caja.oeste <= caja.este <= 180):
+                raise FiltroInvalido('bbox fuera de rango: -90 <= sur <= norte <= 90 y -180 <= oeste <= este <= 180')
+
+        latitud, longitud, radio_km = (_numero(argumentos, nombre) for nombre in ('lat', 'lon', 'radio_km'))
+        centro = None
+        if latitud is not None or longitud is not None or radio_km is not None:
+            if latitud is None or longitud is None or radio_km is None:
+                raise FiltroInvalido('Una consulta por radio necesita lat, lon y radio_km')
+            if not (-90 <= latitud <= 90 and -180 <= longitud <= 180):
+                raise FiltroInvalido('lat o lon fuera de rango')
+            if radio_km <= 0:
+                raise FiltroInvalido('radio_km debe ser mayor que 0')
+            centro = (latitud, longitud)
+        if caja and centro:
+            raise FiltroInvalido('Indique bbox o lat/lon/radio_km, no ambos')
+
+        celda = _numero(argumentos, 'celda')
+        if celda is not None and celda <= 0:
+            raise FiltroInvalido('celda debe ser mayor que 0')
+        return cls(caja, centro, radio_km, celda)
+
+
+class MallaEspacial:
+    """Índice de puntos en una malla regular de celdas de `tamano` grados.
+
+    Cada celda ocupada guarda las claves de sus puntos, así que una consulta por
+    rectángulo o radio solo recorre las celdas que la cubren y compara
+    coordenadas con los puntos de esas celdas. Mover o quitar un punto es O(1).
+    """
+
+    def __init__(self, tamano):
+        self.tamano = tamano
+        self._celdas = {}
+        self._puntos = {}
+
+    def __len__(self):
+        return len(self._puntos)
+
+    def celda(self, latitud, longitud):
+        """(fila, columna) de la celda de un punto"""
+        return math.floor(latitud / self.tamano), math.floor(longitud / self.tamano)
+
+    def caja_de(self, celda):
+        fila, columna = celda
+        return Caja(*(round(valor * self.tamano, 6) for valor in (fila, columna, fila + 1, columna + 1)))
+
+    def mover(self, clave, latitud, longitud):
+        """Agregar o mover un punto; devuelve (celda anterior o None, celda nueva)"""
+        anterior = self.quitar(clave)
+        celda = self.celda(latitud, longitud)
+        self._celdas.setdefault(celda, set()).add(clave)
+        self._puntos[clave] = (latitud, longitud, celda)
+        return anterior, celda
+
+    def quitar(self, clave):
+        """Quitar un punto; devuelve su celda (None si no estaba)"""
+        punto = self._puntos.pop(clave, None)
+        if punto is None:
+            return None
+        celda = punto[2]
+        claves = self._celdas[celda]
+        claves.discard(clave)
+        if not claves:
+            del self._celdas[celda]
+        return celda
+
+    def punto(self, clave):
+        """(latitud, longitud, celda) de un punto o None"""
+        return self._puntos.get(clave)
+
+    def celda_de(self, clave):
+        punto = self._puntos.get(clave)
+        return punto[2] if punto else None
+
+    def claves(self, celda):
+        return self._celdas.get(celda, ())
+
+    def celdas_en(self, caja=None):
+        """Celdas ocupadas que tocan el rectángulo (todas sin caja), ordenadas"""
+        if caja is None:
+            return sorted(self._celdas)
+        fila_sur, columna_oeste = self.celda(caja.sur, caja.oeste)
+        fila_norte, columna_este = self.celda(caja.norte, caja.este)
+        if (fila_norte - fila_sur + 1) * (columna_este - columna_oeste + 1) > len(self._celdas):
+            # Rectángulo grande: se recorren las celdas ocupadas, no las posibles
+            return sorted(celda for celda in self._celdas
+                          if fila_sur <= celda[0] <= fila_norte and columna_oeste <= celda[1] <= columna_este)
+        return [(fila, columna)
+                for fila in range(fila_sur, fila_norte + 1)
+                for columna in range(columna_oeste, columna_este + 1)
+                if (fila, columna) in self._celdas]
+
+    def en_caja(self, caja):
+        """Claves de los puntos dentro del rectángulo"""
+        encontradas = []
+        for celda in self.celdas_en(caja):
+            for clave in self._celdas[celda]:
+                latitud, longitud, _ = self._puntos[clave]
+                if caja.contiene(latitud, longitud):
+                    encontradas.append(clave)
+        return encontradas
+
+    def en_radio(self, latitud, longitud, radio_km):
+        """[(clave, distancia en km)] de los puntos dentro del círculo, de la más cercana a la más lejana"""
+        encontradas = []
+        for clave in self.en_caja(caja_de_radio(latitud, longitud, radio_km)):
+            distancia = distancia_km(latitud, longitud, *self._puntos[clave][:2])
+            if distancia <= radio_km:
+                encontradas.append((clave, distancia))
+        encontradas.sort(key=lambda encontrada: (encontrada[1], encontrada[0]))
+        return encontradas
+
+
+class _Agregado:
+    """Árboles, conteo por especie y DAP de una subparcela o de una celda"""
+
+    __slots__ = ('arboles', 'especies', 'dap')
+
+    def __init__(self):
+        self.arboles = 0
+        self.especies = Counter()
+        self.dap = EstadisticaWelford()
+
+    def sumar(self, especie, dap, signo):
+        self.arboles += signo
+        if especie is not None:
+            self.especies[especie] += signo
+            if self.especies[especie] <= 0:
+                del self.especies[especie]
+        if not math.isnan(dap):
+            if signo > 0:
+                self.dap.agregar(dap)
+            else:
+                self.dap.quitar(dap)
+
+    def combinar(self, otro):
+        self.arboles += otro.arboles
+        self.especies.update(otro.especies)
+        self.dap.combinar(otro.dap)
+
+    def resumen(self, subparcelas):
+        """Densidad por hectárea muestreada (BIOMASA_AREA_SUBPARCELA_HA por subparcela)"""
+        area = subparcelas * Config.BIOMASA_AREA_SUBPARCELA_HA
+        return {
+            'arboles': self.arboles,
+            'densidad_arboles_ha': self.arboles / area if area else None,
+            'riqueza_especies': len(self.especies),
+            'dap_promedio': self.dap.media if self.dap.n else None
+        }
+
+
+def _texto(valor):
+    # Los valores repetidos (especies, _id de subparcela) comparten un solo str
+    return sys.intern(valor if isinstance(valor, str) else str(valor)) if valor is not None else None
+
+
+def _posterior(marca, actualizado):
+    return actualizado if actualizado and (marca is None or actualizado > marca) else marca
+
+
+class _Estado:
+    """Subparcelas en la malla, árboles por subparcela y agregados por celda.
+
+    Los agregados de una celda se combinan a partir de sus subparcelas la primera
+    vez que se consultan y se guardan hasta que un cambio de un árbol o de una
+    subparcela de la celda los descarta.
+
+    Los árboles se guardan por columnas: una posición por árbol con el código de su
+    subparcela y de su especie (int32) y su DAP (float64), en lugar de una tupla
+    por árbol.
+    """
+
+    CAPACIDAD_INICIAL = 1024
+
+    def __init__(self, tamano):
+        self.malla = MallaEspacial(tamano)
+        self.subparcelas = {}
+        self.parcelas = {}
+        self.celdas = {}
+        self._posiciones = {}
+        self._capacidad = self.CAPACIDAD_INICIAL
+        # Subparcelas y especies comparten la tabla de textos
+        self._codigos = {}
+        self._textos = []
+        self._subparcela = np.full(self.CAPACIDAD_INICIAL, -1, dtype=np.int32)
+        self._especie = np.full(self.CAPACIDAD_INICIAL, -1, dtype=np.int32)
+        self._dap = np.full(self.CAPACIDAD_INICIAL, np.nan)
+
+    def __len__(self):
+        return len(self._posiciones)
+
+    def _invalidar(self, celda):
+        if celda is not None:
+            self.celdas.pop(celda, None)
+
+    def aplicar_subparcelas(self, documentos):
+        """Aplicar subparcelas nuevas o modificadas; devuelve el mayor updatedAt visto"""
+        marca = None
+        for documento in documentos:
+            clave = _texto(documento['_id'])
+            self.subparcelas[clave] = documento.get('codigoCong')
+            latitud, longitud = _coordenadas(documento)
+            if latitud is None:
+                self._invalidar(self.malla.quitar(clave))
+            else:
+                for celda in self.malla.mover(clave, latitud, longitud):
+                    self._invalidar(celda)
+            marca = _posterior(marca, documento.get('updatedAt'))
+        return marca
+
+    def _posicion(self, arbol_id):
+        """Posición del árbol en las columnas y si ya estaba"""
+        posicion = self._posiciones.get(arbol_id)
+        if posicion is not None:
+            return posicion, True
+        posicion = len(self._posiciones)
+        if posicion == self._capacidad:
+            self._crecer()
+        self._posiciones[arbol_id] = posicion
+        return posicion, False
+
+    def _crecer(self):
+        self._capacidad *= 2
+        for nombre, relleno in (('_subparcela', -1), ('_especie', -1), ('_dap', np.nan)):
+            columna = getattr(self, nombre)
+            nueva = np.full(self._capacidad, relleno, dtype=columna.dtype)
+            nueva[:len(columna)] = columna
+            setattr(self, nombre, nueva)
+
+    def _codigo(self, valor):
+        texto = _texto(valor)
+        if texto is None:
+            return -1
+        codigo = self._codigos.get(texto)
+        if codigo is None:
+            codigo = self._codigos[texto] = len(self._textos)
+            self._textos.append(texto)
+        return codigo
+
+    def fila(self, posicion):
+        """(subparcela, especie, dap) del árbol en esa posición"""
+        subparcela, especie = int(self._subparcela[posicion]), int(self._especie[posicion])
+        return (self._textos[subparcela] if subparcela >= 0 else None,
+                self._textos[especie] if especie >= 0 else None,
+                float(self._dap[posicion]))
+
+    def _sumar(self, subparcela, especie, dap, signo):
+        parcela = self.parcelas.get(subparcela)
+        if parcela is None:
+            parcela = self.parcelas[subparcela] = _Agregado()
+        parcela.sumar(especie, dap, signo)
+        if not parcela.arboles:
+            del self.parcelas[subparcela]
+        if self.celdas:
+            # En una reconstrucción todavía no hay agregados de celdas que descartar
+            self._invalidar(self.malla.celda_de(subparcela))
+
+    def aplicar_arboles(self, documentos):
+        """Aplicar árboles nuevos o modificados; devuelve el mayor updatedAt visto"""
+        marca = None
+        for documento in documentos:
+            posicion, existente = self._posicion(documento['_id'])
+            if existente:
+                self._sumar(*self.fila(posicion), -1)
+            dap = documento.get('dap')
+            self._subparcela[posicion] = self._codigo(documento.get('subparcela'))
+            self._especie[posicion] = self._codigo(documento.get('especie'))
+            self._dap[posicion] = float(dap) if dap is not None else math.nan
+            self._sumar(*self.fila(posicion), 1)
+            marca = _posterior(marca, documento.get('updatedAt'))
+        return marca
+
+    def agregado_celda(self, celda):
+        agregado = self.celdas.get(celda)
+        if agregado is None:
+            agregado = _Agregado()
+            for subparcela in self.malla.claves(celda):
+                parcela = self.parcelas.get(subparcela)
+                if parcela is not None:
+                    agregado.combinar(parcela)
+            self.celdas[celda] = agregado
+        return agregado
+
+
+class IndiceEspacial:
+    """Índice espacial de subparcelas y conglomerados con agregados de árboles por celda.
+
+    Subparcelas y árboles se mantienen con el feed de cambios del backend
+    (exportación con ?desde=) como los agregados incrementales: una consulta solo
+    trae lo modificado desde la sincronización anterior y recorre las celdas de
+    su zona, nunca el inventario. Cada ESPACIAL_RECONCILIACION segundos un hilo
+    aparte lo reconstruye completo sin el lock para reflejar los borrados y solo
+    lo reemplaza al final, así las consultas no lo esperan. Los árboles se ubican
+    en las coordenadas de su subparcela; los conglomerados (pocos) se reindexan
+    cuando cambia su instantánea en la caché.
+    """
+
+    def __init__(self, tamano):
+        self.tamano = tamano
+        self._estado = _Estado(tamano)
+        self._conglomerados = MallaEspacial(tamano)
+        self._datos_conglomerados = {}
+        self._registros_conglomerados = None
+        self._marcas = {coleccion: None for coleccion in CAMPOS}
+        self._ultima_sincronizacion = None
+        self._ultima_reconciliacion = None
+        self._reconciliando = False
+        self._lock = threading.RLock()
+        self._sincronizacion = threading.Lock()
+
+    def sincronizar(self, forzar=False):
+        """Traer los cambios desde la última marca; reconstruir todo si toca.
+
+        La primera carga y forzar=True reconstruyen en este hilo; las
+        reconstrucciones periódicas se lanzan en segundo plano. Los cambios se
+        descargan sin el lock del índice y solo se toma para aplicarlos; mientras
+        una sincronización corre, las demás consultas no la esperan salvo que
+        todavía no haya datos.
+        """
+        if not self._sincronizacion.acquire(blocking=forzar or self._ultima_reconciliacion is None):
+            return
+        try:
+            ahora = time.monotonic()
+            if (not forzar and self._ultima_sincronizacion is not None
+                    and ahora - self._ultima_sincronizacion < Config.ESPACIAL_INTERVALO):
+                return
+            if forzar or self._ultima_reconciliacion is None:
+                self._reconciliar()
+                self._ultima_sincronizacion = ahora
+                return
+
+            cambios = {
+                coleccion: list(backend.iterar_export(coleccion, CAMPOS[coleccion], desde=self._marcas[coleccion]))
+                for coleccion in CAMPOS
+            }
+            with self._lock:
+                # Primero las subparcelas: los árboles nuevos ya encuentran su celda
+                for coleccion, aplicar in (('subparcelas', self._estado.aplicar_subparcelas),
+                                           ('arboles', self._estado.aplicar_arboles)):
+                    self._marcas[coleccion] = _posterior(self._marcas[coleccion], aplicar(cambios[coleccion]))
+            self._ultima_sincronizacion = ahora
+
+            if not self._reconciliando and ahora - self._ultima_reconciliacion >= Config.ESPACIAL_RECONCILIACION:
+                self._reconciliando = True
+                threading.Thread(target=self._reconciliar_en_segundo_plano, daemon=True).start()
+        finally:
+            self._sincronizacion.release()
+
+    def _reconciliar(self):
+        """Reconstruir el estado aparte (los borrados desaparecen) y reemplazarlo.
+
+        Las marcas vuelven a las que había al empezar: la siguiente sincronización
+        aplica otra vez los cambios que llegaron durante la reconstrucción, sin
+        efecto sobre los que ya estaban incluidos.
+        """
+        inicio = time.monotonic()
+        marcas_iniciales = dict(self._marcas)
+        estado, marcas = _Estado(self.tamano), {}
+        for coleccion, aplicar in (('subparcelas', estado.aplicar_subparcelas),
+                                   ('arboles', estado.aplicar_arboles)):
+            marcas[coleccion] = aplicar(backend.iterar_export(coleccion, CAMPOS[coleccion]))
+        with self._lock:
+            self._estado = estado
+            for coleccion, marca in marcas.items():
+                inicial = marcas_iniciales[coleccion]
+                self._marcas[coleccion] = inicial if inicial is not None else marca
+            self._ultima_reconciliacion = inicio
+
+    def _reconciliar_en_segundo_plano(self):
+        try:
+            self._reconciliar()
+        except Exception as e:
+            # Se reintenta en la siguiente sincronización; mientras, sigue el índice actual
+            print(f"Error al reconstruir el índice espacial: {e}")
+        finally:
+            self._reconciliando = False
+
+    def _indexar_conglomerados(self, registros):
+        malla, datos = MallaEspacial(self.tamano), {}
+        for registro in registros:
+            latitud, longitud = _coordenadas(registro)
+            codigo = registro.get('codigo')
+            if latitud is not None and codigo:
+                malla.mover(codigo, latitud, longitud)
+                datos[codigo] = registro
+        self._conglomerados, self._datos_conglomerados = malla, datos
+        self._registros_conglomerados = registros
+
+    def preparar(self, conglomerados):
+        """Poner el índice al día antes de una consulta (sin backend se responde con lo último conocido)"""
+        with self._lock:
+            # Una lista vacía también es la respuesta sin backend: se conservan los conocidos
+            if conglomerados and conglomerados is not self._registros_conglomerados:
+                self._indexar_conglomerados(conglomerados)
+        try:
+            self.sincronizar()
+        except Exception as e:
+            print(f"Error al sincronizar el índice espacial: {e}")
+
+    def _en_zona(self, malla, consulta):
+        """[(clave, distancia en km o None)] de los puntos de la zona de la consulta"""
+        if consulta.centro:
+            return malla.en_radio(*consulta.centro, consulta.radio_km)
+        return [(clave, None) for clave in sorted(malla.en_caja(consulta.caja))]
+
+    def parcelas(self, consulta):
+        """Conglomerados y subparcelas (con sus agregados) dentro del rectángulo o del radio"""
+        with self._lock:
+            estado = self._estado
+            conglomerados = []
+            for codigo, distancia in self._en_zona(self._conglomerados, consulta):
+                registro = self._datos_conglomerados[codigo]
+                latitud, longitud, _ = self._conglomerados.punto(codigo)
+                conglomerado = {
+                    'codigo': codigo,
+                    'departamento': registro.get('departamento'),
+                    'municipio': registro.get('municipio'),
+                    'latitud': latitud,
+                    'longitud': longitud
+                }
+                if distancia is not None:
+                    conglomerado['distancia_km'] = round(distancia, 3)
+                conglomerados.append(conglomerado)
+
+            subparcelas, arboles = [], 0
+            for clave, distancia in self._en_zona(estado.malla, consulta):
+                latitud, longitud, _ = estado.malla.punto(clave)
+                agregado = estado.parcelas.get(clave) or _Agregado()
+                subparcela = {
+                    '_id': clave,
+                    'codigoCong': estado.subparcelas.get(clave),
+                    'latitud': latitud,
+                    'longitud': longitud,
+                    **agregado.resumen(1)
+                }
+                if distancia is not None:
+                    subparcela['distancia_km'] = round(distancia, 3)
+                subparcelas.append(subparcela)
+                arboles += agregado.arboles
+
+            return {
+                'total': {'conglomerados': len(conglomerados), 'subparcelas': len(subparcelas), 'arboles': arboles},
+                'conglomerados': conglomerados,
+                'subparcelas': subparcelas
+            }
+
+    def celdas(self, consulta):
+        """Mapa de calor: árboles, densidad, riqueza de especies y DAP medio por celda.
+
+        Las celdas de `consulta.celda` grados se arman con celdas de la malla (el
+        lado se redondea a un múltiplo del de la malla) y las del borde del
+        rectángulo se cuentan completas.
+        """
+        factor = max(1, round(consulta.celda / self.tamano)) if consulta.celda else 1
+        malla_celdas = MallaEspacial(self.tamano * factor)
+        with self._lock:
+            estado = self._estado
+            gruesas = {}
+            for celda in estado.malla.celdas_en(consulta.caja):
+                gruesa = (celda[0] // factor, celda[1] // factor)
+                agregado, subparcelas = gruesas.get(gruesa) or (_Agregado(), 0)
+                agregado.combinar(estado.agregado_celda(celda))
+                gruesas[gruesa] = (agregado, subparcelas + len(estado.malla.claves(celda)))
+
+        total, total_subparcelas, celdas = _Agregado(), 0, []
+        for gruesa in sorted(gruesas):
+            agregado, subparcelas = gruesas[gruesa]
+            caja = malla_celdas.caja_de(gruesa)
+            celdas.append({
+                'celda': list(caja),
+                'centro': [round((caja.sur + caja.norte) / 2, 6), round((caja.oeste + caja.este) / 2, 6)],
+                'subparcelas': subparcelas,
+                **agregado.resumen(subparcelas)
+            })
+            total.combinar(agregado)
+            total_subparcelas += subparcelas
+
+        return {
+            'celda_grados': round(self.tamano * factor, 6),
+            'total': {'celdas': len(celdas), 'subparcelas': total_subparcelas, **total.resumen(total_subparcelas)},
+            'celdas': celdas
+        }
+
+
+# Instancia global
+espacial = IndiceEspacial(Config.ESPACIAL_CELDA_GRADOS)
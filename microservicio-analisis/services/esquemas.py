@@ -0,0 +1,204 @@
+import sys
+from array import array
+from collections import namedtuple
+import numpy as np
+from services.metricas import cronometro
+
+# Esquemas de ingestión: las únicas columnas que se guardan de cada colección y su
+# tipo. Los textos repetidos van como categorías (códigos enteros + tabla de valores)
+# y las medidas en float32: las estadísticas se calculan en float64 sobre los valores
+# recuperados con a_float64, así que solo se pierde precisión más allá del 7.º dígito.
+CATEGORIA = 'category'
+REAL = 'float32'
+FECHA = 'datetime64[ms]'
+# Texto casi único (códigos, fechas ISO): se guarda tal cual
+TEXTO = 'object'
+
+ESQUEMA_ARBOLES = {
+    'especie': CATEGORIA,
+    'dap': REAL,
+    'altura': REAL,
+    'condicion': CATEGORIA,
+    'sanitario': CATEGORIA,
+    'codigoSubparcela': CATEGORIA,
+    'subparcela': CATEGORIA,
+    'createdAt': FECHA
+}
+
+# /api/muestras entrega el árbol con populate: solo se conserva lo que usan los filtros
+ESQUEMA_MUESTRAS = {
+    'tipo': CATEGORIA,
+    'estado': CATEGORIA,
+    'condicion': CATEGORIA,
+    'fecha': TEXTO,
+    'arbol': {
+        'especie': CATEGORIA,
+        'condicion': CATEGORIA,
+        'codigoSubparcela': CATEGORIA,
+        'subparcela': CATEGORIA
+    }
+}
+
+# latitud y longitud las usa el índice espacial (services/espacial.py)
+ESQUEMA_CONGLOMERADOS = {
+    'codigo': TEXTO,
+    'departamento': CATEGORIA,
+    'municipio': CATEGORIA,
+    'latitud': REAL,
+    'longitud': REAL
+}
+
+# Las subparcelas ya llegan proyectadas por el export (_id y codigoCong)
+ESQUEMA_SUBPARCELAS = {
+    '_id': TEXTO,
+    'codigoCong': TEXTO
+}
+
+
+def columnas_de(esquema):
+    """Columnas planas de un esquema (sin los sub-documentos)"""
+    return tuple(campo for campo, tipo in esquema.items() if not isinstance(tipo, dict))
+
+
+class ColumnaCodificada(namedtuple('ColumnaCodificada', ('codigos', 'categorias'))):
+    """Columna de texto codificada con diccionario: códigos enteros (-1 = sin valor)
+    y la tupla de categorías a la que apuntan"""
+
+    __slots__ = ()
+
+    def __len__(self):
+        return len(self.codigos)
+
+
+def _tipo_codigo(categorias):
+    return np.int16 if categorias < np.iinfo(np.int16).max else np.int32
+
+
+def categorica(columna):
+    import pandas as pd
+    if isinstance(columna, ColumnaCodificada):
+        # Sin recorrer textos: los códigos ya son los de la categoría
+        return pd.Categorical.from_codes(columna.codigos, categories=columna.categorias)
+    return pd.Categorical(columna)
+
+
+class ColumnasArboles:
+    """Columnas de árboles armadas documento a documento según ESQUEMA_ARBOLES.
+
+    Cada texto se codifica al leerlo (un int32 por fila en lugar de una referencia
+    a un str) y al terminar las categorías se ordenan, como las de pd.Categorical,
+    y los códigos se reducen a int16 cuando caben.
+    """
+
+    def __init__(self):
+        self._categoricos = [campo for campo, tipo in ESQUEMA_ARBOLES.items() if tipo == CATEGORIA]
+        self._reales = [campo for campo, tipo in ESQUEMA_ARBOLES.items() if tipo == REAL]
+        self._fechas = [campo for campo, tipo in ESQUEMA_ARBOLES.items() if tipo == FECHA]
+        self._codigos = {campo: array('i') for campo in self._categoricos}
+        self._indices = {campo: {} for campo in self._categoricos}
+        self._valores = {campo: array('f') for campo in self._reales}
+        self._textos_fecha = {campo: [] for campo in self._fechas}
+
+    def agregar(self, documento):
+        for campo in self._categoricos:
+            valor = documento.get(campo)
+            if valor is None:
+                self._codigos[campo].append(-1)
+                continue
+            if not isinstance(valor, str):
+                valor = str(valor)
+            indices = self._indices[campo]
+            codigo = indices.get(valor)
+            if codigo is None:
+                codigo = indices[valor] = len(indices)
+            self._codigos[campo].append(codigo)
+        for campo in self._reales:
+            valor = documento.get(campo)
+            self._valores[campo].append(float(valor) if valor is not None else np.nan)
+        for campo in self._fechas:
+            self._textos_fecha[campo].append(documento.get(campo) or 'NaT')
+
+    def _codificada(self, campo):
+        valores = list(self._indices[campo])
+        orden = sorted(range(len(valores)), key=valores.__getitem__)
+        # Código de llegada -> posición de su categoría ordenada; la última traduce el -1
+        nuevo = np.empty(len(valores) + 1, dtype=np.int32)
+        nuevo[orden] = np.arange(len(valores), dtype=np.int32)
+        nuevo[-1] = -1
+        codigos = nuevo[np.frombuffer(self._codigos[campo], dtype=np.int32)]
+        return ColumnaCodificada(codigos.astype(_tipo_codigo(len(valores))), tuple(valores[i] for i in orden))
+
+    def columnas(self):
+        columnas = {campo: self._codificada(campo) for campo in self._categoricos}
+        for campo in self._reales:
+            columnas[campo] = np.frombuffer(self._valores[campo], dtype=np.float32) if len(self._valores[campo]) \
+                else np.empty(0, dtype=np.float32)
+        for campo in self._fechas:
+            # '2024-01-31T12:00:00.000Z' sin la Z (UTC)
+            columnas[campo] = np.array([texto.rstrip('Z') for texto in self._textos_fecha[campo]], dtype=FECHA)
+        return columnas
+
+
+def construir_frame_arboles(columnas):
+    """Frame columnar tipado: categorías para los textos y float32 para las medidas.
+
+    Los textos pueden venir como listas o como ColumnaCodificada (caché de
+    instantáneas y réplica local).
+    """
+    import pandas as pd
+    with cronometro('dataframe_arboles'):
+        return pd.DataFrame({
+            campo: categorica(columnas[campo]) if ESQUEMA_ARBOLES[campo] == CATEGORIA
+            else np.asarray(columnas[campo], dtype=np.float32)
+            for campo in ('especie', 'condicion', 'sanitario', 'dap', 'altura')
+        })
+
+
+def _proyectar(documento, esquema):
+    proyectado = {}
+    for campo, tipo in esquema.items():
+        valor = documento.get(campo)
+        if isinstance(tipo, dict):
+            # Sub-documento con populate; si llega solo el _id se conserva tal cual
+            valor = _proyectar(valor, tipo) if isinstance(valor, dict) else valor
+        elif tipo == CATEGORIA and isinstance(valor, str):
+            # Los valores repetidos comparten un solo objeto str
+            valor = sys.intern(valor)
+        proyectado[campo] = valor
+    return proyectado
+
+
+def a_float64(valores):
+    """Medidas float32 -> float64 sin el ruido de representación (6.3 y no 6.300000190734863).
+
+    float32 conserva 7 cifras significativas: se redondea a ellas, así que un valor
+    que llegó en el JSON con 7 cifras o menos vuelve a ser el mismo float64.
+    """
+    valores = np.asarray(valores, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        escala = 10.0 ** (6 - np.floor(np.log10(np.abs(valores))))
+        redondeados = np.round(valores * escala) / escala
+    # 0, NaN e infinitos quedan como estaban
+    return np.where(np.isfinite(redondeados), redondeados, valores)
+
+
+def proyectar(registros, esquema):
+    """Registros con solo los campos del esquema (lo demás del JSON se descarta)"""
+    return [_proyectar(registro, esquema) for registro in registros]
+
+
+def _columna(registros, campo, tipo):
+    valores = [registro.get(campo) for registro in registros]
+    if tipo == CATEGORIA:
+        return categorica(valores)
+    if tipo == REAL:
+        return np.array([np.nan if valor is None else valor for valor in valores], dtype=np.float32)
+    return np.array(valores, dtype=tipo)
+
+
+def construir_frame(registros, esquema, campos=None):
+    """Frame tipado de las columnas planas de un esquema (o solo de `campos`) a partir de registros"""
+    import pandas as pd
+    campos = campos or columnas_de(esquema)
+    return pd.DataFrame({campo: _columna(registros, campo, esquema[campo]) for campo in campos},
+                        index=pd.RangeIndex(len(registros)))
@@ -0,0 +1,178 @@
+import csv
+import importlib.util
+import io
+import json
+from config import Config
+from database import trozos_lob
+from services.metricas import metricas, LIMITES_BYTES
+
+# Columnas de cada reporte exportado, además de parametros y resultado (texto JSON)
+COLUMNAS = ('id', 'tipo_reporte', 'titulo', 'generado_por', 'repeticiones', 'created_at', 'ultima_vez')
+CLOBS = ('parametros', 'resultado')
+# Valor de un CLOB NULL en NDJSON: un reporte sin filtros se guarda sin parametros
+VACIOS = {'parametros': b'{}', 'resultado': b'null'}
+
+# formato -> tipo de contenido
+FORMATOS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+    'parquet': 'application/vnd.apache.parquet'
+}
+
+
+class FormatoNoDisponible(Exception):
+    """Formato de exportación desconocido o sin su dependencia instalada"""
+
+
+def validar_formato(formato):
+    """Comprobar el formato antes de empezar a responder (después ya no hay código de error)"""
+    if formato not in FORMATOS:
+        raise FormatoNoDisponible(f"Formato no soportado: {formato} (ndjson, csv o parquet)")
+    # Solo se comprueba que esté instalado: pyarrow se importa al escribir el primer parquet
+    if formato == 'parquet' and importlib.util.find_spec('pyarrow') is None:
+        raise FormatoNoDisponible("El formato parquet requiere pyarrow (pip install pyarrow)")
+
+
+def _en_bloques(partes, tamano):
+    """Juntar los fragmentos en bloques de ~tamano bytes: un write al socket por bloque"""
+    bloque = bytearray()
+    for parte in partes:
+        bloque += parte
+        if len(bloque) >= tamano:
+            yield bytes(bloque)
+            bloque.clear()
+    if bloque:
+        yield bytes(bloque)
+
+
+def _ndjson(reportes):
+    """Una línea JSON por reporte; parametros y resultado se copian del CLOB por trozos
+    sin decodificarlos (ya son JSON)"""
+    for reporte in reportes:
+        cabecera = json.dumps({columna: reporte[columna] for columna in COLUMNAS}, ensure_ascii=False)
+        # Sin la llave de cierre: se agregan los CLOB y se cierra al final
+        yield cabecera[:-1].encode('utf-8')
+        for campo in CLOBS:
+            yield f', "{campo}": '.encode('utf-8')
+            vacio = True
+            for trozo in trozos_lob(reporte[campo]):
+                vacio = False
+                yield trozo.encode('utf-8')
+            if vacio:
+                yield VACIOS[campo]
+        yield b'}\n'
+
+
+def _csv(reportes):
+    """CSV con cabecera; parametros y resultado van como texto JSON entre comillas"""
+    linea = io.StringIO()
+    escritor = csv.writer(linea, lineterminator='')
+    escritor.writerow(COLUMNAS + CLOBS)
+    yield (linea.getvalue() + '\n').encode('utf-8')
+
+    for reporte in reportes:
+        linea.seek(0)
+        linea.truncate()
+        escritor.writerow([reporte[columna] for columna in COLUMNAS])
+        yield linea.getvalue().encode('utf-8')
+        for campo in CLOBS:
+            # Mismo escape que csv con QUOTE_MINIMAL, aplicado trozo a trozo
+            yield b',"'
+            for trozo in trozos_lob(reporte[campo]):
+                yield trozo.replace('"', '""').encode('utf-8')
+            yield b'"'
+        yield b'\n'
+
+
+class _SalidaParquet(io.RawIOBase):
+    """Archivo de solo escritura que acumula lo escrito hasta que se retira"""
+
+    def __init__(self):
+        self._partes = []
+        self._posicion = 0
+
+    def writable(self):
+        return True
+
+    def write(self, datos):
+        self._partes.append(bytes(datos))
+        self._posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self._posicion
+
+    def retirar(self):
+        datos = b''.join(self._partes)
+        self._partes = []
+        return datos
+
+
+def _parquet(reportes):
+    """Parquet con un row group cada EXPORTACION_PARQUET_FILAS reportes.
+
+    A diferencia de NDJSON y CSV, los CLOB de un row group se leen completos: la
+    memoria depende del tamaño del grupo y no del total exportado.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    esquema = pa.schema([
+        ('id', pa.int64()), ('tipo_reporte', pa.string()), ('titulo', pa.string()),
+        ('generado_por', pa.string()), ('repeticiones', pa.int64()), ('created_at', pa.string()),
+        ('ultima_vez', pa.string()), ('parametros', pa.string()), ('resultado', pa.string())
+    ])
+    salida = _SalidaParquet()
+
+    def escribir(escritor, grupo):
+        columnas = {campo: [reporte[campo] for reporte in grupo] for campo in esquema.names}
+        escritor.write_table(pa.table(columnas, schema=esquema))
+
+    escritor = pq.ParquetWriter(salida, esquema, compression='zstd')
+    try:
+        grupo = []
+        for reporte in reportes:
+            for campo in CLOBS:
+                reporte[campo] = ''.join(trozos_lob(reporte[campo])) if reporte[campo] is not None else None
+            grupo.append(reporte)
+            if len(grupo) >= Config.EXPORTACION_PARQUET_FILAS:
+                escribir(escritor, grupo)
+                grupo = []
+                yield salida.retirar()
+        if grupo:
+            escribir(escritor, grupo)
+    finally:
+        escritor.close()
+    yield salida.retirar()
+
+
+def exportar(reportes, formato):
+    """Generador de bytes con los reportes en el formato pedido (ver validar_formato)"""
+    generadores = {'ndjson': _ndjson, 'csv': _csv, 'parquet': _parquet}
+    total = 0
+    try:
+        for bloque in _en_bloques(generadores[formato](reportes), Config.EXPORTACION_BLOQUE_BYTES):
+            total += len(bloque)
+            yield bloque
+    finally:
+        metricas.observar('exportacion_bytes', total, 'Tamaño de las exportaciones de reportes', LIMITES_BYTES, formato=formato)
+
+
+def anticipar(bloques):
+    """Generar ya el primer bloque (ejecuta la consulta) y devolver un generador equivalente.
+
+    Así un error de Oracle todavía puede responderse con un código de error, antes
+    de enviar las cabeceras del streaming.
+    """
+    primero = next(bloques, None)
+
+    def continuar():
+        try:
+            if primero is not None:
+                yield primero
+            yield from bloques
+        finally:
+            # También si el cliente se desconecta: libera la sesión de Oracle
+            bloques.close()
+
+    return continuar()
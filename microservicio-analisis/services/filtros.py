@@ -0,0 +1,87 @@
+from collections import namedtuple
+from datetime import datetime, time, timezone
+
+# Dimensiones por las que se puede agrupar un análisis (?agrupar=)
+AGRUPACIONES = ('departamento', 'municipio', 'conglomerado', 'especie', 'condicion')
+
+# Filtros que admiten varios valores (?especie=a,b o ?especie=a&especie=b)
+_LISTAS = ('departamento', 'municipio', 'conglomerado', 'especie', 'condicion')
+
+
+class FiltroInvalido(ValueError):
+    """Parámetro de filtro o agrupación con un valor no válido (responde 400)"""
+
+
+def leer_fecha(valor, nombre):
+    """Fecha ISO (2024-01-31 o con hora, con Z, con desfase o sin zona) en hora UTC sin zona.
+
+    hasta es inclusivo: una fecha sin hora cubre el día completo.
+    """
+    try:
+        fecha = datetime.fromisoformat(valor.rstrip('Z'))
+    except ValueError:
+        raise FiltroInvalido(f'Fecha no válida en {nombre}: {valor}')
+    if fecha.tzinfo is not None:
+        # 2024-01-01T00:00:00+05:00: se compara con las fechas del backend, en UTC sin zona
+        fecha = fecha.astimezone(timezone.utc).replace(tzinfo=None)
+    if nombre == 'hasta' and len(valor) == 10:
+        fecha = datetime.combine(fecha.date(), time.max)
+    return fecha
+
+
+class Filtros(namedtuple('Filtros', ('departamento', 'municipio', 'conglomerado', 'subparcela',
+                                     'especie', 'condicion', 'desde', 'hasta', 'agrupar'))):
+    """Filtros y agrupación de un análisis.
+
+    Las listas son tuplas (vacías = sin filtro), subparcela es un prefijo de
+    codigoSubparcela y desde/hasta acotan la fecha de registro del árbol
+    (createdAt) o la fecha de la muestra. Las tuplas ordenadas hacen que los
+    mismos filtros en otro orden den los mismos parámetros guardados.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def desde_argumentos(cls, argumentos):
+        """Leer los filtros de request.args"""
+        valores = {}
+        for nombre in _LISTAS:
+            elementos = (valor.strip() for texto in argumentos.getlist(nombre) for valor in texto.split(','))
+            valores[nombre] = tuple(sorted({valor for valor in elementos if valor}))
+
+        valores['subparcela'] = argumentos.get('subparcela', '').strip() or None
+        for nombre in ('desde', 'hasta'):
+            texto = argumentos.get(nombre, '').strip()
+            valores[nombre] = leer_fecha(texto, nombre) if texto else None
+        if valores['desde'] and valores['hasta'] and valores['desde'] > valores['hasta']:
+            raise FiltroInvalido('desde es posterior a hasta')
+
+        agrupar = argumentos.get('agrupar', '').strip() or None
+        if agrupar and agrupar not in AGRUPACIONES:
+            raise FiltroInvalido(f"agrupar debe ser uno de: {', '.join(AGRUPACIONES)}")
+        valores['agrupar'] = agrupar
+        return cls(**valores)
+
+    @property
+    def vacio(self):
+        return not any(self)
+
+    @property
+    def por_ubicacion(self):
+        return bool(self.departamento or self.municipio or self.conglomerado)
+
+    def parametros(self):
+        """Filtros aplicados, para guardarlos en `parametros` del reporte"""
+        parametros = {}
+        for nombre, valor in self._asdict().items():
+            if not valor:
+                continue
+            if isinstance(valor, datetime):
+                valor = valor.isoformat()
+            elif isinstance(valor, tuple):
+                valor = list(valor)
+            parametros[nombre] = valor
+        return parametros
+
+
+SIN_FILTROS = Filtros((), (), (), None, (), (), None, None, None)
@@ -0,0 +1,225 @@
+from datetime import datetime
+import numpy as np
+from services.metricas import cronometro
+from services.esquemas import categorica, construir_frame_arboles
+
+# Etiqueta de los árboles o muestras sin subparcela enlazada al agrupar por ubicación
+SIN_UBICACION = 'sin ubicación'
+
+
+class _Particion:
+    """Filas agrupadas por código (listas de filas en formato CSR).
+
+    `orden` son las filas ordenadas por código y `limites[c]:limites[c + 1]` el
+    tramo del código c, así que las filas de un grupo se leen sin recorrer las
+    demás. Las filas con código -1 quedan antes de limites[0].
+    """
+
+    def __init__(self, codigos, cantidad):
+        self.orden = np.argsort(codigos, kind='stable')
+        self.limites = np.searchsorted(codigos[self.orden], np.arange(cantidad + 1))
+
+    def filas(self, codigos):
+        """Filas de uno o varios códigos, en orden ascendente"""
+        tramos = [self.orden[self.limites[c]:self.limites[c + 1]] for c in codigos]
+        if not tramos:
+            return np.empty(0, dtype=np.intp)
+        filas = np.concatenate(tramos)
+        if len(tramos) > 1:
+            filas.sort()
+        return filas
+
+
+def _posiciones(nombres, valores):
+    """Códigos de los valores pedidos dentro de una tabla de nombres (se ignoran los desconocidos)"""
+    indices = {nombre: i for i, nombre in enumerate(nombres)}
+    return [indices[valor] for valor in valores if valor in indices]
+
+
+def _codificar(valores):
+    """Textos -> (códigos int32, tabla de nombres)"""
+    nombres = sorted(set(valores))
+    indices = {nombre: i for i, nombre in enumerate(nombres)}
+    return np.array([indices[valor] for valor in valores], dtype=np.int32), tuple(nombres)
+
+
+class Ubicaciones:
+    """Subparcela -> conglomerado -> departamento y municipio.
+
+    Los árboles enlazan su subparcela por _id (campo subparcela) y la subparcela
+    al conglomerado por codigoCong.
+    """
+
+    def __init__(self, subparcelas, conglomerados):
+        self.conglomerados = tuple(conglomerado.get('codigo') for conglomerado in conglomerados)
+        self.departamento, self.departamentos = _codificar([c.get('departamento') or '' for c in conglomerados])
+        self.municipio, self.municipios = _codificar([c.get('municipio') or '' for c in conglomerados])
+
+        por_codigo = {codigo: i for i, codigo in enumerate(self.conglomerados)}
+        self.subparcelas = {
+            subparcela['_id']: por_codigo.get(subparcela.get('codigoCong'), -1)
+            for subparcela in subparcelas
+        }
+
+    def conglomerado_de(self, subparcela):
+        """Código del conglomerado de una subparcela (-1 si no se conoce)"""
+        return self.subparcelas.get(subparcela, -1)
+
+    def conglomerados_permitidos(self, filtros):
+        """Códigos de los conglomerados que cumplen los filtros de ubicación"""
+        permitidos = np.ones(len(self.conglomerados), dtype=bool)
+        if filtros.conglomerado:
+            permitidos &= np.isin(np.arange(len(self.conglomerados)),
+                                  _posiciones(self.conglomerados, filtros.conglomerado))
+        if filtros.departamento:
+            permitidos &= np.isin(self.departamento, _posiciones(self.departamentos, filtros.departamento))
+        if filtros.municipio:
+            permitidos &= np.isin(self.municipio, _posiciones(self.municipios, filtros.municipio))
+        return np.flatnonzero(permitidos)
+
+    def tabla(self, dimension):
+        """Nombres de los códigos de departamento, municipio o conglomerado"""
+        return {'departamento': self.departamentos, 'municipio': self.municipios,
+                'conglomerado': self.conglomerados}[dimension]
+
+    def nombre(self, dimension, conglomerado):
+        """Departamento, municipio o código de un conglomerado para agrupar"""
+        if conglomerado < 0:
+            return SIN_UBICACION
+        if dimension == 'conglomerado':
+            return self.conglomerados[conglomerado]
+        return self.tabla(dimension)[getattr(self, dimension)[conglomerado]]
+
+
+def _con_centinela(tabla):
+    """Tabla de traducción de códigos con -1 al final: tabla[-1] traduce el código -1"""
+    return np.append(np.asarray(tabla, dtype=np.int32), np.int32(-1))
+
+
+class IndiceArboles:
+    """Índices de una instantánea de árboles para consultar solo las filas que
+    cumplen los filtros.
+
+    Se construye una vez por instantánea (ver MemoInstantaneas): el frame
+    tipado, el conglomerado, departamento y municipio de cada fila y listas de
+    filas por departamento, conglomerado y especie. Un filtro de ubicación o
+    de especie parte de la lista de filas de sus grupos, y el resto de los
+    filtros se evalúa solo sobre esas filas.
+    """
+
+    def __init__(self, columnas, ubicaciones):
+        with cronometro('indice_arboles'):
+            self.ubicaciones = ubicaciones
+            self.frame = construir_frame_arboles(columnas)
+
+            subparcela = categorica(columnas['subparcela'])
+            conglomerado_de = _con_centinela([ubicaciones.conglomerado_de(str(id_)) for id_ in subparcela.categories])
+            self.conglomerado = conglomerado_de[subparcela.codes]
+            self.departamento = _con_centinela(ubicaciones.departamento)[self.conglomerado]
+            self.municipio = _con_centinela(ubicaciones.municipio)[self.conglomerado]
+
+            self.codigo_subparcela = categorica(columnas['codigoSubparcela'])
+            self.creado = np.asarray(columnas['createdAt'], dtype='datetime64[ms]')
+
+            self.especie = self.frame['especie'].cat.codes.to_numpy()
+            self.condicion = self.frame['condicion'].cat.codes.to_numpy()
+            self.por_departamento = _Particion(self.departamento, len(ubicaciones.departamentos))
+            self.por_conglomerado = _Particion(self.conglomerado, len(ubicaciones.conglomerados))
+            self.por_especie = _Particion(self.especie, len(self.frame['especie'].cat.categories))
+
+    def seleccionar(self, filtros):
+        """Filas (ascendentes) que cumplen los filtros"""
+        especies = _posiciones(self.frame['especie'].cat.categories, filtros.especie)
+
+        if filtros.por_ubicacion:
+            if filtros.departamento and not (filtros.municipio or filtros.conglomerado):
+                filas = self.por_departamento.filas(_posiciones(self.ubicaciones.departamentos, filtros.departamento))
+            else:
+                filas = self.por_conglomerado.filas(self.ubicaciones.conglomerados_permitidos(filtros))
+            if filtros.especie:
+                filas = filas[np.isin(self.especie[filas], especies)]
+        elif filtros.especie:
+            filas = self.por_especie.filas(especies)
+        else:
+            filas = np.arange(len(self.frame))
+
+        if filtros.condicion:
+            condiciones = _posiciones(self.frame['condicion'].cat.categories, filtros.condicion)
+            filas = filas[np.isin(self.condicion[filas], condiciones)]
+        if filtros.subparcela:
+            categorias = self.codigo_subparcela.categories
+            prefijos = [i for i, codigo in enumerate(categorias) if str(codigo).startswith(filtros.subparcela)]
+            filas = filas[np.isin(self.codigo_subparcela.codes[filas], prefijos)]
+        if filtros.desde:
+            filas = filas[self.creado[filas] >= np.datetime64(filtros.desde, 'ms')]
+        if filtros.hasta:
+            filas = filas[self.creado[filas] <= np.datetime64(filtros.hasta, 'ms')]
+        return filas
+
+    def agrupar(self, filas, dimension):
+        """[(nombre del grupo, filas del grupo)] de las filas seleccionadas"""
+        codigos = getattr(self, dimension)[filas]
+        if dimension in ('especie', 'condicion'):
+            nombres, vacio = tuple(map(str, self.frame[dimension].cat.categories)), 'sin valor'
+        else:
+            nombres, vacio = self.ubicaciones.tabla(dimension), SIN_UBICACION
+
+        orden = np.argsort(codigos, kind='stable')
+        ordenados = codigos[orden]
+        cortes = np.flatnonzero(np.diff(ordenados)) + 1
+        grupos = []
+        for tramo in np.split(orden, cortes):
+            if len(tramo):
+                codigo = int(codigos[tramo[0]])
+                grupos.append((nombres[codigo] if codigo >= 0 else vacio, filas[tramo]))
+        return grupos
+
+
+def _fecha_muestra(muestra):
+    fecha = muestra.get('fecha')
+    try:
+        return datetime.fromisoformat(fecha.rstrip('Z')) if fecha else None
+    except ValueError:
+        return None
+
+
+def _arbol_de(muestra):
+    """Árbol de la muestra (/api/muestras lo entrega con populate)"""
+    arbol = muestra.get('arbol')
+    return arbol if isinstance(arbol, dict) else {}
+
+
+def seleccionar_muestras(registros, filtros, ubicaciones):
+    """Muestras que cumplen los filtros. Ubicación, especie y condición se evalúan
+    sobre el árbol de la muestra; desde/hasta sobre la fecha de la muestra."""
+    permitidos = set(ubicaciones.conglomerados_permitidos(filtros).tolist()) if filtros.por_ubicacion else None
+    seleccionadas = []
+    for muestra in registros:
+        arbol = _arbol_de(muestra)
+        if permitidos is not None and ubicaciones.conglomerado_de(arbol.get('subparcela')) not in permitidos:
+            continue
+        if filtros.especie and arbol.get('especie') not in filtros.especie:
+            continue
+        if filtros.condicion and arbol.get('condicion') not in filtros.condicion:
+            continue
+        if filtros.subparcela and not (arbol.get('codigoSubparcela') or '').startswith(filtros.subparcela):
+            continue
+        if filtros.desde or filtros.hasta:
+            fecha = _fecha_muestra(muestra)
+            if fecha is None or (filtros.desde and fecha < filtros.desde) or (filtros.hasta and fecha > filtros.hasta):
+                continue
+        seleccionadas.append(muestra)
+    return seleccionadas
+
+
+def agrupar_muestras(registros, dimension, ubicaciones):
+    """{nombre del grupo: muestras} según un dato del árbol o de su ubicación"""
+    grupos = {}
+    for muestra in registros:
+        arbol = _arbol_de(muestra)
+        if dimension in ('especie', 'condicion'):
+            nombre = arbol.get(dimension) or 'sin valor'
+        else:
+            nombre = ubicaciones.nombre(dimension, ubicaciones.conglomerado_de(arbol.get('subparcela')))
+        grupos.setdefault(nombre, []).append(muestra)
+    return grupos
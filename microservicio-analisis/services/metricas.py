@@ -0,0 +1,175 @@
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+# Límites de los histogramas: latencias en segundos y tamaños en bytes
+LIMITES_LATENCIA = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LIMITES_BYTES = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8)
+
+# Etapas medidas durante la petición en curso, solo si pidió su perfil
+_perfil = contextvars.ContextVar('perfil', default=None)
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _formatear_etiquetas(etiquetas, extra=None):
+    pares = list(etiquetas) + ([extra] if extra else [])
+    if not pares:
+        return ''
+    texto = ','.join(f'{nombre}="{_escapar(valor)}"' for nombre, valor in pares)
+    return '{' + texto + '}'
+
+
+def _formatear_valor(valor):
+    return repr(float(valor)) if valor == valor else 'NaN'
+
+
+class _Histograma:
+    """Conteos acumulables por cubeta, suma y total para un conjunto de etiquetas"""
+
+    __slots__ = ('conteos', 'suma', 'total')
+
+    def __init__(self, cubetas):
+        self.conteos = [0] * cubetas
+        self.suma = 0.0
+        self.total = 0
+
+
+class RegistroMetricas:
+    """Histogramas, contadores e indicadores exportados en el formato de texto de Prometheus.
+
+    Cada proceso tiene su propio registro: con varios workers de gunicorn cada
+    scrape de /metrics ve el worker que lo atendió.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ayudas = {}
+        self._limites = {}
+        self._histogramas = {}
+        self._contadores = {}
+        self._indicadores = []
+
+    def observar(self, nombre, valor, ayuda='', limites=LIMITES_LATENCIA, **etiquetas):
+        clave = tuple(sorted(etiquetas.items()))
+        with self._lock:
+            series = self._histogramas.get(nombre)
+            if series is None:
+                series = self._histogramas[nombre] = {}
+                self._ayudas[nombre] = ayuda
+                self._limites[nombre] = limites
+            histograma = series.get(clave)
+            if histograma is None:
+                histograma = series[clave] = _Histograma(len(self._limites[nombre]))
+            for i, limite in enumerate(self._limites[nombre]):
+                if valor <= limite:
+                    histograma.conteos[i] += 1
+                    break
+            histograma.suma += valor
+            histograma.total += 1
+
+    def incrementar(self, nombre, valor=1, ayuda='', **etiquetas):
+        clave = tuple(sorted(etiquetas.items()))
+        with self._lock:
+            series = self._contadores.setdefault(nombre, {})
+            self._ayudas.setdefault(nombre, ayuda)
+            series[clave] = series.get(clave, 0) + valor
+
+    def registrar_indicador(self, nombre, ayuda, leer, tipo='gauge'):
+        """Registrar un valor que se lee al exportar; `leer` devuelve un número o una
+        lista de (etiquetas, valor)"""
+        self._indicadores.append((nombre, ayuda, leer, tipo))
+
+    def exportar(self):
+        lineas = []
+        with self._lock:
+            for nombre, series in self._histogramas.items():
+                lineas.append(f'# HELP {nombre} {self._ayudas[nombre]}')
+                lineas.append(f'# TYPE {nombre} histogram')
+                limites = self._limites[nombre]
+                for etiquetas, histograma in series.items():
+                    acumulado = 0
+                    for limite, conteo in zip(limites, histograma.conteos):
+                        acumulado += conteo
+                        lineas.append(f"{nombre}_bucket{_formatear_etiquetas(etiquetas, ('le', limite))} {acumulado}")
+                    lineas.append(f"{nombre}_bucket{_formatear_etiquetas(etiquetas, ('le', '+Inf'))} {histograma.total}")
+                    lineas.append(f'{nombre}_sum{_formatear_etiquetas(etiquetas)} {_formatear_valor(histograma.suma)}')
+                    lineas.append(f'{nombre}_count{_formatear_etiquetas(etiquetas)} {histograma.total}')
+            for nombre, series in self._contadores.items():
+                lineas.append(f'# HELP {nombre} {self._ayudas[nombre]}')
+                lineas.append(f'# TYPE {nombre} counter')
+                for etiquetas, valor in series.items():
+                    lineas.append(f'{nombre}{_formatear_etiquetas(etiquetas)} {_formatear_valor(valor)}')
+
+        for nombre, ayuda, leer, tipo in self._indicadores:
+            try:
+                valores = leer()
+            except Exception as e:
+                print(f"⚠️ Error al leer la métrica {nombre}: {e}")
+                continue
+            if not isinstance(valores, list):
+                valores = [({}, valores)]
+            lineas.append(f'# HELP {nombre} {ayuda}')
+            lineas.append(f'# TYPE {nombre} {tipo}')
+            for etiquetas, valor in valores:
+                lineas.append(f'{nombre}{_formatear_etiquetas(sorted(etiquetas.items()))} {_formatear_valor(valor)}')
+        return '\n'.join(lineas) + '\n'
+
+
+@contextmanager
+def cronometro(etapa):
+    """Medir una etapa: va al histograma etapa_segundos y, si la petición pidió su
+    perfil, a la cabecera Server-Timing de la respuesta"""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracion = time.perf_counter() - inicio
+        metricas.observar('etapa_segundos', duracion, 'Duración de cada etapa del cálculo de análisis', etapa=etapa)
+        perfil = _perfil.get()
+        if perfil is not None:
+            perfil.append((etapa, duracion))
+
+
+def medir(etapa):
+    """Decorador equivalente a envolver la función en cronometro(etapa)"""
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            with cronometro(etapa):
+                return funcion(*args, **kwargs)
+        return envoltura
+    return decorador
+
+
+def iniciar_perfil():
+    """Empezar a registrar las etapas de la petición en curso"""
+    return _perfil.set([])
+
+
+def terminar_perfil(token):
+    """Etapas registradas desde iniciar_perfil() como valor de Server-Timing"""
+    perfil = _perfil.get() or []
+    _perfil.reset(token)
+    etapas = {}
+    for etapa, duracion in perfil:
+        total, veces = etapas.get(etapa, (0.0, 0))
+        etapas[etapa] = (total + duracion, veces + 1)
+    return ', '.join(
+        f'{etapa};dur={total * 1000:.2f}' + (f';desc="x{veces}"' if veces > 1 else '')
+        for etapa, (total, veces) in etapas.items()
+    )
+
+
+def en_contexto(funcion):
+    """Envolver `funcion` para ejecutarla en otro hilo con el contexto actual (y su perfil)"""
+    contexto = contextvars.copy_context()
+    return lambda *args, **kwargs: contexto.copy().run(funcion, *args, **kwargs)
+
+
+# Instancia global
+metricas = RegistroMetricas()
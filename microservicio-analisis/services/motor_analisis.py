@@ -0,0 +1,194 @@
+import threading
+import numpy as np
+from services.esquemas import (ColumnaCodificada, ESQUEMA_CONGLOMERADOS, ESQUEMA_MUESTRAS, a_float64,
+                               construir_frame, construir_frame_arboles)
+from services.metricas import cronometro
+
+# pandas (~0.3 s de import) se importa al calcular el primer análisis y no al
+# arrancar el servicio: /health y las respuestas precalculadas no lo necesitan
+
+# Límites de las clases diamétricas (cm) y sus etiquetas
+LIMITES_DAP = [15, 30, 60]
+CLASES_DAP = ['pequeño (<15cm)', 'mediano (15-30cm)', 'grande (30-60cm)', 'muy_grande (>=60cm)']
+
+CAMPOS_MUESTRAS = ('tipo', 'estado', 'condicion')
+
+
+def _conteos(serie):
+    """value_counts como dict {valor: int}, sin categorías vacías"""
+    conteos = serie.value_counts()
+    return {str(valor): int(cantidad) for valor, cantidad in conteos.items() if cantidad > 0}
+
+
+def conteos_codificados(conteos, categorias):
+    """Como _conteos, a partir de los conteos por código de una categoría (mismo
+    orden: de mayor a menor y los empates en el orden de las categorías)"""
+    conteos = np.asarray(conteos)
+    return {str(categorias[i]): int(conteos[i]) for i in np.argsort(-conteos, kind='stable') if conteos[i] > 0}
+
+
+def _estadisticas(valores):
+    # Medidas en float32 (ver services/esquemas.py); media, desviación y mediana en float64
+    valores = a_float64(valores)
+    valores = valores[~np.isnan(valores)]
+    if not len(valores):
+        nan = float('nan')
+        return {'promedio': nan, 'mediana': nan, 'minimo': nan, 'maximo': nan, 'desviacion_std': nan}
+    return {
+        'promedio': float(valores.mean()),
+        'mediana': float(np.median(valores)),
+        'minimo': float(valores.min()),
+        'maximo': float(valores.max()),
+        # ddof=1 igual que pandas.Series.std()
+        'desviacion_std': float(valores.std(ddof=1)) if len(valores) > 1 else float('nan')
+    }
+
+
+def clasificar_dap(dap):
+    """Conteo de árboles por clase diamétrica con np.digitize"""
+    dap = dap[~np.isnan(dap)]
+    conteos = np.bincount(np.digitize(dap, LIMITES_DAP), minlength=len(CLASES_DAP))
+    return {clase: int(cantidad) for clase, cantidad in zip(CLASES_DAP, conteos)}
+
+
+class MemoInstantaneas:
+    """Recuerda el último resultado calculado para unas instantáneas concretas.
+
+    Se compara por identidad: la caché de instantáneas entrega el mismo objeto
+    mientras no se recargue la colección, y guardar las referencias evita que
+    su id() se reutilice.
+    """
+
+    def __init__(self, calcular):
+        self._calcular = calcular
+        self._instantaneas = None
+        self._resultado = None
+        self._lock = threading.Lock()
+
+    def obtener(self, *instantaneas):
+        with self._lock:
+            if self._instantaneas is None or any(
+                actual is not anterior for actual, anterior in zip(instantaneas, self._instantaneas)
+            ):
+                self._resultado = self._calcular(*instantaneas)
+                self._instantaneas = instantaneas
+            return self._resultado
+
+
+def armar_arboles(total, conteos, estadisticas, clasificacion_dap):
+    """Agregados de árboles a partir de los conteos de especie, condicion y sanitario
+    y las estadísticas de dap y altura"""
+    especies = conteos['especie']
+    return {
+        'especies': {
+            'total_arboles': total,
+            'especies_unicas': len(especies),
+            'distribucion_completa': especies,
+            'top_5_especies': dict(list(especies.items())[:5])
+        },
+        'condicion': {
+            'total': total,
+            'por_condicion': conteos['condicion'],
+            'por_estado_sanitario': conteos['sanitario']
+        },
+        'dap_altura': {
+            'dap': estadisticas['dap'],
+            'altura': estadisticas['altura'],
+            'clasificacion_dap': clasificacion_dap,
+            'total_analizado': total
+        }
+    }
+
+
+def _paralelo():
+    # services.paralelo importa este módulo (y services.agregados): se importa al usarlo
+    from services import paralelo
+    return paralelo
+
+
+class MotorAnalisis:
+    """Motor de análisis en una sola pasada: construye el frame tipado una vez por
+    instantánea de datos y calcula todos los agregados que consumen los endpoints"""
+
+    def __init__(self):
+        self._arboles = MemoInstantaneas(self._agregar_arboles)
+        self._muestras = MemoInstantaneas(self._agregar_muestras)
+        self._conglomerados = MemoInstantaneas(self._agregar_conglomerados)
+
+    def arboles(self, columnas):
+        with cronometro('agregacion_arboles'):
+            return self._arboles.obtener(columnas)
+
+    def muestras(self, registros):
+        with cronometro('agregacion_muestras'):
+            return self._muestras.obtener(registros)
+
+    def conglomerados(self, registros):
+        with cronometro('agregacion_conglomerados'):
+            return self._conglomerados.obtener(registros)
+
+    def arboles_filtrados(self, frame, filas, clave=None, cantidad=0):
+        """Agregados de árboles sobre las filas seleccionadas de un frame (sin memo).
+
+        `clave` son los códigos por los que se particionan esas filas en el modo paralelo.
+        """
+        with cronometro('agregacion_arboles_filtrada'):
+            return self._agregar_frame_arboles(frame.iloc[filas], clave, cantidad)
+
+    def muestras_filtradas(self, registros):
+        with cronometro('agregacion_muestras_filtrada'):
+            return self._agregar_muestras(registros)
+
+    def conglomerados_filtrados(self, registros):
+        with cronometro('agregacion_conglomerados_filtrada'):
+            return self._agregar_conglomerados(registros)
+
+    @staticmethod
+    def _agregar_arboles(columnas):
+        subparcela = columnas['subparcela']
+        if isinstance(subparcela, ColumnaCodificada):
+            # Las particiones por subparcela salen de los códigos, sin recorrer textos
+            return MotorAnalisis._agregar_frame_arboles(construir_frame_arboles(columnas), subparcela.codigos,
+                                                        len(subparcela.categorias))
+        return MotorAnalisis._agregar_frame_arboles(construir_frame_arboles(columnas))
+
+    @staticmethod
+    def _agregar_frame_arboles(df, clave=None, cantidad=0):
+        """Agregados de un frame de árboles. Con PARALELO_MIN_FILAS filas o más se
+        calculan en el pool de procesos, particionados por `clave` (códigos de
+        subparcela o de conglomerado por fila) o, sin clave, en tramos de filas"""
+        paralelo = _paralelo()
+        if paralelo.aplica(len(df)):
+            try:
+                return paralelo.agregar_arboles(df, clave, cantidad)
+            except Exception as e:
+                print(f"⚠️ Agregación paralela fallida, se calcula en este hilo: {e}")
+
+        dap = df['dap'].to_numpy()
+        # Un solo value_counts por columna categórica
+        conteos = {campo: _conteos(df[campo]) for campo in ('especie', 'condicion', 'sanitario')}
+        estadisticas = {'dap': _estadisticas(dap), 'altura': _estadisticas(df['altura'].to_numpy())}
+        return armar_arboles(len(df), conteos, estadisticas, clasificar_dap(dap))
+
+    @staticmethod
+    def _agregar_muestras(registros):
+        df = construir_frame(registros, ESQUEMA_MUESTRAS, CAMPOS_MUESTRAS)
+        estados = _conteos(df['estado'])
+        return {
+            'total_muestras': len(df),
+            'por_tipo': _conteos(df['tipo']),
+            'por_estado': estados,
+            'por_condicion': _conteos(df['condicion'])
+        }
+
+    @staticmethod
+    def _agregar_conglomerados(registros):
+        df = construir_frame(registros, ESQUEMA_CONGLOMERADOS, ('departamento',))
+        return {
+            'total': len(df),
+            'por_departamento': _conteos(df['departamento'])
+        }
+
+
+# Instancia global
+motor = MotorAnalisis()
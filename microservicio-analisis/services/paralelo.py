@@ -0,0 +1,247 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+import numpy as np
+from config import Config
+from services.agregados import EstadisticaWelford, HistogramaCuantiles
+from services.esquemas import a_float64
+from services.metricas import cronometro
+from services.motor_analisis import CLASES_DAP, armar_arboles, clasificar_dap, conteos_codificados
+
+# Columnas que se copian a memoria compartida
+CATEGORICOS = ('especie', 'condicion', 'sanitario')
+NUMERICOS = ('dap', 'altura')
+
+# Solo se usan sus cubetas: las de cada partición se suman en el proceso principal
+_sketch = HistogramaCuantiles()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def aplica(filas):
+    """¿Se agregan `filas` filas en el pool? (PARALELO_WORKERS=0 lo desactiva)"""
+    return Config.PARALELO_WORKERS > 0 and filas >= Config.PARALELO_MIN_FILAS
+
+
+def _contexto():
+    """forkserver donde existe (Linux, macOS); si no, spawn.
+
+    El worker que crea el pool ya tiene hilos (escritor de reportes, réplica,
+    precálculo): un fork copiaría los locks que esos hilos tengan tomados.
+    """
+    metodo = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return multiprocessing.get_context(metodo)
+
+
+def _obtener_executor():
+    """Pool de procesos de agregación (se crea con el primer análisis grande, en cada proceso)"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=Config.PARALELO_WORKERS, mp_context=_contexto())
+        return _executor
+
+
+def _descartar_executor():
+    """Murió un proceso del pool: el siguiente análisis crea un pool nuevo"""
+    global _executor
+    with _executor_lock:
+        _executor = None
+
+
+class _MemoriaCompartida:
+    """Columnas copiadas a segmentos de memoria compartida mientras dura un análisis.
+
+    Los procesos del pool las abren por nombre, sin serializarlas ni copiarlas;
+    al salir del bloque se liberan los segmentos.
+    """
+
+    def __init__(self, columnas):
+        self._segmentos = []
+        self.descriptores = {}
+        try:
+            for nombre, valores in columnas.items():
+                segmento = shared_memory.SharedMemory(create=True, size=max(valores.nbytes, 1))
+                self._segmentos.append(segmento)
+                np.ndarray(valores.shape, valores.dtype, buffer=segmento.buf)[:] = valores
+                self.descriptores[nombre] = (segmento.name, valores.shape, valores.dtype.str)
+        except BaseException:
+            self.liberar()
+            raise
+
+    def liberar(self):
+        for segmento in self._segmentos:
+            segmento.close()
+            segmento.unlink()
+        self._segmentos = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.liberar()
+
+
+def _en_particion(descriptores, particion, calcular, *argumentos):
+    """calcular(columnas, filas, *argumentos) en un proceso del pool, con las filas de una partición.
+
+    El resultado no puede apuntar a la memoria compartida: indexar con un array
+    de filas ya devuelve copias.
+    """
+    segmentos, columnas = [], {}
+    try:
+        for nombre, (segmento, forma, tipo) in descriptores.items():
+            segmentos.append(shared_memory.SharedMemory(name=segmento))
+            columnas[nombre] = np.ndarray(forma, np.dtype(tipo), buffer=segmentos[-1].buf)
+        return calcular(columnas, np.flatnonzero(columnas['particion'] == particion), *argumentos)
+    finally:
+        columnas.clear()
+        for segmento in segmentos:
+            segmento.close()
+
+
+def _validos(columnas, filas, campo):
+    # En float64, como las estadísticas del motor
+    valores = a_float64(columnas[campo][filas])
+    return valores[~np.isnan(valores)]
+
+
+def _parciales(columnas, filas, categorias):
+    """Conteos por código, estadística de Welford, extremos y cubetas de cuantiles de una partición"""
+    parcial = {'conteos': {}, 'estadisticas': {}, 'cubetas': {}}
+    for campo, cantidad in categorias.items():
+        codigos = columnas[campo][filas]
+        parcial['conteos'][campo] = np.bincount(codigos[codigos >= 0], minlength=cantidad)
+    for campo in NUMERICOS:
+        valores = _validos(columnas, filas, campo)
+        if len(valores):
+            media = float(valores.mean())
+            parcial['estadisticas'][campo] = (len(valores), media, float(((valores - media) ** 2).sum()),
+                                              float(valores.min()), float(valores.max()))
+        parcial['cubetas'][campo] = np.bincount(_sketch._cubetas(valores), minlength=len(_sketch.conteos))
+    parcial['clasificacion_dap'] = clasificar_dap(columnas['dap'][filas])
+    return parcial
+
+
+def _valores_en_cubetas(columnas, filas, rangos):
+    """Valores de cada campo que caen en las cubetas rangos[campo] = (desde, hasta)"""
+    encontrados = {}
+    for campo, (desde, hasta) in rangos.items():
+        valores = _validos(columnas, filas, campo)
+        cubetas = _sketch._cubetas(valores)
+        encontrados[campo] = valores[(cubetas >= desde) & (cubetas <= hasta)]
+    return encontrados
+
+
+def asignar_particiones(filas, particiones, clave=None, cantidad=0):
+    """Partición de cada fila, en tramos de filas parecidos. Con `clave` los grupos
+    (también el código -1) quedan enteros en una partición."""
+    if clave is None:
+        return (np.arange(filas) * particiones // max(filas, 1)).astype(np.int16)
+    posiciones = np.asarray(clave, dtype=np.intp) + 1
+    tamanos = np.bincount(posiciones, minlength=cantidad + 1)
+    anteriores = np.cumsum(tamanos) - tamanos
+    return (anteriores * particiones // max(filas, 1)).astype(np.int16)[posiciones]
+
+
+def _centrales(total):
+    """Posiciones de los elementos centrales (una sola si total es impar)"""
+    return (total - 1) // 2, total // 2
+
+
+def _cubetas_centrales(cubetas, total):
+    """(desde, hasta): cubetas en las que caen los elementos centrales"""
+    acumulado = np.cumsum(cubetas)
+    return tuple(int(np.searchsorted(acumulado, posicion, side='right')) for posicion in _centrales(total))
+
+
+def _mediana(cubetas, total, valores):
+    """Mediana exacta, igual que np.median, con los valores de las cubetas centrales"""
+    anteriores = int(cubetas[:_cubetas_centrales(cubetas, total)[0]].sum())
+    valores = np.sort(valores)
+    primero, segundo = (posicion - anteriores for posicion in _centrales(total))
+    return float((valores[primero] + valores[segundo]) / 2)
+
+
+def _estadisticas(estadistica, minimo, maximo, mediana):
+    """Mismas claves que las estadísticas del motor, a partir de las parciales combinadas"""
+    if not estadistica.n:
+        nan = float('nan')
+        return {'promedio': nan, 'mediana': nan, 'minimo': nan, 'maximo': nan, 'desviacion_std': nan}
+    return {
+        'promedio': estadistica.media,
+        'mediana': mediana,
+        'minimo': minimo,
+        'maximo': maximo,
+        'desviacion_std': estadistica.desviacion_std
+    }
+
+
+def agregar_arboles(frame, clave=None, cantidad=0):
+    """Agregados de árboles de un frame, los mismos de MotorAnalisis, calculados en el pool.
+
+    Las filas se reparten en PARALELO_WORKERS particiones por grupos de `clave`
+    (códigos de subparcela o de conglomerado; `cantidad` grupos) o, sin clave, en
+    tramos de filas consecutivas. Cada proceso calcula sobre su partición conteos,
+    estadística de Welford y cubetas de cuantiles, y aquí se combinan. La mediana
+    sigue siendo exacta: una segunda ronda trae solo los valores de las cubetas en
+    las que cae.
+    """
+    with cronometro('agregacion_paralela'):
+        particiones = Config.PARALELO_WORKERS
+        columnas = {campo: frame[campo].cat.codes.to_numpy() for campo in CATEGORICOS}
+        columnas.update({campo: frame[campo].to_numpy() for campo in NUMERICOS})
+        columnas['particion'] = asignar_particiones(len(frame), particiones, clave, cantidad)
+        categorias = {campo: len(frame[campo].cat.categories) for campo in CATEGORICOS}
+
+        executor = _obtener_executor()
+        try:
+            with _MemoriaCompartida(columnas) as memoria:
+                def en_particiones(calcular, *argumentos):
+                    futuros = [
+                        executor.submit(_en_particion, memoria.descriptores, particion, calcular, *argumentos)
+                        for particion in range(particiones)
+                    ]
+                    return [futuro.result(timeout=Config.PARALELO_TIMEOUT) for futuro in futuros]
+
+                parciales = en_particiones(_parciales, categorias)
+
+                combinadas = {}
+                for campo in NUMERICOS:
+                    estadistica, minimo, maximo = EstadisticaWelford(), np.inf, -np.inf
+                    for n, media, m2, minimo_parcial, maximo_parcial in (
+                        parcial['estadisticas'][campo] for parcial in parciales if campo in parcial['estadisticas']
+                    ):
+                        estadistica.combinar(EstadisticaWelford(n, media, m2))
+                        minimo, maximo = min(minimo, minimo_parcial), max(maximo, maximo_parcial)
+                    cubetas = sum(parcial['cubetas'][campo] for parcial in parciales)
+                    combinadas[campo] = (estadistica, minimo, maximo, cubetas)
+
+                # Segunda ronda, una tarea por partición para todos los campos con valores
+                rangos = {
+                    campo: _cubetas_centrales(cubetas, estadistica.n)
+                    for campo, (estadistica, _, _, cubetas) in combinadas.items() if estadistica.n
+                }
+                encontrados = en_particiones(_valores_en_cubetas, rangos) if rangos else []
+        except BrokenProcessPool:
+            _descartar_executor()
+            raise
+
+        estadisticas = {}
+        for campo, (estadistica, minimo, maximo, cubetas) in combinadas.items():
+            mediana = None
+            if estadistica.n:
+                valores = np.concatenate([parcial[campo] for parcial in encontrados])
+                mediana = _mediana(cubetas, estadistica.n, valores)
+            estadisticas[campo] = _estadisticas(estadistica, minimo, maximo, mediana)
+
+        conteos = {
+            campo: conteos_codificados(sum(parcial['conteos'][campo] for parcial in parciales),
+                                       frame[campo].cat.categories)
+            for campo in CATEGORICOS
+        }
+        clasificacion = {clase: sum(parcial['clasificacion_dap'][clase] for parcial in parciales) for clase in CLASES_DAP}
+        return armar_arboles(len(frame), conteos, estadisticas, clasificacion)
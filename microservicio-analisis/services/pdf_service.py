@@ -1,38 +1,83 @@
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-from reportlab.lib import colors
-from reportlab.lib.enums import TA_CENTER, TA_LEFT
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+import hashlib
 import io
+import json
+import threading
+from config import Config
+from services.cache_service import SnapshotCache
+from services.paralelo import _contexto
+from services.metricas import metricas, cronometro, LIMITES_BYTES
+
+# PDFs ya renderizados, por hash del análisis
+pdf_cache = SnapshotCache(Config.PDF_CACHE_TTL, Config.PDF_CACHE_MAX_ENTRADAS)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _obtener_executor():
+    """Pool de procesos para renderizar (se crea con el primer PDF, en cada proceso)"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=Config.PDF_WORKERS, mp_context=_contexto())
+        return _executor
+
+
+def _renderizar(tipo, datos, generado_en):
+    generador = {
+        'especies': PDFService.generar_reporte_especies,
+        'general': PDFService.generar_reporte_general
+    }[tipo]
+    return generador(datos, generado_en).getvalue()
+
+
+def _fecha(generado_en):
+    """Fecha que se imprime en el PDF: la del análisis (ISO) o, sin ella, la actual"""
+    fecha = datetime.fromisoformat(generado_en) if generado_en else datetime.now()
+    return fecha.strftime('%d/%m/%Y %H:%M')
+
 
 class PDFService:
     @staticmethod
-    def generar_reporte_especies(datos_analisis):
+    def obtener_pdf(tipo, datos, generado_en=None):
+        """Bytes del PDF `tipo` ('especies' o 'general') para los datos de un análisis.
+        
+        generado_en es el calculado_en del análisis: es la fecha impresa en el PDF
+        y forma parte de la clave. Se reutiliza el PDF si el análisis no cambió; si
+        no, se renderiza en el pool de procesos para no ocupar el hilo (ni el GIL)
+        del worker de Flask.
+        """
+        contenido = json.dumps(datos, sort_keys=True, default=str)
+        clave = f"{tipo}:{generado_en}:{hashlib.sha256(contenido.encode('utf-8')).hexdigest()}"
+        
+        def renderizar():
+            with cronometro(f'pdf_{tipo}'):
+                if Config.PDF_WORKERS <= 0:
+                    pdf = _renderizar(tipo, datos, generado_en)
+                else:
+                    pdf = _obtener_executor().submit(_renderizar, tipo, datos, generado_en).result(timeout=Config.PDF_TIMEOUT)
+            metricas.observar('pdf_bytes', len(pdf), 'Tamaño de los PDFs renderizados', LIMITES_BYTES, tipo=tipo)
+            return pdf
+        
+        return pdf_cache.obtener(clave, renderizar)
+    
+    @staticmethod
+    def generar_reporte_especies(datos_analisis, generado_en=None):
         """Generar PDF con reporte de especies"""
+        from services.plantillas_pdf import A4, inch, SimpleDocTemplate, Table, Paragraph, Spacer, styles, title_style, tabla_style
         buffer = io.BytesIO()
         doc = SimpleDocTemplate(buffer, pagesize=A4)
         elementos = []
         
-        # Estilos
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=24,
-            textColor=colors.HexColor('#57c27a'),
-            spaceAfter=30,
-            alignment=TA_CENTER
-        )
-        
         # Título
         elementos.append(Paragraph("Reporte de Distribución de Especies", title_style))
         elementos.append(Spacer(1, 0.3*inch))
         
         # Información general
         info_text = f"""
-        <b>Fecha de generación:</b> {datetime.now().strftime('%d/%m/%Y %H:%M')}<br/>
+        <b>Fecha de generación:</b> {_fecha(generado_en)}<br/>
         <b>Total de árboles analizados:</b> {datos_analisis['total_arboles']}<br/>
         <b>Especies únicas identificadas:</b> {datos_analisis['especies_unicas']}<br/>
         """
@@ -50,16 +95,7 @@ class PDFService:
             tabla_data.append([especie, str(cantidad), f"{porcentaje:.2f}%"])
         
         tabla = Table(tabla_data, colWidths=[3*inch, 1.5*inch, 1.5*inch])
-        tabla.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#57c27a')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
+        tabla.setStyle(tabla_style)
         
         elementos.append(tabla)
         
@@ -69,29 +105,19 @@ class PDFService:
         return buffer
     
     @staticmethod
-    def generar_reporte_general(resumen):
+    def generar_reporte_general(resumen, generado_en=None):
         """Generar PDF con resumen general"""
+        from services.plantillas_pdf import A4, inch, SimpleDocTemplate, Paragraph, Spacer, styles, title_style
         buffer = io.BytesIO()
         doc = SimpleDocTemplate(buffer, pagesize=A4)
         elementos = []
         
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=24,
-            textColor=colors.HexColor('#57c27a'),
-            spaceAfter=30,
-            alignment=TA_CENTER
-        )
-        
         # Título
         elementos.append(Paragraph("Resumen General del Inventario Forestal", title_style))
         elementos.append(Spacer(1, 0.3*inch))
         
         # Fecha
-        fecha = datetime.now().strftime('%d/%m/%Y %H:%M')
-        elementos.append(Paragraph(f"<b>Generado el:</b> {fecha}", styles['Normal']))
+        elementos.append(Paragraph(f"<b>Generado el:</b> {_fecha(generado_en)}", styles['Normal']))
         elementos.append(Spacer(1, 0.3*inch))
         
         # Conglomerados
@@ -0,0 +1,38 @@
+"""Estilos de reportlab de los reportes PDF.
+
+Módulo aparte para que reportlab se importe con el primer PDF (normalmente en el
+pool de procesos de renderizado) y no al arrancar el servicio.
+"""
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+
+# Nombres de reportlab que pdf_service importa desde aquí, junto con los estilos
+__all__ = [
+    'A4', 'inch', 'SimpleDocTemplate', 'Table', 'Paragraph', 'Spacer', 'PageBreak',
+    'styles', 'title_style', 'tabla_style'
+]
+
+# Estilos y plantillas compartidos por todos los reportes (se construyen una sola vez)
+styles = getSampleStyleSheet()
+title_style = ParagraphStyle(
+    'CustomTitle',
+    parent=styles['Heading1'],
+    fontSize=24,
+    textColor=colors.HexColor('#57c27a'),
+    spaceAfter=30,
+    alignment=TA_CENTER
+)
+tabla_style = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#57c27a')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 12),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black)
+])
@@ -0,0 +1,117 @@
+import threading
+import time
+from datetime import datetime
+from config import Config
+from models import AnalisisReporte, InstantaneaInventario
+from services.analisis_service import AnalisisService
+from services.cache_service import huella
+from services.pdf_service import PDFService
+
+
+class AlmacenResultados:
+    """Últimos resultados de cada análisis con la hora en que se calcularon.
+
+    Publicar reemplaza el diccionario completo (una asignación atómica), así que
+    quien lee nunca ve una mezcla de resultados de dos cálculos distintos.
+    """
+
+    def __init__(self):
+        self._resultados = {}
+        self._lock = threading.Lock()
+        # Huella de los resultados publicados (versión de los datos para las respuestas HTTP)
+        self.version = None
+
+    def publicar(self, resultados, calculado_en):
+        """Publicar los resultados. Un resultado igual al publicado conserva su
+        calculado_en: la versión (y el ETag) solo cambian cuando cambian los datos"""
+        with self._lock:
+            nuevos = dict(self._resultados)
+            for tipo_reporte, resultado in resultados.items():
+                anterior = nuevos.get(tipo_reporte)
+                if anterior is None or huella(anterior[0]) != huella(resultado):
+                    nuevos[tipo_reporte] = (resultado, calculado_en)
+            self._resultados = nuevos
+            self.version = huella({tipo_reporte: resultado for tipo_reporte, (resultado, _) in nuevos.items()})
+
+    def obtener(self, tipo_reporte):
+        """(resultado, calculado_en) o None si todavía no se calculó"""
+        return self._resultados.get(tipo_reporte)
+
+
+class Precalculador:
+    """Recalcula periódicamente todos los análisis en segundo plano y publica los
+    resultados en el almacén que leen las rutas"""
+
+    def __init__(self, almacen, intervalo, incluir_pdfs=False):
+        self.almacen = almacen
+        self.intervalo = intervalo
+        self.incluir_pdfs = incluir_pdfs
+        self._hilo = None
+        self._detener = threading.Event()
+        self.ultima_ejecucion = None
+        self.ultimo_error = None
+        self._ultimo_tramo = None
+
+    @property
+    def activo(self):
+        return self._hilo is not None and self._hilo.is_alive()
+
+    def iniciar(self):
+        if self.intervalo <= 0 or self.activo:
+            return
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._ejecutar, name='precalculo', daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        self._detener.set()
+
+    def _ejecutar(self):
+        while not self._detener.is_set():
+            self.ejecutar()
+            self._detener.wait(self.intervalo)
+
+    def _guardar_instantanea(self, resultados):
+        """Una instantánea por tramo de INSTANTANEAS_INTERVALO segundos. tomada_en es
+        el inicio del tramo: si varios workers la guardan, solo entra la primera."""
+        intervalo = Config.INSTANTANEAS_INTERVALO
+        if intervalo <= 0:
+            return
+        tramo = int(time.time()) // intervalo * intervalo
+        if tramo == self._ultimo_tramo:
+            return
+        InstantaneaInventario.guardar(resultados, datetime.fromtimestamp(tramo))
+        self._ultimo_tramo = tramo
+
+    def ejecutar(self):
+        """Calcular todos los análisis, guardarlos y publicarlos"""
+        try:
+            calculado_en = datetime.now().isoformat(timespec='seconds')
+            resultados = AnalisisService.analizar_todo()
+            if not resultados:
+                return
+            resultados['biomasa_carbono'] = AnalisisService.analizar_biomasa()
+
+            for tipo_reporte, resultado in resultados.items():
+                if resultado:
+                    AnalisisReporte.guardar(tipo_reporte, resultado)
+            self.almacen.publicar(resultados, calculado_en)
+            self._guardar_instantanea(resultados)
+
+            if self.incluir_pdfs:
+                # Deja los PDFs en la caché de renderizado
+                if resultados['distribucion_especies']:
+                    PDFService.obtener_pdf('especies', resultados['distribucion_especies'], calculado_en)
+                if resultados['resumen_general']:
+                    PDFService.obtener_pdf('general', resultados['resumen_general'], calculado_en)
+
+            self.ultima_ejecucion = calculado_en
+            self.ultimo_error = None
+        except Exception as e:
+            self.ultimo_error = str(e)
+            print(f"❌ Error en el precálculo de análisis: {e}")
+
+
+# Instancias globales
+almacen = AlmacenResultados()
+precalculador = Precalculador(almacen, Config.PRECALCULO_INTERVALO, Config.PRECALCULO_PDFS)
@@ -0,0 +1,83 @@
+import asyncio
+import json
+from config import Config
+from services.agregados import agregados
+from services.analisis_service import (AnalisisService, CAMPOS_ARBOLES, CAMPOS_SUBPARCELAS, COLECCIONES_INCREMENTALES,
+                                       colecciones_de, fuente_agregados)
+from services.backend_asincrono import backend_asincrono, documentos
+from services.cache_service import cache
+from services.filtros import Filtros, FiltroInvalido
+from services.precalculo import precalculador
+
+# Análisis que calcula cada ruta (ver COLECCIONES_REPORTE)
+RUTAS_REPORTE = {
+    '/api/analisis/especies': 'distribucion_especies',
+    '/api/analisis/condicion-arboles': 'condicion_arboles',
+    '/api/analisis/dap-altura': 'dap_altura',
+    '/api/analisis/muestras': 'analisis_muestras',
+    '/api/analisis/resumen-general': 'resumen_general',
+    '/api/analisis/todo': 'todo',
+    '/api/analisis/biomasa': 'biomasa_carbono',
+    '/api/reportes/pdf/especies': 'distribucion_especies',
+    '/api/reportes/pdf/general': 'resumen_general',
+    '/api/tendencias/instantanea': 'todo'
+}
+
+
+def colecciones_a_precargar(ruta, argumentos):
+    """Colecciones que la ruta descargaría del backend, o () si no va a descargar nada
+    (precálculo, agregados precalculados o parámetros inválidos)"""
+    tipo_reporte = RUTAS_REPORTE.get(ruta)
+    if not tipo_reporte:
+        return ()
+    try:
+        filtros = Filtros.desde_argumentos(argumentos)
+    except FiltroInvalido:
+        # La vista responde 400
+        return ()
+
+    if filtros.vacio:
+        if precalculador.activo and argumentos.get('fresh') != '1':
+            return ()
+        fuente = fuente_agregados(filtros, tipo_reporte)
+        if fuente is agregados:
+            return COLECCIONES_INCREMENTALES.get(tipo_reporte, ())
+        if fuente is not None:
+            return ()
+    colecciones = colecciones_de(tipo_reporte, filtros)
+    if Config.REPLICA_HABILITADA:
+        colecciones = tuple(coleccion for coleccion in colecciones if coleccion != 'arboles')
+    return colecciones
+
+
+async def _descargar(coleccion):
+    """Descarga asíncrona; el parseo y el armado de columnas (CPU) van al executor"""
+    if coleccion == 'arboles':
+        paginas = await backend_asincrono.exportar('arboles', CAMPOS_ARBOLES)
+        armar = lambda: AnalisisService._descargar_arboles(documentos(paginas))
+    elif coleccion == 'subparcelas':
+        paginas = await backend_asincrono.exportar('subparcelas', CAMPOS_SUBPARCELAS)
+        armar = lambda: list(documentos(paginas))
+    else:
+        contenido = await backend_asincrono.obtener_coleccion(coleccion)
+        armar = lambda: AnalisisService.proyectar_registros(coleccion, json.loads(contenido))
+    return await asyncio.get_running_loop().run_in_executor(None, armar)
+
+
+async def precargar(ruta, argumentos):
+    """Dejar en la caché de instantáneas las colecciones que va a leer la ruta.
+
+    Las peticiones que esperan la misma colección comparten una sola descarga
+    (single-flight) y esperan sin ocupar hilos. Si la precarga falla, la vista
+    descarga por su cuenta y maneja el error como siempre.
+    """
+    colecciones = colecciones_a_precargar(ruta, argumentos)
+    if not colecciones:
+        return
+    resultados = await asyncio.gather(
+        *(cache.obtener_async(coleccion, lambda coleccion=coleccion: _descargar(coleccion)) for coleccion in colecciones),
+        return_exceptions=True
+    )
+    for coleccion, resultado in zip(colecciones, resultados):
+        if isinstance(resultado, Exception):
+            print(f"⚠️ Precarga de {coleccion} fallida: {resultado}")
@@ -0,0 +1,305 @@
+from array import array
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+from config import Config
+from services.backend_client import backend
+from services.metricas import cronometro
+from services.esquemas import ColumnaCodificada
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: sin bloqueo entre procesos (el servidor de desarrollo es un solo proceso)
+    fcntl = None
+
+CATEGORICOS = ('especie', 'condicion', 'sanitario', 'codigoSubparcela', 'subparcela')
+NUMERICOS = ('dap', 'altura')
+FECHAS = ('createdAt',)
+CAMPOS = CATEGORICOS + NUMERICOS + FECHAS + ('updatedAt',)
+
+# Versión del formato: una réplica con otro esquema se reconstruye completa
+ESQUEMA = 2
+
+# Los _id de MongoDB (24 hex) ordenados, para ubicar modificaciones con searchsorted
+TIPO_ID = np.dtype('S24')
+TIPO_NUMERICO = np.float32
+TIPO_FECHA = np.dtype('datetime64[ms]')
+
+
+def _tipo_codigo(categorias):
+    # Subparcela y codigoSubparcela (una cada ~40 árboles) pueden pasar del rango de int16
+    return np.int16 if categorias < np.iinfo(np.int16).max else np.int32
+
+
+class _Version:
+    """Columnas de una versión publicada de la réplica, abiertas con memory mapping"""
+
+    def __init__(self, directorio, manifiesto):
+        self.numero = manifiesto['version']
+        self.filas = manifiesto['filas']
+        ruta = os.path.join(directorio, manifiesto['carpeta'])
+        # Un .npy sin filas no se puede mapear
+        modo = 'r' if self.filas else None
+        cargar = lambda nombre: np.load(os.path.join(ruta, f'{nombre}.npy'), mmap_mode=modo)
+        self.ids = cargar('_id')
+        self.columnas = {
+            campo: ColumnaCodificada(cargar(campo), tuple(manifiesto['diccionarios'][campo]))
+            for campo in CATEGORICOS
+        }
+        for campo in NUMERICOS + FECHAS:
+            self.columnas[campo] = cargar(campo)
+
+
+class ReplicaColumnar:
+    """Réplica local de los árboles en columnas numpy, compartida por todos los workers.
+
+    Cada versión es una carpeta con un .npy por columna: _id (S24), los textos
+    codificados con diccionario (int16, o int32 si el diccionario no cabe), dap/altura en
+    float32 y createdAt en datetime64[ms]. manifiesto.json apunta a la versión vigente y se reemplaza con
+    os.replace, así que quien lee ve la versión anterior completa o la nueva
+    completa. Los workers leen con mmap: el page cache del sistema guarda una sola
+    copia y no se parsea nada por petición.
+
+    La réplica se actualiza con el feed de cambios (?desde=) y se reconstruye
+    completa cada REPLICA_RECONCILIACION segundos para reflejar los borrados. Un
+    solo proceso escribe a la vez (flock sobre .bloqueo). Las versiones reemplazadas
+    se borran después de REPLICA_GRACIA segundos.
+    """
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        self._abierta = None
+        self._lock = threading.Lock()
+        self._hilo = None
+        self._detener = threading.Event()
+
+    @property
+    def _ruta_manifiesto(self):
+        return os.path.join(self.directorio, 'manifiesto.json')
+
+    def _leer_manifiesto(self):
+        try:
+            with open(self._ruta_manifiesto) as archivo:
+                return json.load(archivo)
+        except FileNotFoundError:
+            return None
+
+    @contextmanager
+    def _bloqueo(self, esperar=True):
+        """Bloqueo de escritura entre hilos y procesos; devuelve False si está ocupado"""
+        if not self._lock.acquire(blocking=esperar):
+            yield False
+            return
+        try:
+            os.makedirs(self.directorio, exist_ok=True)
+            with open(os.path.join(self.directorio, '.bloqueo'), 'w') as archivo:
+                if fcntl:
+                    try:
+                        fcntl.flock(archivo, fcntl.LOCK_EX | (0 if esperar else fcntl.LOCK_NB))
+                    except BlockingIOError:
+                        yield False
+                        return
+                yield True
+        finally:
+            self._lock.release()
+
+    def columnas_arboles(self):
+        """Columnas de la versión vigente (el mismo objeto mientras no cambie la versión)"""
+        manifiesto = self._leer_manifiesto()
+        if manifiesto is None or manifiesto.get('esquema') != ESQUEMA:
+            self.refrescar()
+            manifiesto = self._leer_manifiesto()
+        abierta = self._abierta
+        if abierta is None or abierta.numero != manifiesto['version']:
+            try:
+                abierta = _Version(self.directorio, manifiesto)
+            except FileNotFoundError:
+                # La versión se borró mientras se abría (pasó REPLICA_GRACIA): se abre la vigente
+                abierta = _Version(self.directorio, self._leer_manifiesto())
+            self._abierta = abierta
+        return abierta.columnas
+
+    def refrescar(self, completa=False, esperar=True):
+        """Aplicar los cambios del backend y publicar una versión nueva si hubo alguno"""
+        with self._bloqueo(esperar) as adquirido:
+            if not adquirido:
+                # Otro proceso está actualizando la réplica
+                return False
+            manifiesto = self._leer_manifiesto()
+            completa = (completa or manifiesto is None or manifiesto.get('esquema') != ESQUEMA
+                        or time.time() - manifiesto['reconciliada'] >= Config.REPLICA_RECONCILIACION)
+            with cronometro('replica_completa' if completa else 'replica_cambios'):
+                if completa:
+                    columnas, diccionarios, marca = self._descargar_completa()
+                else:
+                    columnas, diccionarios, marca = self._aplicar_cambios(manifiesto)
+                    if columnas is None:
+                        return False
+                self._publicar(manifiesto, columnas, diccionarios, marca, completa)
+            return True
+
+    @staticmethod
+    def _codificar(valor, diccionario, indices):
+        if valor is None:
+            return -1
+        codigo = indices.get(valor)
+        if codigo is None:
+            codigo = indices[valor] = len(diccionario)
+            diccionario.append(valor)
+        return codigo
+
+    def _leer_documentos(self, documentos, diccionarios):
+        """Documentos del export -> columnas ordenadas por _id y la mayor marca updatedAt"""
+        indices = {campo: {valor: i for i, valor in enumerate(diccionarios[campo])} for campo in CATEGORICOS}
+        ids = []
+        codigos = array('i')
+        numeros = array('f')
+        fechas = []
+        marca = None
+        for documento in documentos:
+            ids.append(documento['_id'])
+            for campo in CATEGORICOS:
+                codigos.append(self._codificar(documento.get(campo), diccionarios[campo], indices[campo]))
+            for campo in NUMERICOS:
+                valor = documento.get(campo)
+                numeros.append(float(valor) if valor is not None else np.nan)
+            for campo in FECHAS:
+                fechas.append((documento.get(campo) or 'NaT').rstrip('Z'))
+            actualizado = documento.get('updatedAt')
+            if actualizado and (marca is None or actualizado > marca):
+                marca = actualizado
+
+        ids = np.array(ids, dtype=TIPO_ID)
+        codigos = np.frombuffer(codigos, dtype=np.int32).reshape(-1, len(CATEGORICOS))
+        numeros = np.frombuffer(numeros, dtype=TIPO_NUMERICO).reshape(-1, len(NUMERICOS))
+        fechas = np.array(fechas, dtype=TIPO_FECHA).reshape(-1, len(FECHAS))
+        # np.unique sobre el orden invertido ordena por _id y, si el feed repite un
+        # documento, se queda con su última versión
+        _, invertidos = np.unique(ids[::-1], return_index=True)
+        orden = len(ids) - 1 - invertidos
+        columnas = {'_id': ids[orden]}
+        for i, campo in enumerate(CATEGORICOS):
+            columnas[campo] = codigos[orden, i].astype(_tipo_codigo(len(diccionarios[campo])))
+        for i, campo in enumerate(NUMERICOS):
+            columnas[campo] = numeros[orden, i]
+        for i, campo in enumerate(FECHAS):
+            columnas[campo] = fechas[orden, i]
+        return columnas, marca
+
+    def _descargar_completa(self):
+        diccionarios = {campo: [] for campo in CATEGORICOS}
+        columnas, marca = self._leer_documentos(backend.iterar_export('arboles', CAMPOS), diccionarios)
+        return columnas, diccionarios, marca
+
+    def _aplicar_cambios(self, manifiesto):
+        """Fusionar los documentos modificados desde la marca con la versión vigente"""
+        diccionarios = {campo: list(valores) for campo, valores in manifiesto['diccionarios'].items()}
+        documentos = backend.iterar_export('arboles', CAMPOS, desde=manifiesto['marca'])
+        cambios, marca = self._leer_documentos(documentos, diccionarios)
+        if not len(cambios['_id']):
+            return None, None, None
+
+        vigente = _Version(self.directorio, manifiesto)
+        ids = vigente.ids
+        posiciones = np.searchsorted(ids, cambios['_id'])
+        existentes = posiciones < len(ids)
+        existentes[existentes] = ids[posiciones[existentes]] == cambios['_id'][existentes]
+
+        nuevos = ~existentes
+
+        columnas = {'_id': ids}
+        for campo in CATEGORICOS:
+            columnas[campo] = vigente.columnas[campo].codigos
+        for campo in NUMERICOS + FECHAS:
+            columnas[campo] = vigente.columnas[campo]
+        # ?desde= incluye los documentos con updatedAt igual a la marca: si solo llegan
+        # esos y sin cambios, no se publica otra versión
+        if not nuevos.any() and all(
+            np.array_equal(columnas[campo][posiciones], cambios[campo], equal_nan=campo in NUMERICOS + FECHAS)
+            for campo in columnas
+        ):
+            return None, None, None
+
+        # Copias escribibles de la versión vigente (mmap de solo lectura); los códigos
+        # se ensanchan si los cambios agrandaron el diccionario
+        columnas = {campo: np.array(valores, dtype=cambios[campo].dtype) for campo, valores in columnas.items()}
+        # Modificaciones en su lugar; altas al final y se reordena por _id
+        for campo, valores in columnas.items():
+            valores[posiciones[existentes]] = cambios[campo][existentes]
+        if nuevos.any():
+            for campo in columnas:
+                columnas[campo] = np.concatenate([columnas[campo], cambios[campo][nuevos]])
+            orden = np.argsort(columnas['_id'], kind='stable')
+            columnas = {campo: valores[orden] for campo, valores in columnas.items()}
+        return columnas, diccionarios, max(marca or '', manifiesto['marca'] or '') or None
+
+    def _publicar(self, anterior, columnas, diccionarios, marca, completa):
+        version = (anterior['version'] if anterior else 0) + 1
+        carpeta = f'v{version:06d}'
+        ruta = os.path.join(self.directorio, carpeta)
+        os.makedirs(ruta, exist_ok=True)
+        for campo, valores in columnas.items():
+            np.save(os.path.join(ruta, f'{campo}.npy'), valores)
+
+        manifiesto = {
+            'esquema': ESQUEMA,
+            'version': version,
+            'carpeta': carpeta,
+            'filas': int(len(columnas['_id'])),
+            'marca': marca,
+            'diccionarios': diccionarios,
+            'reconciliada': time.time() if completa else anterior['reconciliada'],
+            'publicada': time.time()
+        }
+        temporal = self._ruta_manifiesto + '.tmp'
+        with open(temporal, 'w') as archivo:
+            json.dump(manifiesto, archivo, ensure_ascii=False)
+        os.replace(temporal, self._ruta_manifiesto)
+
+        # Las versiones reemplazadas se conservan REPLICA_GRACIA segundos para quien
+        # todavía las esté abriendo: cada una dejó de ser vigente cuando se escribió la siguiente
+        ahora = time.time()
+        versiones = sorted(nombre for nombre in os.listdir(self.directorio) if nombre.startswith('v'))
+        for nombre, siguiente in zip(versiones, versiones[1:]):
+            if ahora - os.path.getmtime(os.path.join(self.directorio, siguiente)) > Config.REPLICA_GRACIA:
+                shutil.rmtree(os.path.join(self.directorio, nombre), ignore_errors=True)
+
+    def iniciar(self):
+        """Actualizar la réplica en segundo plano cada REPLICA_INTERVALO segundos"""
+        if Config.REPLICA_INTERVALO <= 0 or (self._hilo is not None and self._hilo.is_alive()):
+            return
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._ejecutar, name='replica', daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        self._detener.set()
+
+    def _ejecutar(self):
+        while not self._detener.is_set():
+            try:
+                # Sin esperar: si otro worker ya la está actualizando, basta con leerla
+                self.refrescar(esperar=False)
+            except Exception as e:
+                print(f"❌ Error al actualizar la réplica de árboles: {e}")
+            self._detener.wait(Config.REPLICA_INTERVALO)
+
+    def estadisticas(self):
+        manifiesto = self._leer_manifiesto()
+        if manifiesto is None:
+            return {'version': None, 'filas': 0}
+        return {
+            'version': manifiesto['version'],
+            'filas': manifiesto['filas'],
+            'marca': manifiesto['marca'],
+            'publicada': manifiesto['publicada']
+        }
+
+
+# Instancia global
+replica = ReplicaColumnar(Config.REPLICA_DIR)
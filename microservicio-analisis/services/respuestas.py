@@ -0,0 +1,153 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from flask import Response
+from config import Config
+
+try:
+    import brotli
+except ImportError:
+    # Sin el paquete brotli se ofrece solo gzip
+    brotli = None
+
+# Tipos de contenido que vale la pena comprimir
+COMPRIMIBLES = ('application/json', 'application/pdf', 'text/csv')
+
+
+def codificaciones():
+    """Codificaciones disponibles, en orden de preferencia"""
+    return ('br', 'gzip') if brotli else ('gzip',)
+
+
+def comprimir(cuerpo, codificacion):
+    if codificacion == 'br':
+        return brotli.compress(cuerpo, quality=5)
+    # mtime=0: el mismo cuerpo da siempre los mismos bytes
+    return gzip.compress(cuerpo, compresslevel=6, mtime=0)
+
+
+def etag_de(cuerpo):
+    return hashlib.sha256(cuerpo).hexdigest()[:32]
+
+
+class Representacion:
+    """Respuesta 200 ya serializada para una versión de los datos.
+
+    Guarda el cuerpo, su ETag, la fecha en que se generó (Last-Modified) y las
+    variantes comprimidas a medida que se piden. El ETag sale de la clave (ruta,
+    query y versión de los datos) y no del cuerpo, que lleva la hora del cálculo:
+    mientras no cambien los datos es el mismo, también en otros workers.
+    """
+
+    def __init__(self, respuesta, clave):
+        self.cuerpo = respuesta.get_data()
+        self.mimetype = respuesta.mimetype
+        self.cabeceras = [(nombre, valor) for nombre, valor in respuesta.headers
+                          if nombre.lower() == 'content-disposition']
+        self.etag = etag_de(repr(clave).encode('utf-8'))
+        self.modificada = datetime.now(timezone.utc).replace(microsecond=0)
+        self._comprimidos = {}
+
+    def comprimido(self, codificacion):
+        if codificacion not in self._comprimidos:
+            self._comprimidos[codificacion] = comprimir(self.cuerpo, codificacion)
+        return self._comprimidos[codificacion]
+
+    def respuesta(self):
+        """Response nueva en cada petición (los after_request la modifican)"""
+        respuesta = Response(self.cuerpo, mimetype=self.mimetype, headers=self.cabeceras)
+        respuesta.set_etag(self.etag)
+        respuesta.last_modified = self.modificada
+        respuesta.representacion = self
+        return respuesta
+
+
+class CacheRepresentaciones:
+    """Últimas representaciones por (ruta, query, versión de los datos), con límite LRU.
+
+    Una entrada no vence: cuando cambian los datos cambia la clave, y las
+    representaciones viejas salen por LRU.
+    """
+
+    def __init__(self, max_entradas):
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+
+    def obtener(self, clave):
+        with self._lock:
+            representacion = self._entradas.get(clave)
+            if representacion is None:
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return representacion
+
+    def guardar(self, clave, respuesta):
+        representacion = Representacion(respuesta, clave)
+        with self._lock:
+            self._entradas[clave] = representacion
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+                self.desalojos += 1
+        return representacion
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'entradas': len(self._entradas),
+                'max_entradas': self.max_entradas,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'desalojos': self.desalojos
+            }
+
+
+def preparar(respuesta, peticion):
+    """ETag, respuesta condicional (304), Cache-Control y compresión de una respuesta GET.
+
+    Las respuestas por streaming (exportación, send_file) se dejan como están; por
+    eso los PDF se responden con el cuerpo en memoria. El ETag de una variante
+    comprimida lleva el sufijo de su codificación, así que If-None-Match compara
+    contra la misma variante que tiene el cliente.
+    """
+    if peticion.method not in ('GET', 'HEAD') or respuesta.status_code != 200:
+        return respuesta
+    if respuesta.is_streamed:
+        return respuesta
+
+    if 'Cache-Control' not in respuesta.headers:
+        if Config.HTTP_MAX_AGE > 0:
+            respuesta.cache_control.max_age = Config.HTTP_MAX_AGE
+            respuesta.cache_control.must_revalidate = True
+        else:
+            # El cliente puede guardar la respuesta pero la revalida siempre (ETag)
+            respuesta.cache_control.no_cache = True
+
+    representacion = getattr(respuesta, 'representacion', None)
+    etag = representacion.etag if representacion else etag_de(respuesta.get_data())
+    codificacion = None
+    if respuesta.mimetype in COMPRIMIBLES and respuesta.content_length >= Config.HTTP_COMPRESION_MINIMO:
+        respuesta.vary.add('Accept-Encoding')
+        codificacion = peticion.accept_encodings.best_match(codificaciones())
+    respuesta.set_etag(f'{etag}-{codificacion}' if codificacion else etag)
+
+    respuesta.make_conditional(peticion)
+    if respuesta.status_code == 304 or not codificacion:
+        return respuesta
+
+    cuerpo = representacion.comprimido(codificacion) if representacion else comprimir(respuesta.get_data(), codificacion)
+    respuesta.set_data(cuerpo)
+    respuesta.headers['Content-Encoding'] = codificacion
+    return respuesta
+
+
+# Instancia global
+representaciones = CacheRepresentaciones(Config.HTTP_CACHE_MAX_ENTRADAS)
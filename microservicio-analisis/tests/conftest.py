@@ -0,0 +1,27 @@
+"""Configuración común de las pruebas.
+
+Las pruebas corren contra el sustituto en memoria de cx_Oracle de los benchmarks,
+que se registra antes de importar la aplicación. El backend de Node no se usa:
+NODE_BACKEND_URL apunta a un puerto cerrado para que ningún fallo pase inadvertido.
+
+    cd microservicio-analisis && python -m pytest -q
+"""
+import os
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [RAIZ, os.path.join(RAIZ, 'benchmarks')]
+os.environ.setdefault('NODE_BACKEND_URL', 'http://127.0.0.1:9')
+
+import oracle_memoria  # noqa: E402
+
+oracle_memoria.instalar()
+
+
+@pytest.fixture
+def almacen():
+    """Tablas en memoria vacías para cada prueba"""
+    oracle_memoria.reiniciar()
+    return oracle_memoria
@@ -0,0 +1,224 @@
+import math
+import time
+
+import numpy as np
+import pytest
+
+from config import Config
+from services import agregados as modulo
+from services.agregados import AgregadoColeccion, AgregadosIncrementales, EstadisticaWelford, HistogramaCuantiles
+
+
+def welford(valores):
+    estadistica = EstadisticaWelford()
+    for valor in valores:
+        estadistica.agregar(valor)
+    return estadistica
+
+
+def test_welford_combinar_y_quitar_coincide_con_numpy():
+    generador = np.random.default_rng(7)
+    valores = generador.gamma(2.0, 12.0, 1000)
+
+    combinada = welford(valores[:300])
+    combinada.combinar(welford(valores[300:]))
+    combinada.combinar(EstadisticaWelford())
+    assert combinada.n == 1000
+    assert combinada.media == pytest.approx(valores.mean())
+    assert combinada.desviacion_std == pytest.approx(valores.std(ddof=1))
+
+    for valor in valores[:400]:
+        combinada.quitar(valor)
+    assert combinada.media == pytest.approx(valores[400:].mean())
+    assert combinada.desviacion_std == pytest.approx(valores[400:].std(ddof=1))
+
+
+def test_welford_sin_datos():
+    estadistica = welford([5.0])
+    assert math.isnan(estadistica.desviacion_std)
+    estadistica.quitar(5.0)
+    assert (estadistica.n, estadistica.media) == (0, 0.0)
+
+
+def test_sketch_combinado_igual_al_de_todos_los_valores():
+    generador = np.random.default_rng(11)
+    valores = generador.lognormal(3.0, 0.6, 5000)
+    partes = [HistogramaCuantiles() for _ in range(3)]
+    for parte, trozo in zip(partes, np.array_split(valores, 3)):
+        parte.agregar(trozo)
+    combinado = HistogramaCuantiles()
+    for parte in partes:
+        combinado.combinar(parte)
+    todos = HistogramaCuantiles()
+    todos.agregar(valores)
+
+    assert np.array_equal(combinado.conteos, todos.conteos)
+    for q in (0.1, 0.5, 0.9):
+        assert combinado.cuantil(q) == pytest.approx(np.quantile(valores, q), rel=0.02)
+
+
+def test_sketch_bajas_exactas():
+    sketch = HistogramaCuantiles()
+    sketch.agregar([1.0, 2.0, 3.0])
+    for valor in [1.0, 2.0, 3.0]:
+        sketch.agregar_valor(valor, -1)
+    assert not sketch.conteos.any()
+    assert math.isnan(sketch.cuantil(0.5))
+
+
+def arboles():
+    return AgregadoColeccion(('especie',), ('dap',), {'clase_dap': ('dap', modulo.clase_dap)})
+
+
+def test_agregado_por_columnas_con_modificaciones():
+    agregado = arboles()
+    documentos = [{'_id': str(i), 'especie': f'e{i % 3}', 'dap': float(10 + i)}
+                  for i in range(AgregadoColeccion.CAPACIDAD_INICIAL + 10)]
+    agregado.aplicar(documentos)
+    # Volver a aplicar lo mismo no cambia nada
+    agregado.aplicar(documentos[:50])
+    # El mínimo cambia de especie y de dap; uno pierde el dap
+    agregado.aplicar([{'_id': '0', 'especie': 'nueva', 'dap': 500.0}, {'_id': '1', 'especie': 'e1', 'dap': None}])
+
+    dap = np.array([documento['dap'] for documento in documentos[2:]] + [500.0])
+    assert len(agregado) == len(documentos)
+    assert agregado.conteos['especie']['nueva'] == 1
+    assert sum(agregado.conteos['especie'].values()) == len(documentos)
+    assert sum(agregado.conteos['clase_dap'].values()) == len(dap)
+    assert agregado.extremos('dap') == (12.0, dap.max())
+    assert agregado.estadisticas['dap'].media == pytest.approx(dap.mean())
+
+
+class BackendFalso:
+    def __init__(self, documentos):
+        self.documentos = documentos
+        self.pedidos = []
+
+    def iterar_export(self, coleccion, campos, desde=None):
+        self.pedidos.append((coleccion, desde))
+        documentos = self.documentos.get(coleccion, [])
+        return iter([d for d in documentos if desde is None or d['updatedAt'] >= desde])
+
+
+def test_reconciliacion_en_segundo_plano_refleja_borrados(monkeypatch):
+    backend = BackendFalso({'arboles': [
+        {'_id': 'a', 'especie': 'roble', 'dap': 20.0, 'updatedAt': '2024-01-01'},
+        {'_id': 'b', 'especie': 'cedro', 'dap': 30.0, 'updatedAt': '2024-01-02'}
+    ]})
+    monkeypatch.setattr(modulo, 'backend', backend)
+    monkeypatch.setattr(Config, 'AGREGADOS_INTERVALO', 0)
+    monkeypatch.setattr(Config, 'AGREGADOS_RECONCILIACION', 3600)
+    incrementales = AgregadosIncrementales()
+
+    assert incrementales.especies()['distribucion_completa'] == {'roble': 1, 'cedro': 1}
+
+    backend.documentos['arboles'] = [{'_id': 'b', 'especie': 'cedro', 'dap': 30.0, 'updatedAt': '2024-01-02'}]
+    # Un cambio incremental no ve el borrado
+    assert incrementales.especies()['total_arboles'] == 2
+    assert ('arboles', '2024-01-02') in backend.pedidos
+
+    monkeypatch.setattr(Config, 'AGREGADOS_RECONCILIACION', 0)
+    incrementales.sincronizar()
+    for _ in range(100):
+        if not incrementales._reconciliando:
+            break
+        time.sleep(0.01)
+    assert incrementales.colecciones['arboles'].conteos['especie'] == {'cedro': 1}
+    assert incrementales._marcas['arboles'] == '2024-01-02'
+
+
+def test_mismo_documento_dos_veces_en_un_bloque():
+    agregado = arboles()
+    agregado.aplicar([
+        {'_id': 'a', 'especie': 'roble', 'dap': 10.0},
+        {'_id': 'b', 'especie': 'cedro', 'dap': 20.0},
+        {'_id': 'a', 'especie': 'ceiba', 'dap': 40.0}
+    ])
+    assert agregado.conteos['especie'] == {'cedro': 1, 'ceiba': 1}
+    assert agregado.extremos('dap') == (20.0, 40.0)
+    assert agregado.estadisticas['dap'].media == pytest.approx(30.0)
+
+
+def test_agregado_solo_categorico():
+    muestras = AgregadoColeccion(('tipo', 'estado'))
+    muestras.aplicar([{'_id': str(i), 'tipo': 'suelo', 'estado': None} for i in range(3)])
+    assert len(muestras) == 3
+    assert muestras.conteos == {'tipo': {'suelo': 3}, 'estado': {}}
+
+
+def test_resumen_incremental_sin_descargar_colecciones_completas(monkeypatch):
+    from werkzeug.datastructures import MultiDict
+    from services import analisis_service, precarga
+    from services.analisis_service import AnalisisService
+    from services.precarga import colecciones_a_precargar
+
+    backend = BackendFalso({
+        'arboles': [
+            {'_id': 'a', 'especie': 'roble', 'dap': 20.0, 'updatedAt': '2024-01-01'},
+            {'_id': 'b', 'especie': 'cedro', 'dap': 30.0, 'updatedAt': '2024-01-02'}
+        ],
+        'muestras': [
+            {'_id': 'm1', 'tipo': 'suelo', 'estado': 'Pendiente', 'updatedAt': '2024-01-01'},
+            {'_id': 'm2', 'tipo': 'hoja', 'estado': 'Procesado', 'updatedAt': '2024-01-01'},
+            {'_id': 'm3', 'tipo': 'hoja', 'estado': 'Procesado', 'updatedAt': '2024-01-01'}
+        ]
+    })
+    monkeypatch.setattr(modulo, 'backend', backend)
+    monkeypatch.setattr(Config, 'MODO_AGREGACION', 'incremental')
+    incrementales = AgregadosIncrementales()
+    monkeypatch.setattr(analisis_service, 'agregados', incrementales)
+    monkeypatch.setattr(precarga, 'agregados', incrementales)
+    descargadas = []
+
+    def obtener_coleccion(coleccion):
+        descargadas.append(coleccion)
+        return [{'codigo': 'C1', 'departamento': 'Antioquia'}, {'codigo': 'C2', 'departamento': 'Meta'}]
+
+    def sin_descargas(*args, **kwargs):
+        raise AssertionError('el resumen incremental no descarga colecciones completas')
+
+    monkeypatch.setattr(AnalisisService, 'obtener_coleccion', staticmethod(obtener_coleccion))
+    monkeypatch.setattr(AnalisisService, 'obtener_datos_mongodb', staticmethod(sin_descargas))
+
+    resumen = AnalisisService.generar_resumen_general()
+    assert descargadas == ['conglomerados']
+    assert resumen['conglomerados']['total'] == 2
+    assert resumen['arboles'] == {'total': 2, 'especies_unicas': 2}
+    assert resumen['muestras'] == {'total': 3, 'pendientes': 1, 'procesadas': 2}
+    assert colecciones_a_precargar('/api/analisis/resumen-general', MultiDict()) == ('conglomerados',)
+    assert colecciones_a_precargar('/api/analisis/especies', MultiDict()) == ()
+
+
+def test_consultas_no_esperan_la_descarga_de_cambios(monkeypatch):
+    import threading
+
+    backend = BackendFalso({'arboles': [{'_id': 'a', 'especie': 'roble', 'dap': 20.0, 'updatedAt': '2024-01-01'}]})
+    monkeypatch.setattr(modulo, 'backend', backend)
+    monkeypatch.setattr(Config, 'AGREGADOS_INTERVALO', 0)
+    monkeypatch.setattr(Config, 'AGREGADOS_RECONCILIACION', 3600)
+    incrementales = AgregadosIncrementales()
+    incrementales.sincronizar()
+
+    descargando, liberar = threading.Event(), threading.Event()
+    iterar_export = backend.iterar_export
+
+    def lento(coleccion, campos, desde=None):
+        descargando.set()
+        liberar.wait(5)
+        return iterar_export(coleccion, campos, desde)
+
+    monkeypatch.setattr(backend, 'iterar_export', lento)
+    backend.documentos['arboles'].append({'_id': 'b', 'especie': 'cedro', 'dap': 30.0, 'updatedAt': '2024-01-02'})
+    sincronizacion = threading.Thread(target=incrementales.sincronizar)
+    sincronizacion.start()
+    assert descargando.wait(5)
+
+    # Mientras la descarga está en curso las consultas responden con lo último conocido
+    inicio = time.monotonic()
+    assert incrementales.especies()['total_arboles'] == 1
+    assert time.monotonic() - inicio < 1
+
+    liberar.set()
+    sincronizacion.join(5)
+    monkeypatch.setattr(backend, 'iterar_export', iterar_export)
+    assert incrementales.especies()['distribucion_completa'] == {'roble': 1, 'cedro': 1}
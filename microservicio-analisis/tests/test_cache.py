@@ -0,0 +1,164 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from services.cache_service import SnapshotCache
+
+
+def test_hilos_simultaneos_cargan_una_vez():
+    cache = SnapshotCache(60, 8)
+    cargas = []
+    inicio = threading.Barrier(8)
+
+    def cargar():
+        cargas.append(1)
+        time.sleep(0.1)
+        return {'filas': 3}
+
+    resultados = []
+
+    def pedir():
+        inicio.wait()
+        resultados.append(cache.obtener('arboles', cargar))
+
+    hilos = [threading.Thread(target=pedir) for _ in range(8)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    assert len(cargas) == 1
+    assert len(resultados) == 8 and all(resultado is resultados[0] for resultado in resultados)
+    assert cache.obtener('arboles', cargar) is resultados[0]
+
+
+def test_error_de_la_carga_llega_a_quienes_esperan():
+    cache = SnapshotCache(60, 8)
+    empezo = threading.Event()
+    errores = []
+
+    def cargar():
+        empezo.set()
+        time.sleep(0.1)
+        raise ConnectionError('backend caído')
+
+    def esperar():
+        empezo.wait()
+        try:
+            cache.obtener('arboles', lambda: 'no debería cargar')
+        except ConnectionError as e:
+            errores.append(e)
+
+    seguidor = threading.Thread(target=esperar)
+    seguidor.start()
+    with pytest.raises(ConnectionError):
+        cache.obtener('arboles', cargar)
+    seguidor.join()
+
+    assert len(errores) == 1
+    # No se guardó nada: la siguiente petición vuelve a cargar
+    assert cache.obtener('arboles', lambda: 'nuevo') == 'nuevo'
+
+
+def test_invalidar_durante_la_carga_no_guarda_el_valor():
+    cache = SnapshotCache(60, 8)
+
+    def cargar():
+        cache.invalidar('arboles')
+        return 'viejo'
+
+    assert cache.obtener('arboles', cargar) == 'viejo'
+    assert cache.version('arboles') is None
+
+
+def test_corrutinas_simultaneas_cargan_una_vez():
+    cache = SnapshotCache(60, 8)
+    cargas = []
+
+    async def cargar():
+        cargas.append(1)
+        await asyncio.sleep(0.05)
+        return ['documento']
+
+    async def principal():
+        return await asyncio.gather(*(cache.obtener_async('muestras', cargar) for _ in range(20)))
+
+    resultados = asyncio.run(principal())
+    assert len(cargas) == 1
+    assert all(resultado is resultados[0] for resultado in resultados)
+
+
+def test_corrutina_espera_la_carga_de_un_hilo():
+    cache = SnapshotCache(60, 8)
+    empezo = threading.Event()
+
+    def cargar():
+        empezo.set()
+        time.sleep(0.1)
+        return 'del hilo'
+
+    hilo = threading.Thread(target=cache.obtener, args=('arboles', cargar))
+    hilo.start()
+    empezo.wait()
+
+    async def no_cargar():
+        raise AssertionError('la carga ya estaba en curso')
+
+    assert asyncio.run(cache.obtener_async('arboles', no_cargar)) == 'del hilo'
+    hilo.join()
+
+
+def test_corrutina_cancelada_no_deja_colgados_a_los_demas():
+    cache = SnapshotCache(60, 8)
+
+    async def cargar():
+        await asyncio.sleep(10)
+
+    async def principal():
+        lider = asyncio.ensure_future(cache.obtener_async('arboles', cargar))
+        await asyncio.sleep(0)
+        seguidor = asyncio.ensure_future(cache.obtener_async('arboles', cargar))
+        await asyncio.sleep(0)
+        lider.cancel()
+        with pytest.raises(RuntimeError, match='cancelada'):
+            await asyncio.wait_for(seguidor, 1)
+
+    asyncio.run(principal())
+
+
+def test_lru_desaloja_la_menos_usada():
+    cache = SnapshotCache(60, 2)
+    cache.obtener('a', lambda: 1)
+    cache.obtener('b', lambda: 2)
+    cache.obtener('a', lambda: 0)
+    cache.obtener('c', lambda: 3)
+    assert cache.version('b') is None and cache.version('a') is not None
+    assert cache.estadisticas()['desalojos'] == 1
+
+
+def test_recarga_con_los_mismos_datos_conserva_la_version():
+    import numpy as np
+
+    cache = SnapshotCache(0.01, 8)
+    datos = {'dap': np.array([10.0, 20.0], dtype=np.float32), 'especie': ['roble', 'cedro']}
+    cache.obtener('arboles', lambda: datos)
+    version = cache.version('arboles')
+    assert version is not None
+
+    time.sleep(0.02)
+    assert cache.version('arboles') is None
+    # Recarga con otro objeto del mismo contenido
+    cache.obtener('arboles', lambda: {'dap': datos['dap'].copy(), 'especie': list(datos['especie'])})
+    assert cache.version('arboles') == version
+
+    time.sleep(0.02)
+    cache.obtener('arboles', lambda: {'dap': np.array([10.0, 21.0], dtype=np.float32), 'especie': ['roble', 'cedro']})
+    assert cache.version('arboles') not in (None, version)
+
+
+def test_valor_no_serializable_no_tiene_version():
+    cache = SnapshotCache(60, 8)
+    cache.obtener('x', lambda: {(1, 2): 'clave no serializable'})
+    assert cache.version('x') is None
@@ -0,0 +1,234 @@
+import math
+import time
+
+import numpy as np
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from config import Config
+from services import espacial as modulo
+from services.espacial import (Caja, ConsultaEspacial, IndiceEspacial, MallaEspacial, _Estado,
+                               caja_de_radio, distancia_km)
+from services.filtros import FiltroInvalido
+
+
+def malla_de(puntos, tamano=0.05):
+    malla = MallaEspacial(tamano)
+    for clave, (latitud, longitud) in puntos.items():
+        malla.mover(clave, latitud, longitud)
+    return malla
+
+
+def test_en_caja_coincide_con_fuerza_bruta():
+    generador = np.random.default_rng(3)
+    puntos = {f's{i}': (float(lat), float(lon))
+              for i, (lat, lon) in enumerate(zip(generador.uniform(4, 6, 2000), generador.uniform(-75, -73, 2000)))}
+    malla = malla_de(puntos)
+
+    for caja in (Caja(4.5, -74.5, 5.0, -74.0), Caja(4.0, -75.0, 6.0, -73.0), Caja(4.71, -74.07, 4.72, -74.06),
+                 Caja(-10.0, -180.0, 90.0, 180.0)):
+        esperadas = {clave for clave, punto in puntos.items() if caja.contiene(*punto)}
+        assert set(malla.en_caja(caja)) == esperadas
+        assert malla.celdas_en(caja) == sorted(malla.celdas_en(caja))
+
+
+def test_en_caja_incluye_los_bordes():
+    malla = malla_de({'a': (4.0, -74.0), 'b': (4.05, -73.95), 'c': (4.06, -73.95)})
+    assert sorted(malla.en_caja(Caja(4.0, -74.0, 4.05, -73.95))) == ['a', 'b']
+    assert malla.en_caja(Caja(10.0, 10.0, 11.0, 11.0)) == []
+
+
+def test_celdas_en_rectangulo_grande_y_sin_caja():
+    malla = malla_de({'a': (4.01, -74.01), 'b': (4.51, -73.51), 'c': (-30.0, 120.0)})
+    assert malla.celdas_en() == sorted(malla.celda(*p) for p in ((4.01, -74.01), (4.51, -73.51), (-30.0, 120.0)))
+    # Más celdas posibles que ocupadas: se filtran las ocupadas
+    assert malla.celdas_en(Caja(0.0, -80.0, 10.0, -70.0)) == [malla.celda(4.01, -74.01), malla.celda(4.51, -73.51)]
+
+
+def test_mover_y_quitar_actualizan_celdas():
+    malla = malla_de({'a': (4.01, -74.01)})
+    anterior, nueva = malla.mover('a', 5.01, -74.01)
+    assert anterior == malla.celda(4.01, -74.01) and nueva == malla.celda(5.01, -74.01)
+    assert malla.claves(anterior) == ()
+    assert malla.quitar('a') == nueva
+    assert malla.quitar('a') is None
+    assert len(malla) == 0 and malla.celdas_en() == []
+
+
+def test_distancia_km_conocida():
+    # Bogotá - Medellín, unos 240 km en línea recta
+    assert distancia_km(4.711, -74.0721, 6.2442, -75.5812) == pytest.approx(239.5, abs=1.5)
+    assert distancia_km(4.0, -74.0, 4.0, -74.0) == 0.0
+    assert distancia_km(0.0, 0.0, 0.0, 1.0) == pytest.approx(modulo.KM_POR_GRADO)
+
+
+def test_caja_de_radio_contiene_el_circulo():
+    caja = caja_de_radio(4.7, -74.0, 10.0)
+    for angulo in range(0, 360, 15):
+        latitud = 4.7 + 10.0 / modulo.KM_POR_GRADO * math.sin(math.radians(angulo)) * 0.999
+        longitud = -74.0 + 10.0 / modulo.KM_POR_GRADO / math.cos(math.radians(4.7)) * math.cos(math.radians(angulo)) * 0.999
+        assert caja.contiene(latitud, longitud)
+    # Cerca del polo se toma toda la franja de longitudes
+    assert caja_de_radio(89.99, 0.0, 50.0)[1::2] == (-180.0, 180.0)
+
+
+def test_en_radio_ordena_por_distancia_y_coincide_con_fuerza_bruta():
+    generador = np.random.default_rng(11)
+    puntos = {f's{i}': (float(lat), float(lon))
+              for i, (lat, lon) in enumerate(zip(generador.uniform(4, 5, 1000), generador.uniform(-75, -74, 1000)))}
+    malla = malla_de(puntos)
+
+    encontradas = malla.en_radio(4.5, -74.5, 15.0)
+    esperadas = {clave for clave, punto in puntos.items() if distancia_km(4.5, -74.5, *punto) <= 15.0}
+    assert {clave for clave, _ in encontradas} == esperadas
+    distancias = [distancia for _, distancia in encontradas]
+    assert distancias == sorted(distancias) and max(distancias) <= 15.0
+
+
+@pytest.mark.parametrize('argumentos, mensaje', [
+    ({'bbox': '1,2,3'}, 'bbox debe ser'),
+    ({'bbox': 'a,b,c,d'}, 'bbox debe ser'),
+    ({'bbox': '5,0,4,1'}, 'bbox fuera de rango'),
+    ({'lat': '4', 'lon': '-74'}, 'necesita lat, lon y radio_km'),
+    ({'lat': '95', 'lon': '-74', 'radio_km': '1'}, 'fuera de rango'),
+    ({'lat': '4', 'lon': '-74', 'radio_km': '0'}, 'mayor que 0'),
+    ({'lat': 'nan', 'lon': '-74', 'radio_km': '1'}, 'debe ser un número'),
+    ({'bbox': '4,-75,5,-74', 'lat': '4', 'lon': '-74', 'radio_km': '1'}, 'no ambos'),
+    ({'celda': '-1'}, 'celda debe ser mayor que 0')
+])
+def test_consulta_invalida(argumentos, mensaje):
+    with pytest.raises(FiltroInvalido, match=mensaje):
+        ConsultaEspacial.desde_argumentos(MultiDict(argumentos))
+
+
+def test_consulta_valida():
+    consulta = ConsultaEspacial.desde_argumentos(MultiDict({'bbox': ' 4,-75,5,-74 ', 'celda': '0.1'}))
+    assert consulta == (Caja(4.0, -75.0, 5.0, -74.0), None, None, 0.1)
+    consulta = ConsultaEspacial.desde_argumentos(MultiDict({'lat': '4.5', 'lon': '-74.5', 'radio_km': '2'}))
+    assert consulta == (None, (4.5, -74.5), 2.0, None)
+
+
+def test_estado_modifica_arboles_sin_duplicar():
+    estado = _Estado(0.05)
+    estado.aplicar_subparcelas([{'_id': 's1', 'codigoCong': 'C1', 'latitud': 4.5, 'longitud': -74.5},
+                                {'_id': 's2', 'codigoCong': 'C1', 'latitud': 4.6, 'longitud': -74.5}])
+    estado.aplicar_arboles([{'_id': f'a{i}', 'subparcela': 's1', 'especie': 'roble', 'dap': 10.0 + i}
+                            for i in range(2000)])
+    # Mover un árbol de subparcela y de especie, y uno sin DAP
+    estado.aplicar_arboles([{'_id': 'a0', 'subparcela': 's2', 'especie': 'cedro', 'dap': 50.0},
+                            {'_id': 'a1', 'subparcela': 's1', 'especie': None, 'dap': None}])
+
+    assert len(estado) == 2000
+    assert estado.fila(estado._posiciones['a0']) == ('s2', 'cedro', 50.0)
+    subparcela, especie, dap = estado.fila(estado._posiciones['a1'])
+    assert (subparcela, especie) == ('s1', None) and math.isnan(dap)
+    assert estado.parcelas['s1'].arboles == 1999
+    assert estado.parcelas['s1'].especies == {'roble': 1998}
+    assert estado.parcelas['s1'].dap.media == pytest.approx(np.arange(12.0, 2010.0).mean())
+    assert estado.parcelas['s2'].resumen(1)['arboles'] == 1
+
+
+class BackendFalso:
+    def __init__(self, documentos):
+        self.documentos = documentos
+        self.pedidos = []
+
+    def iterar_export(self, coleccion, campos, desde=None):
+        self.pedidos.append((coleccion, desde))
+        documentos = self.documentos.get(coleccion, [])
+        return iter([d for d in documentos if desde is None or d['updatedAt'] >= desde])
+
+
+def test_reconstruccion_en_segundo_plano_refleja_borrados(monkeypatch):
+    backend = BackendFalso({
+        'subparcelas': [{'_id': 's1', 'codigoCong': 'C1', 'latitud': 4.5, 'longitud': -74.5, 'updatedAt': '2024-01-01'}],
+        'arboles': [
+            {'_id': 'a', 'subparcela': 's1', 'especie': 'roble', 'dap': 20.0, 'updatedAt': '2024-01-01'},
+            {'_id': 'b', 'subparcela': 's1', 'especie': 'cedro', 'dap': 30.0, 'updatedAt': '2024-01-02'}
+        ]
+    })
+    monkeypatch.setattr(modulo, 'backend', backend)
+    monkeypatch.setattr(Config, 'ESPACIAL_INTERVALO', 0)
+    monkeypatch.setattr(Config, 'ESPACIAL_RECONCILIACION', 3600)
+    indice = IndiceEspacial(0.05)
+    consulta = ConsultaEspacial(Caja(4.0, -75.0, 5.0, -74.0), None, None, None)
+
+    indice.preparar([])
+    assert indice.parcelas(consulta)['total'] == {'conglomerados': 0, 'subparcelas': 1, 'arboles': 2}
+
+    backend.documentos['arboles'] = backend.documentos['arboles'][1:]
+    # Un cambio incremental no ve el borrado
+    indice.preparar([])
+    assert indice.parcelas(consulta)['total']['arboles'] == 2
+    assert ('arboles', '2024-01-02') in backend.pedidos
+    assert not indice._reconciliando
+
+    monkeypatch.setattr(Config, 'ESPACIAL_RECONCILIACION', 0)
+    indice.preparar([])
+    for _ in range(100):
+        if not indice._reconciliando:
+            break
+        time.sleep(0.01)
+    celdas = indice.celdas(consulta)
+    assert celdas['total']['arboles'] == 1 and celdas['total']['riqueza_especies'] == 1
+    assert indice._marcas == {'subparcelas': '2024-01-01', 'arboles': '2024-01-02'}
+
+
+def test_reconstruccion_fallida_conserva_el_indice(monkeypatch, capsys):
+    backend = BackendFalso({
+        'subparcelas': [{'_id': 's1', 'codigoCong': 'C1', 'latitud': 4.5, 'longitud': -74.5, 'updatedAt': '2024-01-01'}],
+        'arboles': [{'_id': 'a', 'subparcela': 's1', 'especie': 'roble', 'dap': 20.0, 'updatedAt': '2024-01-01'}]
+    })
+    monkeypatch.setattr(modulo, 'backend', backend)
+    indice = IndiceEspacial(0.05)
+    indice.sincronizar(forzar=True)
+    estado = indice._estado
+
+    def fallar(*args, **kwargs):
+        raise ConnectionError('sin backend')
+    monkeypatch.setattr(backend, 'iterar_export', fallar)
+    indice._reconciliando = True
+    indice._reconciliar_en_segundo_plano()
+
+    assert indice._estado is estado and not indice._reconciliando
+    assert 'Error al reconstruir el índice espacial: sin backend' in capsys.readouterr().out
+
+
+def test_consultas_no_esperan_la_descarga_de_cambios(monkeypatch):
+    import threading
+
+    backend = BackendFalso({
+        'subparcelas': [{'_id': 's1', 'codigoCong': 'C1', 'latitud': 4.5, 'longitud': -74.5, 'updatedAt': '2024-01-01'}],
+        'arboles': [{'_id': 'a', 'subparcela': 's1', 'especie': 'roble', 'dap': 20.0, 'updatedAt': '2024-01-01'}]
+    })
+    monkeypatch.setattr(modulo, 'backend', backend)
+    monkeypatch.setattr(Config, 'ESPACIAL_INTERVALO', 0)
+    monkeypatch.setattr(Config, 'ESPACIAL_RECONCILIACION', 3600)
+    indice = IndiceEspacial(0.05)
+    indice.preparar([])
+    consulta = ConsultaEspacial(Caja(4.0, -75.0, 5.0, -74.0), None, None, None)
+
+    descargando, liberar = threading.Event(), threading.Event()
+    iterar_export = backend.iterar_export
+
+    def lento(coleccion, campos, desde=None):
+        descargando.set()
+        liberar.wait(5)
+        return iterar_export(coleccion, campos, desde)
+
+    monkeypatch.setattr(backend, 'iterar_export', lento)
+    backend.documentos['arboles'].append({'_id': 'b', 'subparcela': 's1', 'especie': 'cedro', 'dap': 30.0,
+                                          'updatedAt': '2024-01-02'})
+    sincronizacion = threading.Thread(target=indice.preparar, args=([],))
+    sincronizacion.start()
+    assert descargando.wait(5)
+
+    # Otra consulta no espera la descarga en curso: responde con el índice actual
+    inicio = time.monotonic()
+    indice.preparar([])
+    assert indice.parcelas(consulta)['total']['arboles'] == 1
+    assert time.monotonic() - inicio < 1
+
+    liberar.set()
+    sincronizacion.join(5)
+    assert indice.parcelas(consulta)['total']['arboles'] == 2
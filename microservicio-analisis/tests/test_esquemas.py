@@ -0,0 +1,30 @@
+import math
+
+import numpy as np
+
+from services.esquemas import a_float64, construir_frame_arboles
+from services.motor_analisis import MotorAnalisis
+
+
+def test_a_float64_recupera_los_valores_del_json():
+    originales = np.round(np.random.default_rng(1).uniform(0.01, 5000, 100000), 2)
+    assert np.array_equal(a_float64(originales.astype(np.float32)), originales)
+
+
+def test_a_float64_conserva_cero_nan_y_negativos():
+    valores = a_float64(np.array([0.0, np.nan, -2.5, 6.3], dtype=np.float32))
+    assert valores[0] == 0.0 and math.isnan(valores[1])
+    assert list(valores[2:]) == [-2.5, 6.3]
+
+
+def test_estadisticas_sin_ruido_de_float32():
+    dap = [6.3, 17.3, 40.1, 12.7]
+    frame = construir_frame_arboles({
+        'especie': ['roble'] * 4, 'condicion': ['viva'] * 4, 'sanitario': ['sano'] * 4,
+        'dap': dap, 'altura': [None] * 4
+    })
+    estadisticas = MotorAnalisis._agregar_frame_arboles(frame)['dap_altura']['dap']
+    assert estadisticas['minimo'] == 6.3
+    assert estadisticas['maximo'] == 40.1
+    assert estadisticas['mediana'] == float(np.median(dap))
+    assert estadisticas['promedio'] == float(np.mean(dap))
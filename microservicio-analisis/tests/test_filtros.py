@@ -0,0 +1,45 @@
+from datetime import datetime
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from services.filtros import Filtros, FiltroInvalido, leer_fecha
+
+
+@pytest.mark.parametrize('valor, esperada', [
+    ('2024-01-31', datetime(2024, 1, 31)),
+    ('2024-01-31T10:30:00Z', datetime(2024, 1, 31, 10, 30)),
+    ('2024-01-01T00:00:00+05:00', datetime(2023, 12, 31, 19, 0)),
+    ('2024-01-01T03:00:00-03:00', datetime(2024, 1, 1, 6, 0)),
+])
+def test_fechas_en_utc_sin_zona(valor, esperada):
+    assert leer_fecha(valor, 'desde') == esperada
+
+
+def test_hasta_sin_hora_cubre_el_dia():
+    assert leer_fecha('2024-01-31', 'hasta') == datetime(2024, 1, 31, 23, 59, 59, 999999)
+
+
+def test_desde_con_desfase_y_hasta_sin_zona():
+    filtros = Filtros.desde_argumentos(MultiDict({'desde': '2024-01-01T00:00:00+05:00', 'hasta': '2025-01-01'}))
+    assert filtros.desde == datetime(2023, 12, 31, 19, 0)
+
+    with pytest.raises(FiltroInvalido):
+        Filtros.desde_argumentos(MultiDict({'desde': '2025-01-02T10:00:00+05:00', 'hasta': '2025-01-01'}))
+
+
+def test_fecha_no_valida():
+    with pytest.raises(FiltroInvalido):
+        leer_fecha('31/01/2024', 'desde')
+
+
+def test_error_de_version_responde_json(almacen, monkeypatch):
+    import app as aplicacion
+
+    def fallar(tipo_reporte):
+        raise TypeError('versión')
+
+    monkeypatch.setattr(aplicacion, 'version_datos', fallar)
+    respuesta = aplicacion.app.test_client().get('/api/analisis/especies', query_string={'desde': 'ayer'})
+    assert respuesta.status_code == 400
+    assert 'error' in respuesta.json
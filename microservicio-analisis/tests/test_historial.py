@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import AnalisisReporte
+
+
+@pytest.fixture
+def cliente(almacen):
+    from app import app
+    return app.test_client()
+
+
+@pytest.fixture
+def reportes(almacen):
+    inicio = datetime(2024, 5, 1, 8, 0, 0)
+    # Dos reportes por minuto: el cursor tiene que desempatar por id
+    AnalisisReporte.crear_lote([{
+        'tipo_reporte': 'especies',
+        'titulo': f'Reporte {i}',
+        'descripcion': None,
+        'parametros': {'pagina': i},
+        'resultado': {'total': i},
+        'generado_por': 'pruebas',
+        'creado': inicio + timedelta(minutes=i // 2)
+    } for i in range(7)])
+
+
+def test_paginas_por_cursor_sin_huecos_ni_repetidos(cliente, reportes):
+    titulos, cursor = [], None
+    for _ in range(4):
+        consulta = {'limit': 3, **({'cursor': cursor} if cursor else {})}
+        respuesta = cliente.get('/api/reportes/historial', query_string=consulta)
+        assert respuesta.status_code == 200
+        titulos += [reporte['titulo'] for reporte in respuesta.json['reportes']]
+        cursor = respuesta.json['siguiente']
+        if not cursor:
+            break
+
+    assert titulos == [f'Reporte {i}' for i in reversed(range(7))]
+
+
+def test_ultima_pagina_completa_sin_mas_filas(reportes):
+    pagina, cursor = AnalisisReporte.listar(limit=7)
+    assert len(pagina) == 7
+    siguiente, cursor = AnalisisReporte.listar(limit=7, cursor=cursor)
+    assert siguiente == [] and cursor is None
+
+
+@pytest.mark.parametrize('limit, esperados', [('0', 1), ('-5', 1), ('100000', 7)])
+def test_limit_fuera_de_rango_se_acota(cliente, reportes, limit, esperados):
+    respuesta = cliente.get('/api/reportes/historial', query_string={'limit': limit})
+    assert respuesta.status_code == 200
+    assert respuesta.json['total'] == esperados
+
+
+def test_limit_cero_en_el_modelo(reportes):
+    assert AnalisisReporte.listar(limit=0) == ([], None)
+
+
+def test_limit_no_numerico(cliente, reportes):
+    assert cliente.get('/api/reportes/historial', query_string={'limit': 'diez'}).status_code == 400
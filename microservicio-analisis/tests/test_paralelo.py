@@ -0,0 +1,82 @@
+import math
+
+import numpy as np
+import pytest
+
+from config import Config
+from services import paralelo
+from services.esquemas import construir_frame_arboles
+from services.motor_analisis import MotorAnalisis
+
+
+@pytest.fixture(scope='module')
+def frame():
+    generador = np.random.default_rng(3)
+    filas = 20000
+    dap = generador.gamma(2.0, 12.0, filas)
+    dap[generador.random(filas) < 0.02] = np.nan
+    especies = np.array(['roble', 'cedro', 'ceiba', 'guadua', None], dtype=object)
+    return construir_frame_arboles({
+        'especie': list(especies[generador.integers(0, 5, filas)]),
+        'condicion': list(np.array(['viva', 'muerta'], dtype=object)[generador.integers(0, 2, filas)]),
+        'sanitario': ['sano'] * filas,
+        'dap': dap,
+        'altura': generador.uniform(2, 30, filas)
+    })
+
+
+@pytest.fixture(scope='module')
+def en_serie(frame):
+    anterior = Config.PARALELO_WORKERS
+    Config.PARALELO_WORKERS = 0
+    try:
+        return MotorAnalisis._agregar_frame_arboles(frame)
+    finally:
+        Config.PARALELO_WORKERS = anterior
+
+
+def comparar(paralelos, serie):
+    assert paralelos['especies'] == serie['especies']
+    assert paralelos['condicion'] == serie['condicion']
+    assert paralelos['dap_altura']['clasificacion_dap'] == serie['dap_altura']['clasificacion_dap']
+    for campo in ('dap', 'altura'):
+        calculadas, esperadas = paralelos['dap_altura'][campo], serie['dap_altura'][campo]
+        # Mediana y extremos exactos; media y desviación combinadas con Chan et al.
+        for clave in ('mediana', 'minimo', 'maximo'):
+            assert calculadas[clave] == esperadas[clave]
+        for clave in ('promedio', 'desviacion_std'):
+            assert calculadas[clave] == pytest.approx(esperadas[clave], rel=1e-9)
+
+
+@pytest.mark.parametrize('particiones', [1, 3])
+def test_pool_igual_que_en_serie(frame, en_serie, monkeypatch, particiones):
+    monkeypatch.setattr(Config, 'PARALELO_WORKERS', particiones)
+    comparar(paralelo.agregar_arboles(frame), en_serie)
+
+
+def test_particiones_por_grupos(frame, en_serie, monkeypatch):
+    monkeypatch.setattr(Config, 'PARALELO_WORKERS', 4)
+    grupos = np.sort(np.random.default_rng(5).integers(-1, 50, len(frame)))
+    comparar(paralelo.agregar_arboles(frame, grupos, 50), en_serie)
+
+
+def test_grupos_enteros_en_una_particion():
+    clave = np.array([-1, 0, 0, 2, 2, 2, 1, 3, 3, 3, 3])
+    asignadas = paralelo.asignar_particiones(len(clave), 3, clave, 4)
+    for grupo in np.unique(clave):
+        assert len(set(asignadas[clave == grupo])) == 1
+
+
+def test_sin_valores_numericos(monkeypatch):
+    monkeypatch.setattr(Config, 'PARALELO_WORKERS', 2)
+    frame = construir_frame_arboles({
+        'especie': ['roble'] * 4, 'condicion': ['viva'] * 4, 'sanitario': ['sano'] * 4,
+        'dap': [None] * 4, 'altura': [None] * 4
+    })
+    resultado = paralelo.agregar_arboles(frame)
+    assert resultado['especies']['total_arboles'] == 4
+    assert math.isnan(resultado['dap_altura']['dap']['mediana'])
+
+
+def test_pool_sin_fork():
+    assert paralelo._contexto().get_start_method() in ('forkserver', 'spawn')
@@ -0,0 +1,112 @@
+import threading
+
+import pytest
+
+from config import Config
+from services import pdf_service
+from services.pdf_service import PDFService, pdf_cache
+
+ESPECIES = {
+    'total_arboles': 10,
+    'especies_unicas': 2,
+    'top_5_especies': {'Quercus humboldtii': 6, 'Cedrela odorata': 4}
+}
+
+
+@pytest.fixture
+def renderizados(monkeypatch):
+    """Renderizar en el mismo hilo y contar los PDFs que se construyen"""
+    monkeypatch.setattr(Config, 'PDF_WORKERS', 0)
+    pdf_cache.invalidar()
+    tipos = []
+    renderizar = pdf_service._renderizar
+
+    def contar(tipo, datos, generado_en):
+        tipos.append(tipo)
+        return renderizar(tipo, datos, generado_en)
+
+    monkeypatch.setattr(pdf_service, '_renderizar', contar)
+    return tipos
+
+
+def test_pdf_repetido_sale_de_la_cache(renderizados):
+    pdf = PDFService.obtener_pdf('especies', ESPECIES)
+    assert pdf.startswith(b'%PDF')
+    assert PDFService.obtener_pdf('especies', dict(ESPECIES)) is pdf
+    assert renderizados == ['especies']
+
+
+def test_otro_analisis_se_renderiza_de_nuevo(renderizados):
+    PDFService.obtener_pdf('especies', ESPECIES)
+    PDFService.obtener_pdf('especies', {**ESPECIES, 'total_arboles': 11})
+    assert renderizados == ['especies', 'especies']
+
+
+def test_fecha_del_pdf_es_la_del_analisis(renderizados):
+    pdf = PDFService.obtener_pdf('especies', ESPECIES, '2024-03-05T14:30:00')
+    assert PDFService.obtener_pdf('especies', ESPECIES, '2024-03-05T14:30:00') is pdf
+    # Otro cálculo de los mismos datos lleva su propia fecha
+    assert PDFService.obtener_pdf('especies', ESPECIES, '2024-03-06T09:00:00') != pdf
+    assert renderizados == ['especies', 'especies']
+    assert pdf_service._fecha('2024-03-05T14:30:00') == '05/03/2024 14:30'
+
+
+def test_descargas_simultaneas_renderizan_una_vez(renderizados, monkeypatch):
+    inicio = threading.Barrier(4)
+    renderizar = pdf_service._renderizar
+
+    def lento(tipo, datos, generado_en):
+        # Las otras descargas llegan mientras este PDF se renderiza
+        threading.Event().wait(0.2)
+        return renderizar(tipo, datos, generado_en)
+
+    monkeypatch.setattr(pdf_service, '_renderizar', lento)
+    resultados = []
+
+    def descargar():
+        inicio.wait()
+        resultados.append(PDFService.obtener_pdf('especies', ESPECIES))
+
+    hilos = [threading.Thread(target=descargar) for _ in range(4)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    assert renderizados == ['especies']
+    assert len(resultados) == 4 and len(set(map(id, resultados))) == 1
+
+
+def test_renderizado_en_el_pool_de_procesos(monkeypatch):
+    monkeypatch.setattr(Config, 'PDF_WORKERS', 1)
+    monkeypatch.setattr(pdf_service, '_executor', None)
+    pdf_cache.invalidar()
+    resumen = {
+        'conglomerados': {'total': 3},
+        'arboles': {'total': 10, 'especies_unicas': 2},
+        'muestras': {'total': 5, 'procesadas': 4, 'pendientes': 1}
+    }
+    assert PDFService.obtener_pdf('general', resumen, '2024-03-05T14:30:00').startswith(b'%PDF')
+    # El pool no se crea con fork desde un worker con hilos
+    assert pdf_service._executor._mp_context.get_start_method() in ('forkserver', 'spawn')
+    pdf_service._executor.shutdown()
+
+
+def test_descarga_con_etag_y_compresion(renderizados, almacen, monkeypatch):
+    from app import app
+    from services.analisis_service import AnalisisService
+
+    monkeypatch.setattr(Config, 'HTTP_COMPRESION_MINIMO', 0)
+    monkeypatch.setattr(AnalisisService, 'analizar_distribucion_especies', staticmethod(lambda filtros: ESPECIES))
+    cliente = app.test_client()
+
+    respuesta = cliente.get('/api/reportes/pdf/especies', headers={'Accept-Encoding': 'gzip'})
+    assert respuesta.status_code == 200
+    assert respuesta.headers['Content-Encoding'] == 'gzip'
+    assert respuesta.headers['Content-Disposition'].startswith('attachment; filename=reporte_especies_')
+    etag = respuesta.headers['ETag']
+
+    condicional = cliente.get('/api/reportes/pdf/especies',
+                              headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert condicional.status_code == 304
+    assert renderizados == ['especies']
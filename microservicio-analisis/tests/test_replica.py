@@ -0,0 +1,105 @@
+import os
+
+import numpy as np
+import pytest
+
+from config import Config
+from services import replica as modulo
+from services.replica import ReplicaColumnar
+
+
+class BackendFalso:
+    def __init__(self):
+        self.documentos = []
+
+    def iterar_export(self, coleccion, campos, desde=None):
+        return iter([d for d in self.documentos if desde is None or d['updatedAt'] >= desde])
+
+
+def arbol(i, dap, actualizado):
+    return {'_id': f'{i:024x}', 'especie': 'roble', 'condicion': 'viva', 'sanitario': 'sano',
+            'codigoSubparcela': 'SP-0001', 'subparcela': 'sp1', 'dap': dap, 'altura': 10.0,
+            'createdAt': '2024-01-01T00:00:00.000Z', 'updatedAt': actualizado}
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    falso = BackendFalso()
+    monkeypatch.setattr(modulo, 'backend', falso)
+    return falso
+
+
+def versiones(directorio):
+    return sorted(nombre for nombre in os.listdir(directorio) if nombre.startswith('v'))
+
+
+def publicar_tres(replica, backend):
+    for i in range(3):
+        backend.documentos.append(arbol(i, 20.0 + i, f'2024-02-0{i + 1}T00:00:00.000Z'))
+        assert replica.refrescar()
+
+
+def test_versiones_reemplazadas_se_conservan_durante_la_gracia(tmp_path, backend, monkeypatch):
+    monkeypatch.setattr(Config, 'REPLICA_GRACIA', 300)
+    replica = ReplicaColumnar(str(tmp_path))
+    publicar_tres(replica, backend)
+    assert versiones(tmp_path) == ['v000001', 'v000002', 'v000003']
+
+
+def test_versiones_vencidas_se_borran(tmp_path, backend, monkeypatch):
+    monkeypatch.setattr(Config, 'REPLICA_GRACIA', -1)
+    replica = ReplicaColumnar(str(tmp_path))
+    publicar_tres(replica, backend)
+    assert versiones(tmp_path) == ['v000003']
+
+
+def test_lector_de_una_version_borrada_abre_la_vigente(tmp_path, backend, monkeypatch):
+    monkeypatch.setattr(Config, 'REPLICA_GRACIA', -1)
+    replica = ReplicaColumnar(str(tmp_path))
+    publicar_tres(replica, backend)
+    vigente = replica._leer_manifiesto()
+    # Manifiesto leído antes de que se publicara la versión vigente
+    viejo = dict(vigente, version=1, carpeta='v000001', filas=1)
+    lecturas = iter([viejo, vigente])
+    monkeypatch.setattr(replica, '_leer_manifiesto', lambda: next(lecturas))
+
+    columnas = replica.columnas_arboles()
+    assert list(columnas['dap']) == [20.0, 21.0, 22.0]
+
+
+def test_codigos_de_mas_de_32767_subparcelas(tmp_path, backend):
+    subparcelas = 40000
+    for i in range(subparcelas):
+        documento = arbol(i, 20.0, '2024-02-01T00:00:00.000Z')
+        documento['codigoSubparcela'] = f'SP-{i:05d}'
+        backend.documentos.append(documento)
+    replica = ReplicaColumnar(str(tmp_path))
+    assert replica.refrescar(completa=True)
+
+    columna = replica.columnas_arboles()['codigoSubparcela']
+    assert columna.codigos.dtype == np.int32
+    assert columna.codigos.min() == 0 and len(set(columna.codigos.tolist())) == subparcelas
+    assert columna.categorias[columna.codigos[-1]] == 'SP-39999'
+    assert replica.columnas_arboles()['especie'].codigos.dtype == np.int16
+
+
+def test_cambios_que_agrandan_el_diccionario_ensanchan_los_codigos(tmp_path, backend):
+    for i in range(32000):
+        documento = arbol(i, 20.0, '2024-02-01T00:00:00.000Z')
+        documento['codigoSubparcela'] = f'SP-{i:05d}'
+        backend.documentos.append(documento)
+    replica = ReplicaColumnar(str(tmp_path))
+    assert replica.refrescar(completa=True)
+    assert replica.columnas_arboles()['codigoSubparcela'].codigos.dtype == np.int16
+
+    for i in range(32000, 33000):
+        documento = arbol(i, 20.0, '2024-02-02T00:00:00.000Z')
+        documento['codigoSubparcela'] = f'SP-{i:05d}'
+        backend.documentos.append(documento)
+    # Un árbol existente pasa a una subparcela nueva
+    backend.documentos[0] = dict(backend.documentos[0], codigoSubparcela='SP-99999', updatedAt='2024-02-02T00:00:00.000Z')
+    assert replica.refrescar()
+
+    columna = replica.columnas_arboles()['codigoSubparcela']
+    assert columna.codigos.dtype == np.int32 and columna.codigos.min() >= 0
+    assert [columna.categorias[c] for c in columna.codigos[[0, 31999, 32999]]] == ['SP-99999', 'SP-31999', 'SP-32999']
@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+
+from models import AnalisisReporte
+
+INICIO = datetime(2024, 5, 1, 8, 0, 0)
+
+
+def reporte(resultado, minuto, tipo='especies', parametros=None):
+    return {
+        'tipo_reporte': tipo,
+        'titulo': f'Reporte {tipo}',
+        'descripcion': None,
+        'parametros': parametros or {'departamento': 'Antioquia'},
+        'resultado': resultado,
+        'generado_por': 'pruebas',
+        'creado': INICIO + timedelta(minutes=minuto)
+    }
+
+
+def historial():
+    reportes, _ = AnalisisReporte.listar(limit=100)
+    return [(AnalisisReporte.obtener_por_id(r['id'])['resultado'], r['repeticiones']) for r in reportes]
+
+
+def test_repeticion_consecutiva_actualiza_la_ultima_fila(almacen):
+    AnalisisReporte.crear_lote([reporte({'total': 1}, 0)])
+    AnalisisReporte.crear_lote([reporte({'total': 1}, 1), reporte({'total': 1}, 2)])
+
+    assert historial() == [({'total': 1}, 3)]
+
+
+def test_lote_con_dos_resultados_de_la_misma_clave(almacen):
+    AnalisisReporte.crear_lote([reporte({'total': 2}, 0)])
+    # A y luego B en el mismo lote, con B como último guardado: A no es repetición
+    # y B no puede fundirse con la fila vieja porque A queda en medio
+    AnalisisReporte.crear_lote([reporte({'total': 1}, 1), reporte({'total': 2}, 2)])
+
+    assert historial() == [({'total': 2}, 1), ({'total': 1}, 1), ({'total': 2}, 1)]
+
+
+def test_lote_que_empieza_repitiendo_lo_guardado(almacen):
+    AnalisisReporte.crear_lote([reporte({'total': 2}, 0)])
+    AnalisisReporte.crear_lote([
+        reporte({'total': 2}, 1), reporte({'total': 1}, 2), reporte({'total': 1}, 3), reporte({'total': 2}, 4)
+    ])
+
+    assert historial() == [({'total': 2}, 1), ({'total': 1}, 2), ({'total': 2}, 2)]
+
+
+def test_claves_distintas_no_se_mezclan(almacen):
+    AnalisisReporte.crear_lote([
+        reporte({'total': 1}, 0), reporte({'total': 1}, 1, parametros={'departamento': 'Meta'})
+    ])
+
+    assert historial() == [({'total': 1}, 1), ({'total': 1}, 1)]
+
+
+def test_hash_insertado_por_otro_worker_durante_el_merge(almacen, monkeypatch):
+    executemany = almacen.Cursor.executemany
+    colisiones = []
+
+    def con_colision(cursor, sql, filas, *args, **kwargs):
+        filas = list(filas)
+        if 'MERGE INTO' in sql and not colisiones:
+            # Otro worker guarda (y confirma) el mismo resultado entre el ON y el INSERT
+            colisiones.append(filas[0]['hash'])
+            almacen._almacen.resultados[filas[0]['hash']] = filas[0]['res']
+            raise almacen.IntegrityError('ORA-00001: restricción única violada (PK_ANALISIS_RESULTADOS)')
+        return executemany(cursor, sql, filas, *args, **kwargs)
+
+    monkeypatch.setattr(almacen.Cursor, 'executemany', con_colision)
+    AnalisisReporte.crear_lote([reporte({'total': 1}, 0), reporte({'total': 2}, 1, parametros={'departamento': 'Meta'})])
+
+    assert len(colisiones) == 1
+    assert sorted(historial(), key=str) == [({'total': 1}, 1), ({'total': 2}, 1)]
+    assert len(almacen._almacen.resultados) == 2
@@ -0,0 +1,68 @@
+import time
+
+import pytest
+
+from config import Config
+from services.analisis_service import AnalisisService
+from services.cache_service import cache
+
+
+@pytest.fixture
+def cliente(almacen, monkeypatch):
+    """/api/analisis/especies sobre una instantánea de árboles que vence en 10 ms"""
+    from app import app
+
+    monkeypatch.setattr(Config, 'MODO_AGREGACION', 'filas')
+    monkeypatch.setattr(Config, 'REPLICA_HABILITADA', False)
+    monkeypatch.setattr(cache, 'ttl', 0.01)
+    cache.invalidar()
+    datos = {'especies': ['roble', 'cedro']}
+    calculos = []
+
+    def analizar(filtros):
+        especies = cache.obtener('arboles', lambda: {'especies': list(datos['especies'])})['especies']
+        calculos.append(len(especies))
+        return {'total_arboles': len(especies), 'especies_unicas': len(set(especies))}
+
+    monkeypatch.setattr(AnalisisService, 'analizar_distribucion_especies', staticmethod(analizar))
+    cliente = app.test_client()
+    cliente.datos, cliente.calculos = datos, calculos
+    yield cliente
+    cache.invalidar()
+
+
+def test_sondeo_despues_del_ttl_sin_cambios_recibe_304(cliente):
+    primera = cliente.get('/api/analisis/especies')
+    assert primera.status_code == 200
+    etag = primera.headers['ETag']
+
+    time.sleep(0.02)
+    # La instantánea venció: se recarga, pero los datos son los mismos
+    segunda = cliente.get('/api/analisis/especies', headers={'If-None-Match': etag})
+    assert segunda.status_code == 304
+    assert segunda.headers['ETag'] == etag
+
+    time.sleep(0.02)
+    tercera = cliente.get('/api/analisis/especies')
+    assert tercera.headers['ETag'] == etag
+    # Se sigue sirviendo la representación guardada (con su calculado_en)
+    assert tercera.get_json()['calculado_en'] == primera.get_json()['calculado_en']
+
+
+def test_datos_nuevos_cambian_el_etag(cliente):
+    etag = cliente.get('/api/analisis/especies').headers['ETag']
+
+    time.sleep(0.02)
+    cliente.datos['especies'].append('ceiba')
+    respuesta = cliente.get('/api/analisis/especies', headers={'If-None-Match': etag})
+    assert respuesta.status_code == 200
+    assert respuesta.headers['ETag'] != etag
+    assert respuesta.get_json()['data']['total_arboles'] == 3
+
+
+def test_etag_sale_de_la_consulta_y_la_version(cliente):
+    sin_filtro = cliente.get('/api/analisis/especies')
+    con_fresh = cliente.get('/api/analisis/especies?fresh=1')
+    # Mismo cuerpo de datos, otra consulta: otro ETag
+    assert sin_filtro.get_json()['data'] == con_fresh.get_json()['data']
+    assert sin_filtro.headers['ETag'] != con_fresh.headers['ETag']
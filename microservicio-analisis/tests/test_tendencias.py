@@ -0,0 +1,74 @@
+from datetime import datetime
+
+import pytest
+
+from models import InstantaneaInventario
+
+HOY = datetime.now().replace(day=1, hour=12, minute=0, second=0, microsecond=0)
+MES_ANTERIOR = HOY.replace(year=HOY.year - 1, month=12) if HOY.month == 1 else HOY.replace(month=HOY.month - 1)
+
+
+def resultados(arboles, dap, especies):
+    return {
+        'distribucion_especies': {
+            'total_arboles': arboles,
+            'especies_unicas': len(especies),
+            'distribucion_completa': especies
+        },
+        'dap_altura': {
+            'dap': {'promedio': dap, 'mediana': dap, 'minimo': dap - 10, 'maximo': dap + 10,
+                    'desviacion_std': float('nan')},
+            'altura': {},
+            'clasificacion_dap': {'pequeño (<15cm)': arboles // 2, 'mediano (15-30cm)': arboles - arboles // 2}
+        },
+        'analisis_muestras': {'total_muestras': 4},
+        'resumen_general': {'conglomerados': {'total': 2}}
+    }
+
+
+@pytest.fixture
+def instantaneas(almacen):
+    InstantaneaInventario.guardar(resultados(10, 20.0, {'roble': 6, 'cedro': 4}), MES_ANTERIOR)
+    InstantaneaInventario.guardar(resultados(12, 22.0, {'roble': 7, 'cedro': 5}), HOY)
+    InstantaneaInventario.guardar(resultados(15, 24.0, {'roble': 9, 'ceiba': 6}), HOY.replace(hour=18))
+
+
+@pytest.fixture
+def cliente(almacen):
+    from app import app
+    return app.test_client()
+
+
+def test_instantanea_repetida(instantaneas):
+    assert not InstantaneaInventario.guardar(resultados(1, 1.0, {}), HOY)
+
+
+def test_resumen_por_mes(cliente, instantaneas):
+    respuesta = cliente.get('/api/tendencias/resumen', query_string={'meses': 3})
+    assert respuesta.status_code == 200
+    anterior, actual = respuesta.json['serie']
+    assert anterior['instantaneas'] == 1 and anterior['variacion_arboles'] is None
+    assert actual['periodo'] == HOY.strftime('%Y-%m-01')
+    assert actual['instantaneas'] == 2
+    assert actual['total_arboles'] == 15 and actual['variacion_arboles'] == 5
+    assert actual['dap_promedio_periodo'] == pytest.approx(23.0)
+    assert (actual['dap_minimo'], actual['dap_maximo']) == (12.0, 34.0)
+    assert actual['deriva_dap'] == pytest.approx(4.0)
+    assert actual['altura_promedio'] is None
+
+
+def test_especies_con_filtro(cliente, instantaneas):
+    respuesta = cliente.get('/api/tendencias/especies', query_string={'meses': 3, 'especie': 'roble,ceiba'})
+    assert respuesta.status_code == 200
+    anterior, actual = respuesta.json['serie']
+    assert anterior['especies'] == {'roble': 6}
+    assert actual['especies'] == {'roble': 9, 'ceiba': 6}
+    assert actual['variacion'] == {'roble': 3}
+
+
+def test_clases_dap(cliente, instantaneas):
+    respuesta = cliente.get('/api/tendencias/clases-dap', query_string={'meses': 1})
+    assert respuesta.status_code == 200
+    assert [periodo['clases'] for periodo in respuesta.json['serie']] == [
+        {'pequeño (<15cm)': 7, 'mediano (15-30cm)': 8}
+    ]
@@ -0,0 +1,4 @@
+"""Punto de entrada WSGI de producción: gunicorn -c gunicorn.conf.py wsgi:app"""
+from app import app
+
+application = app
@@ -9,7 +9,7 @@ timeout /t 3 /nobreak > nul
 
 REM 2. Microservicio de Analisis
 echo [2/4] Iniciando Microservicio de Analisis...
-start "Microservicio Analisis" cmd /k "cd microservicio-analisis && venv\Scripts\activate && python app.py"
+start "Microservicio Analisis" cmd /k "cd microservicio-analisis && venv\Scripts\activate && python manage.py migrar & python app.py"
 timeout /t 3 /nobreak > nul
 
 REM 3. Microservicio de Zonas